@@ -0,0 +1,529 @@
+#!/usr/bin/env python3
+"""
+import_reviews.pyの各処理を合成データで計測するベンチマーク。
+
+Hugging Faceのデータセットと同じ形（id, text, label, label_text）のJSONLを指定件数だけ生成し、
+読み込み・抽出・マッチング・文書構築・書き込みの各段階を個別に計測してJSONに保存する。
+書き込みは--mongodb-uriを指定するとそのMongoDBに、指定しなければプロセス内の代替実装に対して行う。
+"""
+
+from __future__ import annotations
+
+import argparse
+import copy
+import json
+import math
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Dict, List
+
+try:
+    import numpy as np  # type: ignore
+except ImportError:  # pragma: no cover - optional dependency
+    np = None
+
+from bson import ObjectId
+from pymongo import DeleteMany, InsertOne, MongoClient, ReplaceOne, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from review_import import catalog
+from review_import.cache import ReviewCache
+from review_import.catalog import match_review_to_product
+from review_import.dataset import COMPRESSION_SUFFIXES, available_compressions, compress_file
+from review_import.decoders import ReviewRecord, get_decoder, iter_dataset, iter_records
+from review_import.documents import (
+    ReviewDocument,
+    build_product_document,
+    build_review_documents,
+    generate_review_metadata,
+)
+from review_import.mongo import DUPLICATE_KEY_ERROR, mongo_client_options
+from review_import.selection import collect_records
+from review_import.writer import BulkWriter, insert_reviews
+
+sys.stdout.reconfigure(encoding="utf-8", errors="ignore")
+
+SPLIT_RATIOS = {"train": 1.0, "validation": 0.02, "test": 0.02}
+
+PRODUCT_WORDS = [keyword for product in catalog.PRODUCT_CONFIGS for keyword in product["keywords"]]
+GENERIC_WORDS = [
+    "商品", "値段", "品質", "デザイン", "使い心地", "梱包", "配送", "サイズ", "色", "説明書",
+    "バッテリー", "充電", "画面", "ボタン", "音", "素材", "重さ", "耐久性", "付属品", "サポート",
+]
+OPINIONS = [
+    "とても満足しています", "期待していたほどではありませんでした", "値段の割には良いと思います",
+    "すぐに壊れてしまいました", "また購入したいです", "思っていたより小さかったです",
+    "使いやすくて気に入っています", "届くまでに時間がかかりました", "友人にもすすめました",
+    "説明と違う点がありました", "コスパは最高です", "二度と買いません",
+]
+CONNECTIVES = ["", "ただ、", "しかし", "また、", "正直", "全体的に", "個人的には", "結局"]
+ENDINGS = ["。", "。", "。", "！", "？", "\n", "!"]
+
+
+def synthetic_text(rng: random.Random) -> str:
+    """日本語レビューに近い長さ（中央値80文字前後、長い裾あり）の本文を作る"""
+    target = int(min(2000, max(5, rng.lognormvariate(math.log(80), 0.8))))
+    parts: List[str] = []
+    length = 0
+    while length < target:
+        word = rng.choice(PRODUCT_WORDS) if rng.random() < 0.15 else rng.choice(GENERIC_WORDS)
+        sentence = f"{rng.choice(CONNECTIVES)}{word}は{rng.choice(OPINIONS)}{rng.choice(ENDINGS)}"
+        parts.append(sentence)
+        length += len(sentence)
+    return "".join(parts)
+
+
+def generate_corpus(directory: Path, lines: int, seed: int) -> Dict[str, Path]:
+    """train/validation/testの合成JSONLを作る（同じ件数・シードで作成済みなら再利用する）"""
+    paths = {split: directory / f"amazon_reviews_{split}.jsonl" for split in SPLIT_RATIOS}
+    meta_path = directory / "corpus.json"
+    meta = {"lines": lines, "seed": seed}
+    if meta_path.exists() and json.loads(meta_path.read_text(encoding="utf-8")) == meta:
+        if all(path.exists() for path in paths.values()):
+            return paths
+
+    directory.mkdir(parents=True, exist_ok=True)
+    rng = random.Random(seed)
+    for split, ratio in SPLIT_RATIOS.items():
+        count = max(1, int(lines * ratio))
+        with paths[split].open("w", encoding="utf-8") as f:
+            for index in range(count):
+                label = rng.randint(0, 4)
+                record = {
+                    "id": f"{split}_{index:07d}",
+                    "text": synthetic_text(rng),
+                    "label": label,
+                    "label_text": str(label),
+                }
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    meta_path.write_text(json.dumps(meta), encoding="utf-8")
+    return paths
+
+
+class InMemoryCollection:
+    """bulk_writeの操作数を数えるMongoDBコレクションの代替実装
+
+    keep_documents=Trueにすると操作を文書にも適用し、テストから書き込んだ結果を確かめられる。
+    条件は等価と$inだけ、更新は$set・$setOnInsert・$unsetだけに対応し、重複を検出するのは_idだけ。
+    """
+
+    def __init__(self, latency: float = 0.0, keep_documents: bool = False) -> None:
+        self.latency = latency
+        self.keep_documents = keep_documents
+        self.operations = 0
+        self.documents: Dict[object, Dict[str, object]] = {}
+        self.indexes: Dict[str, Dict[str, object]] = {}
+        self._lock = threading.Lock()
+
+    def bulk_write(self, operations, ordered: bool = True):
+        if self.latency:
+            time.sleep(self.latency)
+        operations = list(operations)
+        with self._lock:
+            self.operations += len(operations)
+            if not self.keep_documents:
+                return None
+            errors = []
+            for index, operation in enumerate(operations):
+                if not self._apply(operation):
+                    errors.append({"index": index, "code": DUPLICATE_KEY_ERROR, "errmsg": "duplicate key _id"})
+                    if ordered:
+                        break
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, "writeConcernErrors": []})
+        return None
+
+    def _apply(self, operation) -> bool:
+        """操作を1件適用する。_idが重複して挿入できなければFalse"""
+        if isinstance(operation, InsertOne):
+            document = operation._doc
+            # PyMongoと同じく、_idがなければ渡された文書に書き込む
+            document.setdefault("_id", ObjectId())
+            if document["_id"] in self.documents:
+                return False
+            self.documents[document["_id"]] = copy.deepcopy(document)
+        elif isinstance(operation, DeleteMany):
+            for document_id in [key for key, document in self.documents.items() if _matches(document, operation._filter)]:
+                del self.documents[document_id]
+        elif isinstance(operation, (UpdateOne, ReplaceOne)):
+            current = next((document for document in self.documents.values() if _matches(document, operation._filter)), None)
+            replace = isinstance(operation, ReplaceOne)
+            if current is None:
+                if not operation._upsert:
+                    return True
+                current = {key: value for key, value in operation._filter.items() if not isinstance(value, dict)}
+                current["_id"] = ObjectId()
+                self.documents[current["_id"]] = current
+                if not replace:
+                    current.update(copy.deepcopy(operation._doc.get("$setOnInsert", {})))
+            if replace:
+                document_id = current["_id"]
+                current.clear()
+                current.update(copy.deepcopy(operation._doc))
+                current["_id"] = document_id
+            else:
+                current.update(copy.deepcopy(operation._doc.get("$set", {})))
+                for key in operation._doc.get("$unset", {}):
+                    current.pop(key, None)
+        else:
+            raise TypeError(f"未対応の操作です: {type(operation).__name__}")
+        return True
+
+    def insert_many(self, documents, ordered: bool = True):
+        return self.bulk_write([InsertOne(document) for document in documents], ordered=ordered)
+
+    def delete_many(self, query: Dict[str, object]):
+        return self.bulk_write([DeleteMany(query)])
+
+    def find(self, query: Dict[str, object] | None = None, projection: Dict[str, int] | None = None):
+        with self._lock:
+            matched = [copy.deepcopy(document) for document in self.documents.values() if _matches(document, query or {})]
+        if projection is None:
+            return matched
+        return [
+            {key: value for key, value in document.items() if key == "_id" or projection.get(key)}
+            for document in matched
+        ]
+
+    def index_information(self) -> Dict[str, Dict[str, object]]:
+        return {"_id_": {"key": [("_id", 1)]}, **copy.deepcopy(self.indexes)}
+
+    def create_indexes(self, models) -> List[str]:
+        for model in models:
+            options = dict(model.document)
+            keys = options.pop("key")
+            name = options.pop("name")
+            self.indexes[name] = {"key": list(keys.items()) if hasattr(keys, "items") else list(keys), **options}
+        return [model.document["name"] for model in models]
+
+    def drop_index(self, name: str) -> None:
+        self.indexes.pop(name, None)
+
+
+def _matches(document: Dict[str, object], query: Dict[str, object]) -> bool:
+    for key, condition in query.items():
+        if isinstance(condition, dict) and "$in" in condition:
+            if document.get(key) not in condition["$in"]:
+                return False
+        elif document.get(key) != condition:
+            return False
+    return True
+
+
+class InMemoryDatabase(dict):
+    def __init__(self, latency: float = 0.0, keep_documents: bool = False) -> None:
+        super().__init__()
+        self.latency = latency
+        self.keep_documents = keep_documents
+
+    def __missing__(self, name: str) -> InMemoryCollection:
+        collection = InMemoryCollection(self.latency, self.keep_documents)
+        self[name] = collection
+        return collection
+
+
+def compress_corpus(paths: Dict[str, Path], directory: Path, compression: str) -> Dict[str, Path]:
+    """合成コーパスを指定の形式で圧縮したコピーを作る"""
+    directory.mkdir(parents=True, exist_ok=True)
+    suffix = COMPRESSION_SUFFIXES[compression]
+    compressed = {split: directory / (path.name + suffix) for split, path in paths.items()}
+    for split, path in paths.items():
+        if not compressed[split].exists():
+            compress_file(path, compressed[split], compression)
+    return compressed
+
+
+def measure(
+    name: str,
+    items: int,
+    func: Callable[[], object],
+    repeat: int = 1,
+    trace_memory: bool = False
+) -> Dict[str, object]:
+    """repeat回実行して最短時間を採用する
+
+    trace_memoryを指定すると、さらに1回tracemallocを有効にして実行し、
+    実行中の最大確保量と、実行後も結果として残っているメモリブロック数・バイト数を記録する。
+    """
+    best = float("inf")
+    for _ in range(max(1, repeat)):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    result: Dict[str, object] = {
+        "benchmark": name,
+        "items": items,
+        "seconds": round(best, 6),
+        "items_per_second": round(items / best, 1) if best > 0 else None,
+    }
+    if trace_memory:
+        tracemalloc.start()
+        try:
+            retained = func()
+            snapshot = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        statistics = snapshot.statistics("filename")
+        result["peak_bytes"] = peak
+        result["retained_bytes"] = sum(stat.size for stat in statistics)
+        result["retained_blocks"] = sum(stat.count for stat in statistics)
+        del retained
+    return result
+
+
+def load_sample(paths: Dict[str, Path], limit: int) -> List[ReviewRecord]:
+    sample = []
+    for record in iter_records(paths):
+        sample.append(record)
+        if len(sample) >= limit:
+            break
+    return sample
+
+
+def run_size(args: argparse.Namespace, lines: int, db) -> List[Dict[str, object]]:
+    corpus_dir = args.work_dir / f"synthetic_{lines}"
+    print(f"\n📦 {lines:,}件の合成コーパスを準備しています: {corpus_dir}")
+    paths = generate_corpus(corpus_dir, lines, args.seed)
+    total = sum(1 for _ in iter_dataset(paths))
+    results: List[Dict[str, object]] = []
+
+    def record(result: Dict[str, object]) -> None:
+        result["size"] = lines
+        results.append(result)
+        rate = f"{result['items_per_second']:,.0f}/s" if result["items_per_second"] else "-"
+        memory = ""
+        if "peak_bytes" in result:
+            memory = (
+                f", 最大{result['peak_bytes'] / (1024 * 1024):.1f} MB, "
+                f"保持{result['retained_bytes'] / (1024 * 1024):.1f} MB / {result['retained_blocks']:,}ブロック"
+            )
+        print(f"  - {result['benchmark']}: {result['seconds']:.3f}秒 ({result['items']:,}件, {rate}{memory})")
+
+    record(measure("iter_dataset", total, lambda: sum(1 for _ in iter_dataset(paths)), args.repeat))
+    raw_bytes = sum(path.stat().st_size for path in paths.values())
+    for compression in available_compressions()[1:]:
+        compressed = compress_corpus(paths, corpus_dir / compression, compression)
+        compressed_bytes = sum(path.stat().st_size for path in compressed.values())
+        print(f"  - {compression}: {raw_bytes / (1024 * 1024):.1f} MB → {compressed_bytes / (1024 * 1024):.1f} MB")
+        for threaded in (True, False):
+            name = f"iter_dataset_{compression}" + ("" if threaded else "_inline")
+            result = measure(
+                name,
+                total,
+                lambda: sum(1 for _ in iter_dataset(compressed, threaded=threaded)),
+                args.repeat,
+            )
+            result["file_bytes"] = compressed_bytes
+            record(result)
+    record(measure(
+        "collect_records",
+        total,
+        lambda: collect_records(paths, args.per_sentiment, seed=args.seed),
+        args.repeat,
+        args.trace_memory,
+    ))
+
+    cache_dir = corpus_dir / "cache"
+    record(measure("cache_build", total, lambda: ReviewCache.build(cache_dir, paths).close()))
+    cache = ReviewCache.open(cache_dir, paths)
+    try:
+        record(measure(
+            "collect_records_cached",
+            total,
+            lambda: collect_records(paths, args.per_sentiment, seed=args.seed, cache=cache),
+            args.repeat,
+            args.trace_memory,
+        ))
+    finally:
+        cache.close()
+
+    sample = load_sample(paths, args.sample_size)
+    record(measure(
+        "match_review_to_product",
+        len(sample),
+        lambda: [match_review_to_product(item) for item in sample],
+        args.repeat,
+    ))
+
+    products = catalog.PRODUCT_CONFIGS
+    now = datetime.now(timezone.utc)
+    tasks = [
+        (item, products[index % len(products)], index + 1, "positive" if item.label >= 3 else "negative")
+        for index, item in enumerate(sample)
+    ]
+    documents: List[ReviewDocument] = []
+
+    def build_documents() -> List[ReviewDocument]:
+        documents[:] = build_review_documents(tasks, seed=args.seed, now=now)
+        return documents
+
+    record(measure("build_review_document", len(tasks), build_documents, args.repeat, args.trace_memory))
+    if np is not None:
+        labels = np.fromiter((item.label for item in sample), dtype=np.int64, count=len(sample))
+        positive = labels >= 3
+        record(measure(
+            "generate_review_metadata",
+            len(sample),
+            lambda: generate_review_metadata(labels, positive, np.random.default_rng(args.seed), now),
+            args.repeat,
+        ))
+        record(measure(
+            "build_review_document_numpy",
+            len(tasks),
+            lambda: build_review_documents(tasks, seed=args.seed, now=now, generator="numpy"),
+            args.repeat,
+            args.trace_memory,
+        ))
+
+    group_size = args.per_sentiment * 2
+    groups = [documents[start:start + group_size] for start in range(0, len(documents), group_size)]
+    groups = [group for group in groups if group]
+    record(measure(
+        "build_product_document",
+        len(groups),
+        lambda: [build_product_document(products[index % len(products)], group) for index, group in enumerate(groups)],
+        args.repeat,
+    ))
+
+    product_reviews = {product["id"]: [] for product in products}
+    for document in documents:
+        product_reviews[document.product_id].append(document)
+    writer = BulkWriter(db, batch_size=args.batch_size, workers=args.writers)
+    record(measure(
+        "write_reviews",
+        len(documents),
+        lambda: insert_reviews(db, product_reviews, keep_existing=False, writer=writer),
+    ))
+    return results
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=Path(__file__).resolve().parent,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current: List[Dict[str, object]], baseline_path: Path) -> None:
+    baseline = json.loads(baseline_path.read_text(encoding="utf-8"))
+    previous = {(item["size"], item["benchmark"]): item for item in baseline["results"]}
+    print(f"\n📊 {baseline_path}（{baseline['meta'].get('revision')}）との比較:")
+    for item in current:
+        before = previous.get((item["size"], item["benchmark"]))
+        if before is None or not before["seconds"]:
+            continue
+        ratio = item["seconds"] / before["seconds"]
+        marker = "⚠️ " if ratio > 1.1 else ""
+        print(f"  - {marker}{item['size']:,} {item['benchmark']}: {before['seconds']:.3f}秒 → {item['seconds']:.3f}秒 (x{ratio:.2f})")
+        if item.get("peak_bytes") and before.get("peak_bytes"):
+            print(
+                f"    最大確保量 {before['peak_bytes'] / (1024 * 1024):.1f} MB → {item['peak_bytes'] / (1024 * 1024):.1f} MB, "
+                f"保持ブロック {before['retained_blocks']:,} → {item['retained_blocks']:,}"
+            )
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="import_reviews.pyの性能を合成データで計測します。")
+    parser.add_argument("--sizes", default="10000", help="コーパスの件数（カンマ区切り、例: 10000,100000,5000000）")
+    parser.add_argument("--work-dir", type=Path, default=Path("data/benchmark"), help="合成コーパスの保存先")
+    parser.add_argument("--output", type=Path, default=None, help="結果のJSONを保存するパス")
+    parser.add_argument("--compare", type=Path, default=None, help="比較対象の過去の結果JSON")
+    parser.add_argument("--seed", type=int, default=42, help="合成データと抽出の乱数シード")
+    parser.add_argument("--per-sentiment", type=int, default=30, help="collect_recordsに渡す件数")
+    parser.add_argument("--sample-size", type=int, default=50000, help="マッチング・文書構築を計測する件数の上限")
+    parser.add_argument("--repeat", type=int, default=1, help="各計測の繰り返し回数（最短時間を採用）")
+    parser.add_argument("--batch-size", type=int, default=1000, help="書き込みのバッチサイズ")
+    parser.add_argument("--writers", type=int, default=4, help="書き込みスレッド数")
+    parser.add_argument("--write-latency", type=float, default=0.0, help="代替実装で1バッチごとに待つ秒数（リモート接続の模擬）")
+    parser.add_argument("--mongodb-uri", default=None, help="書き込みを計測するMongoDBのURI（未指定時はプロセス内の代替実装）")
+    parser.add_argument(
+        "--mongodb-db",
+        default="review-system-benchmark",
+        help="書き込みに使うデータベース名（名前にbenchmarkを含むもの。計測で作ったコレクションは計測後に削除します）",
+    )
+    parser.add_argument(
+        "--i-know-this-drops",
+        action="store_true",
+        help="名前にbenchmarkを含まないデータベースへの書き込みを許可します（既存のレビューが置き換えられます）",
+    )
+    parser.add_argument(
+        "--trace-memory",
+        action="store_true",
+        help="抽出と文書構築をtracemalloc付きでもう1回実行し、最大確保量と保持ブロック数を記録します",
+    )
+    parser.add_argument("--keep-corpus", action="store_true", help="生成した合成コーパスを削除せずに残します")
+    args = parser.parse_args()
+    if args.mongodb_uri and "benchmark" not in args.mongodb_db and not args.i_know_this_drops:
+        # 書き込みの計測では対象商品の既存レビューを削除して入れ直すため、運用中のデータベースを守る
+        raise SystemExit(
+            f"--mongodb-db {args.mongodb_db}は名前にbenchmarkを含みません。"
+            "計測用のデータベースを指定するか、--i-know-this-dropsを付けてください。"
+        )
+    return args
+
+
+def main() -> None:
+    args = parse_args()
+    sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+
+    client = None
+    existing_collections = set()
+    if args.mongodb_uri:
+        client = MongoClient(args.mongodb_uri, **mongo_client_options(args.mongodb_uri))
+        db = client[args.mongodb_db]
+        existing_collections = set(db.list_collection_names())
+    else:
+        db = InMemoryDatabase(args.write_latency)
+
+    results: List[Dict[str, object]] = []
+    try:
+        for lines in sizes:
+            results.extend(run_size(args, lines, db))
+    finally:
+        if client is not None:
+            # データベースごとではなく、計測で新しくできたコレクションだけを削除する
+            for name in sorted(set(db.list_collection_names()) - existing_collections):
+                db.drop_collection(name)
+                print(f"🧹 計測で作成したコレクションを削除しました: {args.mongodb_db}.{name}")
+            client.close()
+        if not args.keep_corpus:
+            for lines in sizes:
+                shutil.rmtree(args.work_dir / f"synthetic_{lines}", ignore_errors=True)
+
+    payload = {
+        "meta": {
+            "revision": git_revision(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "json_decoder": get_decoder().name,
+            "numpy": np is not None,
+            "write_target": "mongodb" if args.mongodb_uri else "in-memory",
+        },
+        "results": results,
+    }
+    if args.output is not None:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"\n💾 結果を保存しました: {args.output}")
+    if args.compare is not None:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,419 @@
+#!/usr/bin/env python3
+"""
+ダウンロード済みのレビューデータセット（data/amazon_reviews/）を索引経由で調べるCLI。
+
+初回に行オフセット索引（<ファイル>.idx）とimport_reviews.pyと共通の前処理キャッシュを作り、
+以降はmmapで必要なレコードだけを読むため、N件目へのジャンプ・シード付きサンプリング・
+ラベル/感情/商品キーワードでの絞り込みはファイル全体を読まずに数ミリ秒で返る。
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+
+try:
+    import numpy as np  # type: ignore
+except ImportError:  # pragma: no cover - optional dependency
+    np = None
+
+from review_import.cache import ReviewCache, default_cache_dir
+from review_import.catalog import get_keyword_matcher, use_product_catalog
+from review_import.dataset import DATASET_URLS, detect_compression, find_dataset_paths, iter_lines
+from review_import.decoders import LineIndex, benchmark_decoders, get_decoder
+from review_import.phrases import PHRASE_GROUPS, mine_phrases
+from review_import.text import split_into_sentences
+
+sys.stdout.reconfigure(encoding="utf-8", errors="ignore")
+
+SENTIMENT_LABELS = {"positive": (3, 4), "negative": (0, 1), "neutral": (2,)}
+PERCENTILES = (50, 90, 95, 99)
+
+
+def print_record(number: int, record: Dict[str, object], matched: str | None = None) -> None:
+    print(f"--- record {number} ---")
+    for key, value in record.items():
+        if isinstance(value, str):
+            snippet = value[:120].replace("\n", "\\n")
+            suffix = "…" if len(value) > 120 else ""
+            print(f"{key}: {snippet}{suffix}")
+        else:
+            print(f"{key}: {value}")
+    if matched is not None:
+        print(f"matched: {matched}")
+
+
+def dataset_paths(data_dir: Path) -> Dict[str, Path]:
+    # 非圧縮・gzip・zstdのうち存在するファイル
+    return find_dataset_paths(data_dir)
+
+
+def open_index(path: Path) -> LineIndex:
+    if not path.exists():
+        raise SystemExit(f"{path} が見つかりません。先にimport_reviews.pyでデータをダウンロードしてください。")
+    index = LineIndex.open(path)
+    if index is None:
+        started = time.perf_counter()
+        index = LineIndex.build(path)
+        print(f"🗂️  行オフセット索引を作成しました: {index.index_path} ({len(index):,}件, {time.perf_counter() - started:.2f}秒)")
+    return index
+
+
+def open_cache(args: argparse.Namespace) -> ReviewCache:
+    paths = dataset_paths(args.data_dir)
+    missing = [str(path) for path in paths.values() if not path.exists()]
+    if missing:
+        raise SystemExit(f"{', '.join(missing)} が見つかりません。先にimport_reviews.pyでデータをダウンロードしてください。")
+    cache_dir = args.cache_dir or default_cache_dir(args.data_dir)
+    started = time.perf_counter()
+    cache, rebuilt = ReviewCache.open_or_build(cache_dir, paths, get_decoder(args.json_decoder))
+    if rebuilt:
+        print(f"🗃️  前処理キャッシュを作成しました: {cache_dir} ({len(cache):,}件, {time.perf_counter() - started:.2f}秒)")
+    return cache
+
+
+def split_range(cache: ReviewCache, split: str) -> Tuple[int, int]:
+    """キャッシュ内で指定した分割が占める範囲（分割は連続して並んでいる）"""
+    if split not in cache.splits:
+        raise SystemExit(f"分割 {split} はありません（{', '.join(cache.splits)}）。")
+    code = cache.splits.index(split)
+    splits = cache.column("splits")
+    return bisect_left(splits, code), bisect_right(splits, code)
+
+
+def matching_indices(cache: ReviewCache, args: argparse.Namespace) -> List[int]:
+    """--label/--sentiment/--productの条件をすべて満たすレコードのキャッシュ内の番号"""
+    start, end = split_range(cache, args.split)
+    labels = cache.column("labels")
+    matched = cache.column("matched")
+    allowed_labels = set(args.label or range(5))
+    if args.sentiment:
+        allowed_labels &= set(SENTIMENT_LABELS[args.sentiment])
+    product_code = None
+    if args.product is not None:
+        if args.product == "none":
+            product_code = -1
+        elif args.product in cache.product_ids:
+            product_code = cache.product_ids.index(args.product)
+        else:
+            raise SystemExit(f"商品 {args.product} はありません（{', '.join(cache.product_ids)}, none）。")
+
+    if np is not None:
+        label_column = np.frombuffer(labels, dtype=np.int8)[start:end]
+        mask = np.isin(label_column, list(allowed_labels))
+        if product_code is not None:
+            mask &= np.frombuffer(matched, dtype=np.int32)[start:end] == product_code
+        return (np.flatnonzero(mask) + start).tolist()
+    return [
+        index for index in range(start, end)
+        if labels[index] in allowed_labels and (product_code is None or matched[index] == product_code)
+    ]
+
+
+def read_records(args: argparse.Namespace, numbers: List[int]) -> Dict[int, Dict[str, object]]:
+    """分割内の番号（0始まり）のレコードを読む
+
+    非圧縮のファイルは行オフセット索引で直接読み、圧縮ファイルは先頭から1回だけ走査する。
+    """
+    path = dataset_paths(args.data_dir)[args.split]
+    decoder = get_decoder(args.json_decoder, fields=None)
+    if detect_compression(path) is None:
+        index = open_index(path)
+        try:
+            for number in numbers:
+                if not 0 <= number < len(index):
+                    raise SystemExit(f"レコード番号は1〜{len(index)}の範囲で指定してください。")
+            return {number: index.record(number, decoder) for number in numbers}
+        finally:
+            index.close()
+
+    if not path.exists():
+        raise SystemExit(f"{path} が見つかりません。先にimport_reviews.pyでデータをダウンロードしてください。")
+    wanted = set(numbers)
+    records: Dict[int, Dict[str, object]] = {}
+    number = 0
+    for line in iter_lines(path):
+        line = line.strip()
+        if not line:
+            continue
+        if number in wanted:
+            records[number] = decoder.decode(line)
+            if len(records) == len(wanted):
+                break
+        number += 1
+    if len(records) < len(wanted):
+        raise SystemExit(f"レコード番号は1〜{number}の範囲で指定してください。")
+    return records
+
+
+def show_records(args: argparse.Namespace, numbers: List[int]) -> None:
+    """分割内の番号（1始まり）のレコードを表示する"""
+    records = read_records(args, [number - 1 for number in numbers])
+    for number in numbers:
+        print_record(number, records[number - 1])
+
+
+def show_cached(args: argparse.Namespace, cache: ReviewCache, indices: List[int]) -> None:
+    start, _ = split_range(cache, args.split)
+    records = read_records(args, [cache_index - start for cache_index in indices])
+    for cache_index in indices:
+        number = cache_index - start
+        print_record(number + 1, records[number], cache.matched_product(cache_index) or "-")
+
+
+def has_filters(args: argparse.Namespace) -> bool:
+    return bool(args.label or args.sentiment or args.product is not None)
+
+
+def command_show(args: argparse.Namespace) -> None:
+    show_records(args, args.numbers)
+
+
+def command_sample(args: argparse.Namespace) -> None:
+    compressed = detect_compression(dataset_paths(args.data_dir)[args.split]) is not None
+    if not has_filters(args) and not compressed:
+        index = open_index(dataset_paths(args.data_dir)[args.split])
+        try:
+            numbers = [number + 1 for number in index.sample(args.count, args.seed)]
+        finally:
+            index.close()
+        show_records(args, numbers)
+        return
+
+    cache = open_cache(args)
+    try:
+        started = time.perf_counter()
+        indices = matching_indices(cache, args)
+        picked = sorted(random.Random(args.seed).sample(indices, min(args.count, len(indices))))
+        print(f"🔎 条件に一致: {len(indices):,}件（{(time.perf_counter() - started) * 1000:.1f}ms）")
+        show_cached(args, cache, picked)
+    finally:
+        cache.close()
+
+
+def command_filter(args: argparse.Namespace) -> None:
+    cache = open_cache(args)
+    try:
+        started = time.perf_counter()
+        indices = matching_indices(cache, args)
+        print(f"🔎 条件に一致: {len(indices):,}件（{(time.perf_counter() - started) * 1000:.1f}ms）")
+        if not args.count_only:
+            show_cached(args, cache, indices[args.offset:args.offset + args.limit])
+    finally:
+        cache.close()
+
+
+def percentiles(values: List[int]) -> Dict[str, int]:
+    if not values:
+        return {}
+    ordered = sorted(values)
+    result = {f"p{p}": ordered[min(len(ordered) - 1, len(ordered) * p // 100)] for p in PERCENTILES}
+    result["max"] = ordered[-1]
+    return result
+
+
+def collect_stats(cache: ReviewCache, indices: Iterable[int]) -> Dict[str, object]:
+    """本文を1件ずつmmapから読み、ラベル分布・文字数・文数を集計する"""
+    labels = cache.column("labels")
+    matched = cache.column("matched")
+    label_counts: Dict[int, int] = {}
+    product_counts: Dict[str, int] = {}
+    lengths: List[int] = []
+    sentences: List[int] = []
+    for index in indices:
+        label = labels[index]
+        label_counts[label] = label_counts.get(label, 0) + 1
+        product = cache.product_ids[matched[index]] if matched[index] >= 0 else "none"
+        product_counts[product] = product_counts.get(product, 0) + 1
+        text = cache.text(index)
+        lengths.append(len(text))
+        sentences.append(len(split_into_sentences(text)))
+    return {
+        "records": len(lengths),
+        "labels": {str(label): label_counts[label] for label in sorted(label_counts)},
+        "products": product_counts,
+        "text_length": percentiles(lengths),
+        "sentences": percentiles(sentences),
+        "mean_text_length": round(sum(lengths) / len(lengths), 1) if lengths else 0,
+        "mean_sentences": round(sum(sentences) / len(sentences), 2) if sentences else 0,
+    }
+
+
+def command_stats(args: argparse.Namespace) -> None:
+    cache = open_cache(args)
+    try:
+        started = time.perf_counter()
+        indices = matching_indices(cache, args) if has_filters(args) else range(*split_range(cache, args.split))
+        stats = collect_stats(cache, indices)
+        elapsed = time.perf_counter() - started
+    finally:
+        cache.close()
+
+    if args.json:
+        print(json.dumps(stats, ensure_ascii=False, indent=2))
+        return
+    print(f"📊 {args.split}: {stats['records']:,}件（{elapsed:.2f}秒）")
+    total = max(1, stats["records"])
+    print("  ラベル分布:")
+    for label, count in stats["labels"].items():
+        bar = "█" * round(count / total * 40)
+        print(f"    {label}: {count:>8,} ({count / total:6.1%}) {bar}")
+    print("  キーワードでマッチした商品:")
+    for product, count in stats["products"].items():
+        print(f"    {product}: {count:,}")
+    for key, label in (("text_length", "本文の文字数"), ("sentences", "1件あたりの文数")):
+        mean = stats["mean_text_length"] if key == "text_length" else stats["mean_sentences"]
+        values = ", ".join(f"{name} {value}" for name, value in stats[key].items())
+        print(f"  {label}: 平均 {mean}, {values}")
+
+
+def command_phrases(args: argparse.Namespace) -> None:
+    """商品名・キーワード候補をコーパス全体から数える（PRODUCT_CONFIGSのキーワード検討用）"""
+    paths = dataset_paths(args.data_dir)
+    splits = args.splits.split(",") if args.splits else [args.split]
+    unknown = [split for split in splits if split not in paths]
+    if unknown:
+        raise SystemExit(f"分割 {', '.join(unknown)} はありません（{', '.join(paths)}）。")
+    started = time.perf_counter()
+    counts = mine_phrases(
+        {split: paths[split] for split in splits},
+        group_by=args.group_by,
+        contains=args.contains,
+        workers=args.workers,
+        decoder_name=args.json_decoder,
+    )
+    elapsed = time.perf_counter() - started
+    if args.json:
+        print(json.dumps({group: dict(counter.most_common(args.top)) for group, counter in counts.items()}, ensure_ascii=False, indent=2))
+        return
+    print(f"⛏️  {', '.join(splits)}から候補を抽出しました（{elapsed:.2f}秒）")
+    for group, counter in counts.items():
+        print(f"  [{group}] 候補{len(counter):,}種類")
+        for phrase, count in counter.most_common(args.top):
+            print(f"    {count:>8,}  {phrase}")
+
+
+def command_catalog(args: argparse.Namespace) -> None:
+    """頻出する商品名候補を1商品1キーワードとして、import_reviews.py --productsで読める商品カタログを作る"""
+    paths = dataset_paths(args.data_dir)
+    splits = args.splits.split(",") if args.splits else [args.split]
+    unknown = [split for split in splits if split not in paths]
+    if unknown:
+        raise SystemExit(f"分割 {', '.join(unknown)} はありません（{', '.join(paths)}）。")
+    started = time.perf_counter()
+    counts = mine_phrases(
+        {split: paths[split] for split in splits},
+        group_by="all",
+        workers=args.workers,
+        decoder_name=args.json_decoder,
+    ).get("all", Counter())
+    matcher = get_keyword_matcher()
+    products = []
+    for phrase, _ in counts.most_common(args.count):
+        number = len(products) + 1
+        categories = matcher.count(phrase)["category"]
+        products.append({
+            "id": f"prod-{number:04d}",
+            "slug": f"product-{number:04d}",
+            "category": max(categories.items(), key=lambda x: x[1])[0] if categories else "その他",
+            "image": "",
+            "keywords": [phrase],
+        })
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    args.output.write_text(json.dumps(products, ensure_ascii=False, indent=2), encoding="utf-8")
+    elapsed = time.perf_counter() - started
+    print(f"🛍️  {len(products)}商品のカタログを書き出しました（{elapsed:.2f}秒）: {args.output}")
+    if len(products) < args.count:
+        print(f"  候補が{args.count}件に届かなかったため{len(products)}商品です")
+
+
+def command_bench_decoders(args: argparse.Namespace) -> None:
+    for name, rate in benchmark_decoders(dataset_paths(args.data_dir)[args.split]).items():
+        print(f"{name}: {rate:,.0f} lines/s")
+
+
+def add_filter_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--label", type=int, action="append", choices=range(5), help="ラベル（0〜4、複数指定可）")
+    parser.add_argument("--sentiment", choices=sorted(SENTIMENT_LABELS), help="感情（positive: 3〜4, negative: 0〜1, neutral: 2）")
+    parser.add_argument("--product", default=None, help="キーワードで最もよくマッチした商品ID（noneでマッチなし）")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="レビューデータセットを索引経由で表示・検索・集計します。")
+    parser.add_argument("--data-dir", type=Path, default=Path("data/amazon_reviews"), help="JSONLファイルのディレクトリ")
+    parser.add_argument("--split", default="train", choices=list(DATASET_URLS), help="対象の分割")
+    parser.add_argument("--cache-dir", type=Path, default=None, help="前処理キャッシュのディレクトリ（既定: <data-dir>.cache）")
+    parser.add_argument(
+        "--products",
+        type=Path,
+        default=None,
+        help="import_reviews.pyの--productsと同じ商品カタログ（商品キーワードでの絞り込み・キャッシュに使います）",
+    )
+    parser.add_argument(
+        "--json-decoder",
+        choices=["auto", "orjson", "msgspec", "json"],
+        default="auto",
+        help="JSONLの読み込みに使うデコーダ",
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    show = subparsers.add_parser("show", help="指定した番号（1始まり）のレコードを表示します")
+    show.add_argument("numbers", type=int, nargs="+", help="レコード番号")
+    show.set_defaults(func=command_show)
+
+    sample = subparsers.add_parser("sample", help="シード付きでランダムにレコードを表示します")
+    sample.add_argument("count", type=int, nargs="?", default=5, help="表示件数")
+    sample.add_argument("--seed", type=int, default=42, help="乱数シード")
+    add_filter_arguments(sample)
+    sample.set_defaults(func=command_sample)
+
+    filter_parser = subparsers.add_parser("filter", help="条件に一致するレコードを先頭から表示します")
+    add_filter_arguments(filter_parser)
+    filter_parser.add_argument("--limit", type=int, default=5, help="表示件数")
+    filter_parser.add_argument("--offset", type=int, default=0, help="一致したレコードのうち読み飛ばす件数")
+    filter_parser.add_argument("--count-only", action="store_true", help="件数だけを表示します")
+    filter_parser.set_defaults(func=command_filter)
+
+    stats = subparsers.add_parser("stats", help="ラベル分布・本文の文字数・文数の統計を表示します")
+    add_filter_arguments(stats)
+    stats.add_argument("--json", action="store_true", help="JSONで出力します")
+    stats.set_defaults(func=command_stats)
+
+    phrases = subparsers.add_parser("phrases", help="商品名・キーワードの候補をコーパス全体から数えます")
+    phrases.add_argument("--group-by", choices=PHRASE_GROUPS, default="product", help="候補を数える単位")
+    phrases.add_argument("--contains", default=None, help="この文字列を含むレビューだけを対象にします")
+    phrases.add_argument("--splits", default=None, help="対象の分割（カンマ区切り、既定: --split）")
+    phrases.add_argument("--top", type=int, default=20, help="グループごとに表示する件数")
+    phrases.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="ワーカープロセス数")
+    phrases.add_argument("--json", action="store_true", help="JSONで出力します")
+    phrases.set_defaults(func=command_phrases)
+
+    catalog = subparsers.add_parser("catalog", help="頻出する商品名候補から商品カタログ（JSON）を作ります")
+    catalog.add_argument("--count", type=int, default=1000, help="商品数")
+    catalog.add_argument("--output", type=Path, default=Path("data/products.json"), help="書き出し先のパス")
+    catalog.add_argument("--splits", default=None, help="対象の分割（カンマ区切り、既定: --split）")
+    catalog.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="ワーカープロセス数")
+    catalog.set_defaults(func=command_catalog)
+
+    bench = subparsers.add_parser("bench-decoders", help="利用可能なJSONデコーダごとの読み込み速度を表示します")
+    bench.set_defaults(func=command_bench_decoders)
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    if args.products is not None:
+        use_product_catalog(args.products)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+"""
+アプリが記録した実験の操作ログ（logsコレクション）を、分析用の列指向ファイルに書き出すCLI。
+
+前回の書き出しの到達時刻（high-water）から現在までを時間範囲のチャンクに分け、スレッドごとに
+projection付きのカーソルで読みながら、チャンクごとのParquet（pyarrowがない場合はCSV）に
+少しずつ書き込む。到達時刻は出力先のexport_state.jsonに保存するので、再実行では新しいログだけを取得する。
+MongoDBへの接続設定はimport_reviews.pyと共通。
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+
+try:
+    from dotenv import load_dotenv  # type: ignore
+except ImportError:  # pragma: no cover - optional dependency
+    load_dotenv = None
+
+from bson import CodecOptions, json_util
+from pymongo import MongoClient
+
+from review_import.mongo import mongo_client_options
+
+try:
+    import pyarrow as pa  # type: ignore
+    import pyarrow.parquet as pq  # type: ignore
+except ImportError:  # pragma: no cover - optional dependency
+    pa = None
+    pq = None
+
+if load_dotenv is not None:
+    load_dotenv()
+
+sys.stdout.reconfigure(encoding="utf-8", errors="ignore")
+
+COLLECTION_LOGS = "logs"
+# src/lib/server/db/models.tsのLogと同じフィールド
+LOG_FIELDS = ("_id", "userId", "experimentId", "taskId", "action", "data", "timestamp")
+EXPORT_STATE = "export_state.json"
+EXPORT_FORMATS = ("parquet", "csv")
+# timestampはUTCのaware datetimeとして読む（範囲の境界と比較するため）
+LOG_CODEC_OPTIONS = CodecOptions(tz_aware=True, tzinfo=timezone.utc)
+
+TimeRange = Tuple[datetime, datetime]
+
+
+def log_row(document: Dict[str, object], fields: Iterable[str]) -> Dict[str, object]:
+    """ログ1件を列の値にする。dataは任意の構造なので拡張JSONの文字列にする"""
+    row: Dict[str, object] = {}
+    for field in fields:
+        value = document.get(field)
+        if field == "data":
+            row[field] = None if value is None else json_util.dumps(value, ensure_ascii=False)
+        elif field == "timestamp":
+            row[field] = value
+        else:
+            row[field] = None if value is None else str(value)
+    return row
+
+
+class ChunkWriter:
+    """1つの時間範囲のログを、rows_per_write件ごとに列指向ファイルへ追記する"""
+
+    def __init__(self, path: Path, fields: List[str], export_format: str, rows_per_write: int) -> None:
+        self.path = path
+        self.tmp_path = path.with_name(path.name + ".tmp")
+        self.fields = fields
+        self.export_format = export_format
+        self.rows_per_write = max(1, rows_per_write)
+        self.rows: List[Dict[str, object]] = []
+        self.written = 0
+        self._writer = None
+        self._handle = None
+
+    def add(self, row: Dict[str, object]) -> None:
+        self.rows.append(row)
+        if len(self.rows) >= self.rows_per_write:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self.rows:
+            return
+        if self.export_format == "parquet":
+            table = pa.Table.from_pylist(self.rows, schema=parquet_schema(self.fields))
+            if self._writer is None:
+                self._writer = pq.ParquetWriter(self.tmp_path, table.schema, compression="zstd")
+            self._writer.write_table(table)
+        else:
+            if self._handle is None:
+                self._handle = self.tmp_path.open("w", encoding="utf-8", newline="")
+                self._writer = csv.DictWriter(self._handle, fieldnames=self.fields)
+                self._writer.writeheader()
+            self._writer.writerows(
+                {**row, "timestamp": row["timestamp"].isoformat()} if row.get("timestamp") else row
+                for row in self.rows
+            )
+        self.written += len(self.rows)
+        self.rows = []
+
+    def close(self) -> Path | None:
+        """書き込みを確定し、1件もなければファイルを作らずNoneを返す"""
+        self.flush()
+        if self._writer is None:
+            return None
+        if self.export_format == "parquet":
+            self._writer.close()
+        else:
+            self._handle.close()
+        os.replace(self.tmp_path, self.path)
+        return self.path
+
+    def discard(self) -> None:
+        if self.export_format == "parquet" and self._writer is not None:
+            self._writer.close()
+        if self._handle is not None:
+            self._handle.close()
+        self.tmp_path.unlink(missing_ok=True)
+
+
+def parquet_schema(fields: List[str]) -> "pa.Schema":
+    types = {"timestamp": pa.timestamp("ms", tz="UTC")}
+    return pa.schema([(field, types.get(field, pa.string())) for field in fields])
+
+
+def split_range(start: datetime, end: datetime, chunks: int) -> List[TimeRange]:
+    """[start, end)を同じ長さのchunks個の半開区間に分ける（ミリ秒単位、MongoDBの日時の精度）"""
+    total_ms = int((end - start) / timedelta(milliseconds=1))
+    chunks = max(1, min(chunks, total_ms))
+    bounds = [start + timedelta(milliseconds=total_ms * index // chunks) for index in range(chunks)] + [end]
+    return [(bounds[index], bounds[index + 1]) for index in range(chunks) if bounds[index] < bounds[index + 1]]
+
+
+def part_path(output_dir: Path, time_range: TimeRange, export_format: str) -> Path:
+    start, end = (int(bound.timestamp() * 1000) for bound in time_range)
+    return output_dir / f"logs-{start}-{end}.{export_format}"
+
+
+def export_chunk(
+    collection,
+    query: Dict[str, object],
+    time_range: TimeRange,
+    output_dir: Path,
+    args: argparse.Namespace
+) -> Tuple[Path | None, int]:
+    writer = ChunkWriter(part_path(output_dir, time_range, args.format), args.fields, args.format, args.rows_per_write)
+    projection = {field: 1 for field in args.fields}
+    if "_id" not in projection:
+        projection["_id"] = 0
+    cursor = collection.find(
+        {**query, "timestamp": {"$gte": time_range[0], "$lt": time_range[1]}},
+        projection,
+        batch_size=args.batch_size,
+    )
+    try:
+        for document in cursor:
+            writer.add(log_row(document, args.fields))
+        return writer.close(), writer.written
+    except BaseException:
+        writer.discard()
+        raise
+
+
+def load_state(output_dir: Path) -> Dict[str, object]:
+    path = output_dir / EXPORT_STATE
+    if not path.exists():
+        return {}
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+def save_state(output_dir: Path, state: Dict[str, object]) -> None:
+    tmp_path = output_dir / (EXPORT_STATE + ".tmp")
+    tmp_path.write_text(json.dumps(state, ensure_ascii=False, indent=2), encoding="utf-8")
+    os.replace(tmp_path, output_dir / EXPORT_STATE)
+
+
+def first_timestamp(collection, query: Dict[str, object]) -> datetime | None:
+    document = collection.find_one(query, {"timestamp": 1}, sort=[("timestamp", 1)])
+    return document["timestamp"] if document else None
+
+
+def has_timestamp_index(collection) -> bool:
+    """timestampを先頭キーに持つインデックスがあるか（時間範囲の読み込みに使える）"""
+    return any(info["key"][0][0] == "timestamp" for info in collection.index_information().values())
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="logsコレクションの操作ログを列指向ファイルに書き出します。")
+    parser.add_argument("--output-dir", type=Path, default=Path("data/logs_export"), help="書き出し先のディレクトリ")
+    parser.add_argument(
+        "--format",
+        choices=EXPORT_FORMATS,
+        default="parquet" if pa is not None else "csv",
+        help="出力形式（既定: pyarrowがあればparquet、なければcsv）",
+    )
+    parser.add_argument(
+        "--fields",
+        default=",".join(LOG_FIELDS),
+        help="書き出すフィールド（カンマ区切り、projectionとして使います）",
+    )
+    parser.add_argument("--experiment-id", default=None, help="この実験のログだけを書き出します")
+    parser.add_argument("--since", default=None, help="この時刻（ISO 8601）以降から書き出します（保存済みの到達時刻より優先）")
+    parser.add_argument(
+        "--settle-seconds",
+        type=float,
+        default=60.0,
+        help="書き込み途中のログを取りこぼさないよう、現在時刻からこの秒数前までを書き出します",
+    )
+    parser.add_argument("--workers", type=int, default=4, help="並列に読む時間範囲の数")
+    parser.add_argument("--chunks", type=int, default=None, help="時間範囲の分割数（既定: workersの4倍）")
+    parser.add_argument("--batch-size", type=int, default=5000, help="カーソルの1バッチあたりの件数")
+    parser.add_argument("--rows-per-write", type=int, default=50000, help="ファイルに追記する1回あたりの件数")
+    parser.add_argument(
+        "--create-index",
+        action="store_true",
+        help="logsにtimestamp_1インデックスがなければ作成します（運用中のコレクションへの書き込みになります）",
+    )
+    parser.add_argument(
+        "--mongodb-uri",
+        default=os.environ.get("MONGODB_URI"),
+        help="MongoDBの接続URI（未指定時は環境変数MONGODB_URI）",
+    )
+    parser.add_argument(
+        "--mongodb-db",
+        default=os.environ.get("MONGODB_DB_NAME", "review-system"),
+        help="MongoDBのデータベース名（未指定時は環境変数MONGODB_DB_NAMEまたはreview-system）",
+    )
+    args = parser.parse_args()
+    args.fields = [field.strip() for field in args.fields.split(",") if field.strip()]
+    unknown = [field for field in args.fields if field not in LOG_FIELDS]
+    if unknown or "timestamp" not in args.fields:
+        raise SystemExit(f"--fieldsには{', '.join(LOG_FIELDS)}から、timestampを含めて指定してください: {', '.join(unknown)}")
+    if args.format == "parquet" and pa is None:
+        raise SystemExit("--format parquetにはpyarrowが必要です。pip install pyarrowを実行してください。")
+    return args
+
+
+def main() -> None:
+    args = parse_args()
+    if not args.mongodb_uri:
+        raise SystemExit("MongoDBの接続URIが指定されていません。--mongodb-uriまたは環境変数MONGODB_URIを設定してください。")
+    mongodb_uri = args.mongodb_uri.strip().strip('"').strip("'")
+    mongodb_db = args.mongodb_db.strip().strip('"').strip("'")
+
+    args.output_dir.mkdir(parents=True, exist_ok=True)
+    state = load_state(args.output_dir)
+    query: Dict[str, object] = {}
+    if args.experiment_id:
+        query["experimentId"] = args.experiment_id
+    if state and state.get("query", {}) != query:
+        raise SystemExit(f"{args.output_dir}は別の条件で書き出したディレクトリです。--output-dirを変えてください。")
+
+    with MongoClient(mongodb_uri, **mongo_client_options(mongodb_uri)) as client:
+        collection = client[mongodb_db].get_collection(COLLECTION_LOGS, codec_options=LOG_CODEC_OPTIONS)
+        if args.create_index:
+            collection.create_index([("timestamp", 1)], name="timestamp_1")
+        elif not has_timestamp_index(collection):
+            # アプリはlogsにインデックスを作らないため、運用中のコレクションには明示したときだけ作る
+            print("⚠️  logsにtimestamp先頭のインデックスがないため、時間範囲ごとの読み込みがそれぞれ全件走査になります")
+            print("   --create-indexを付けて実行するとtimestamp_1を作成します")
+        if args.since:
+            start = datetime.fromisoformat(args.since)
+            start = start if start.tzinfo else start.replace(tzinfo=timezone.utc)
+        elif state.get("highWater"):
+            start = datetime.fromisoformat(str(state["highWater"]))
+        else:
+            start = first_timestamp(collection, query)
+        end = datetime.now(timezone.utc) - timedelta(seconds=args.settle_seconds)
+        if start is None or start >= end:
+            print("✅ 新しいログはありません")
+            return
+
+        ranges = split_range(start, end, args.chunks or args.workers * 4)
+        print(f"📤 {start.isoformat()}から{end.isoformat()}までのログを{len(ranges)}個の範囲に分けて書き出しています...")
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max(1, args.workers)) as executor:
+            futures = [
+                executor.submit(export_chunk, collection, query, time_range, args.output_dir, args)
+                for time_range in ranges
+            ]
+        errors = [future.exception() for future in futures if future.exception() is not None]
+        if errors:
+            # 到達時刻を進めない以上、書き終えた範囲のファイルも残すと次回に重複する
+            for future in futures:
+                if future.exception() is None and future.result()[0] is not None:
+                    future.result()[0].unlink(missing_ok=True)
+            raise errors[0]
+        results = [future.result() for future in futures]
+
+    files = [path for path, _ in results if path is not None]
+    exported = sum(count for _, count in results)
+    save_state(args.output_dir, {"query": query, "highWater": end.isoformat(), "format": args.format})
+    elapsed = time.perf_counter() - started
+    rate = exported / max(elapsed, 1e-9)
+    print(f"✅ {exported}件を{len(files)}ファイルに書き出しました（{elapsed:.2f}秒, {rate:.0f}件/s）: {args.output_dir}")
+    print(f"  次回は{end.isoformat()}以降の新しいログだけを書き出します")
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception as exc:
+        print(f"❌ エラー: {exc}", file=sys.stderr)
+        sys.exit(1)
@@ -3,29 +3,76 @@
 Hugging FaceのSetFit/amazon_reviews_multi_jaデータセットをダウンロードし、
 MongoDBに商品およびレビューとして投入するユーティリティスクリプト。
 
+処理の本体はreview_importパッケージのモジュールにあり、このファイルは引数の解析と実行の順序だけを持つ。
+
 参考: https://note.com/eurekachan/n/nbde77c119945
 """
 
 from __future__ import annotations
 
 import argparse
+import asyncio
+import cProfile
 import json
 import os
-import random
-import re
 import sys
-from datetime import datetime, timedelta, timezone
+from contextlib import nullcontext
 from pathlib import Path
-from typing import Dict, Iterable, List, Tuple
-from urllib.request import Request, urlopen
+from typing import Dict, List
 
 try:
     from dotenv import load_dotenv  # type: ignore
 except ImportError:  # pragma: no cover - optional dependency
     load_dotenv = None
 
+try:
+    import numpy as np  # type: ignore
+except ImportError:  # pragma: no cover - optional dependency
+    np = None
+
+try:
+    import pyinstrument  # type: ignore
+except ImportError:  # pragma: no cover - optional dependency
+    pyinstrument = None
+
 from pymongo import MongoClient
-from pymongo.server_api import ServerApi
+
+from review_import import catalog
+from review_import.async_pipeline import run_async_pipeline
+from review_import.cache import ReviewCache, default_cache_dir
+from review_import.catalog import PRODUCT_CATALOG_ENV, use_product_catalog
+from review_import.dataset import (
+    DATASET_URLS,
+    available_compressions,
+    dataset_file_paths,
+    download_datasets,
+    find_dataset_paths,
+    format_download_result,
+)
+from review_import.decoders import JsonlDecoder, get_decoder
+from review_import.documents import (
+    ANNOTATION_SCHEMAS,
+    METADATA_GENERATORS,
+    ProductAccumulator,
+    ReviewDocument,
+    accumulated_product_documents,
+    build_catalog_documents,
+)
+from review_import.dump import DUMP_FORMATS, DumpWriter, find_dump_files, load_dump, print_dump_instructions
+from review_import.indexes import (
+    DEFERRED_INDEX_THRESHOLD,
+    finalize_indexes,
+    prepare_indexes,
+    report_indexes,
+    should_defer_indexes,
+)
+from review_import.journal import IMPORT_JOURNAL, open_journal
+from review_import.metrics import ImportMetrics
+from review_import.mongo import COLLECTION_PRODUCTS, COLLECTION_REVIEWS, RETRY_MAX_DELAY, mongo_client_options
+from review_import.selection import SUMMARY_PRODUCTS, _selection_size, collect_records, ensure_records_sufficient
+from review_import.streaming import stream_review_documents, stream_reviews
+from review_import.sync import format_sync_counts, sync_products, sync_reviews
+from review_import.writer import BulkWriter, insert_reviews, report_write_stats, upsert_products
 
 if load_dotenv is not None:
     load_dotenv()
@@ -33,420 +80,23 @@ if load_dotenv is not None:
 sys.stdout.reconfigure(encoding="utf-8", errors="ignore")
 sys.stderr.reconfigure(encoding="utf-8", errors="ignore")
 
-DATASET_URLS = {
-    "train": "https://huggingface.co/datasets/SetFit/amazon_reviews_multi_ja/resolve/main/train.jsonl",
-    "validation": "https://huggingface.co/datasets/SetFit/amazon_reviews_multi_ja/resolve/main/validation.jsonl",
-    "test": "https://huggingface.co/datasets/SetFit/amazon_reviews_multi_ja/resolve/main/test.jsonl"
-}
-
-ANNOTATION_TYPES = ["insightful", "unclear", "empathy", "helpful"]
-
-PRODUCT_CONFIGS = [
-    {
-        "id": "prod-001",
-        "slug": "wireless-earbuds-pro",
-        "category": "家電・カメラ",
-        "image": "https://images.unsplash.com/photo-1590658268037-6bf12165a8df?w=400",
-        "keywords": ["イヤホン", "ヘッドホン", "ワイヤレス", "音質", "ノイズ"]
-    },
-    {
-        "id": "prod-002",
-        "slug": "smart-watch-x1",
-        "category": "家電・カメラ",
-        "image": "https://images.unsplash.com/photo-1523275335684-37898b6baf30?w=400",
-        "keywords": ["スマートウォッチ", "腕時計", "心拍", "睡眠", "フィットネス"]
-    },
-    {
-        "id": "prod-003",
-        "slug": "mechanical-keyboard-rgb",
-        "category": "パソコン・周辺機器",
-        "image": "https://images.unsplash.com/photo-1587829741301-dc798b83add3?w=400",
-        "keywords": ["キーボード", "タイピング", "キー", "打鍵", "メカニカル"]
-    }
-]
-
-COLLECTION_PRODUCTS = "products"
-COLLECTION_REVIEWS = "reviews"
-
-random.seed(42)
-
-
-def download_file(url: str, dest: Path, overwrite: bool = False) -> None:
-    if dest.exists() and not overwrite:
-        return
 
-    dest.parent.mkdir(parents=True, exist_ok=True)
-    req = Request(url, headers={"User-Agent": "Mozilla/5.0"})
-    with urlopen(req) as response, dest.open("wb") as f:
-        chunk_size = 1024 * 1024
-        while True:
-            chunk = response.read(chunk_size)
-            if not chunk:
-                break
-            f.write(chunk)
-
-
-def iter_dataset(paths: Dict[str, Path]) -> Iterable[Tuple[str, Dict[str, object]]]:
-    for split, path in paths.items():
-        with path.open("r", encoding="utf-8") as f:
-            for line in f:
-                line = line.strip()
-                if not line:
-                    continue
-                record = json.loads(line)
-                record["split"] = split
-                yield split, record
-
-
-def classify_sentiment(label: int) -> str | None:
-    if label <= 1:
-        return "negative"
-    if label >= 3:
-        return "positive"
-    return None
-
-
-def create_title(text: str) -> str:
-    cleaned = text.strip().splitlines()[0] if text.strip() else ""
-    if not cleaned:
-        return "レビュー"
-    first_sentence = re.split(r"[。！？!?\n]", cleaned, maxsplit=1)[0]
-    first_sentence = first_sentence.strip()
-    if not first_sentence:
-        first_sentence = cleaned.strip()
-    return first_sentence[:30] + ("…" if len(first_sentence) > 30 else "")
-
-
-def split_into_sentences(text: str) -> List[str]:
-    sentences: List[str] = []
-    buffer: List[str] = []
-    for char in text:
-        buffer.append(char)
-        if char in ("。", "！", "?", "？", "\n"):
-            sentence = "".join(buffer).strip()
-            buffer.clear()
-            if sentence:
-                sentences.append(sentence)
-    if buffer:
-        tail = "".join(buffer).strip()
-        if tail:
-            sentences.append(tail)
-    return sentences
-
-
-def build_sentence_entities(review_id: str, sentences: List[str]) -> List[Dict[str, object]]:
-    entities = []
-    for idx, sentence in enumerate(sentences, start=1):
-        entities.append(
-            {
-                "id": f"{review_id}-sentence-{idx:02d}",
-                "text": sentence,
-                "annotations": [{"type": ann_type, "count": 0} for ann_type in ANNOTATION_TYPES],
-            }
-        )
-    return entities
-
-
-def random_datetime_within(days: int = 365) -> datetime:
-    now = datetime.now(timezone.utc)
-    delta_days = random.randint(0, days)
-    delta_minutes = random.randint(0, 23 * 60 + 59)
-    return now - timedelta(days=delta_days, minutes=delta_minutes)
-
-
-def build_review_document(
-    record: Dict[str, object],
-    product: Dict[str, object],
-    review_index: int,
-    sentiment: str
-) -> Dict[str, object]:
-    dataset_label = int(record["label"])
-    rating = max(1, min(5, dataset_label + 1))
-    review_id = f"{product['id']}-rev-{review_index:04d}"
-    created_at = random_datetime_within()
-    total_votes = random.randint(0, 120)
-    if total_votes == 0:
-        helpful_votes = 0
-    elif sentiment == "positive":
-        helpful_votes = random.randint(max(0, total_votes // 2), total_votes)
-    else:
-        helpful_votes = random.randint(0, total_votes // 2)
-
-    sentences = split_into_sentences(record["text"])
-
-    return {
-        "reviewId": review_id,
-        "productId": product["id"],
-        "productSlug": product["slug"],
-        "datasetId": record["id"],
-        "datasetLabel": dataset_label,
-        "datasetSplit": record["split"],
-        "sentiment": sentiment,
-        "rating": rating,
-        "title": create_title(record["text"]),
-        "content": record["text"],
-        "userId": f"user-{review_id}",
-        "userName": f"ユーザー{review_index:04d}",
-        "userAvatar": f"https://i.pravatar.cc/150?u={review_id}",
-        "verifiedPurchase": random.random() < 0.85,
-        "helpfulVotes": helpful_votes,
-        "totalVotes": total_votes,
-        "createdAt": created_at,
-        "updatedAt": created_at,
-        "language": "ja",
-        "sentences": build_sentence_entities(review_id, sentences),
-    }
-
-
-def summarize_text(text: str, max_length: int = 220) -> str:
-    collapsed = re.sub(r"\s+", " ", text).strip()
-    if len(collapsed) <= max_length:
-        return collapsed
-    return collapsed[:max_length].rstrip() + "…"
-
-
-def extract_product_name_from_reviews(reviews: List[Dict[str, object]]) -> str:
-    """レビューから商品名を推測"""
-    # レビュー本文から商品名らしき単語を抽出
-    product_keywords = {}
-    for review in reviews:
-        text = str(review.get("content", ""))
-        # 一般的な商品名パターンを抽出
-        # 「○○を購入」「○○が届いた」「○○を使った」などのパターン
-        patterns = [
-            r"([^。、\s]{2,15}?)(を|が|の)(購入|届いた|使った|使用|試した)",
-            r"([^。、\s]{2,15}?)(の)(レビュー|感想|評価)",
-        ]
-        for pattern in patterns:
-            matches = re.findall(pattern, text)
-            for match in matches:
-                if isinstance(match, tuple):
-                    keyword = match[0] if match[0] else ""
-                else:
-                    keyword = match
-                if len(keyword) >= 2 and len(keyword) <= 15:
-                    product_keywords[keyword] = product_keywords.get(keyword, 0) + 1
-    
-    if product_keywords:
-        # 最も頻出するキーワードを商品名として使用
-        most_common = max(product_keywords.items(), key=lambda x: x[1])
-        return most_common[0]
-    
-    # フォールバック: レビューの最初の文から抽出
-    if reviews:
-        first_review = str(reviews[0].get("content", ""))
-        first_sentence = re.split(r"[。！？!?\n]", first_review, maxsplit=1)[0]
-        # 最初の10文字程度を商品名として使用
-        return first_sentence[:15].strip()
-    
-    return "商品"
-
-
-def infer_category_from_reviews(reviews: List[Dict[str, object]]) -> str:
-    """レビューからカテゴリを推測"""
-    category_keywords = {
-        "家電・カメラ": ["充電", "電源", "バッテリー", "イヤホン", "ヘッドホン", "スピーカー", "カメラ", "レンズ", "テレビ", "冷蔵庫", "洗濯機"],
-        "パソコン・周辺機器": ["キーボード", "マウス", "モニター", "PC", "パソコン", "ノート", "タブレット", "USB", "ケーブル", "充電器"],
-        "スマートフォン・タブレット": ["iPhone", "Android", "スマホ", "スマートフォン", "タブレット", "アプリ", "画面", "タッチ"],
-        "ホビー・ゲーム": ["ゲーム", "プレイ", "コントローラー", "ソフト", "フィギュア", "プラモデル"],
-        "本・雑誌・コミック": ["本", "書籍", "雑誌", "コミック", "マンガ", "小説"],
-        "食品・飲料": ["食べ", "飲み", "味", "おいしい", "まずい", "料理", "レシピ"],
-        "ファッション": ["服", "靴", "バッグ", "アクセサリー", "サイズ", "着用"],
-        "美容・健康": ["化粧", "スキンケア", "シャンプー", "歯磨き", "サプリメント"],
-    }
-    
-    text_content = " ".join(str(r.get("content", "")) for r in reviews)
-    category_scores = {}
-    
-    for category, keywords in category_keywords.items():
-        score = sum(1 for keyword in keywords if keyword in text_content)
-        if score > 0:
-            category_scores[category] = score
-    
-    if category_scores:
-        return max(category_scores.items(), key=lambda x: x[1])[0]
-    
-    return "その他"
-
-
-def build_product_document(
-    config: Dict[str, str],
-    reviews: List[Dict[str, object]]
-) -> Dict[str, object]:
-    average_rating = round(sum(review["rating"] for review in reviews) / len(reviews), 2)
-    
-    # レビューから実際の商品名を抽出
-    extracted_name = extract_product_name_from_reviews(reviews)
-    if extracted_name and extracted_name != "商品":
-        product_name = extracted_name
-    else:
-        # フォールバック: レビューのタイトルから生成
-        positive_reviews = [review for review in reviews if review["sentiment"] == "positive"]
-        representative_review = positive_reviews[0] if positive_reviews else reviews[0]
-        representative_text = str(representative_review["content"])
-        product_name = create_title(representative_text)
-    
-    # カテゴリを推測
-    inferred_category = infer_category_from_reviews(reviews)
-    category = inferred_category if inferred_category != "その他" else config["category"]
-    
-    # 説明文を生成
-    all_reviews_text = " ".join(str(r.get("content", "")) for r in reviews[:5])
-    description = summarize_text(all_reviews_text, 220)
-    
-    # 価格を推測（レビューの内容から）
-    # 平均評価とレビュー数に基づいて価格を設定
-    base_price = 3000 if average_rating >= 4.0 else 2000 if average_rating >= 3.0 else 1500
-    price_variation = random.randint(-500, 2000)
-    price = max(500, min(50000, base_price + price_variation))
-
-    now = datetime.now(timezone.utc)
-
-    return {
-        "productId": config["id"],
-        "slug": config["slug"],
-        "name": product_name,
-        "category": category,
-        "image": config["image"],
-        "price": price,
-        "description": description,
-        "averageRating": average_rating,
-        "totalReviews": len(reviews),
-        "updatedAt": now,
-        "createdAt": now,
-    }
-
-
-def match_review_to_product(record: Dict[str, object]) -> str | None:
-    """レビューを最も適切な商品にマッチング"""
-    text = str(record.get("text", "")).lower()
-    
-    # 各商品のキーワードとのマッチングスコアを計算
-    product_scores: Dict[str, int] = {}
-    
-    for product in PRODUCT_CONFIGS:
-        score = 0
-        for keyword in product["keywords"]:
-            if keyword.lower() in text:
-                score += 1
-        if score > 0:
-            product_scores[product["id"]] = score
-    
-    # 最もスコアが高い商品を返す
-    if product_scores:
-        return max(product_scores.items(), key=lambda x: x[1])[0]
-    
-    return None
-
-
-def collect_records(
-    dataset_paths: Dict[str, Path],
-    per_sentiment: int
-) -> Dict[str, Dict[str, List[Dict[str, object]]]]:
-    selected: Dict[str, Dict[str, List[Dict[str, object]]]] = {
-        product["id"]: {"positive": [], "negative": []} for product in PRODUCT_CONFIGS
-    }
-    
-    # 各商品ごとに必要なレビュー数を追跡
-    required_counts = {product["id"]: per_sentiment for product in PRODUCT_CONFIGS}
-    
-    for _, record in iter_dataset(dataset_paths):
-        label = int(record["label"])
-        sentiment = classify_sentiment(label)
-        if sentiment is None:
-            continue
-        
-        # レビューを最も適切な商品にマッチング
-        matched_product_id = match_review_to_product(record)
-        
-        if matched_product_id:
-            # 必要なレビュー数に達していない場合のみ追加
-            if len(selected[matched_product_id][sentiment]) < required_counts[matched_product_id]:
-                selected[matched_product_id][sentiment].append(record)
-        
-        # すべての商品で必要なレビュー数に達したかチェック
-        all_complete = all(
-            len(selected[product["id"]]["positive"]) >= required_counts[product["id"]]
-            and len(selected[product["id"]]["negative"]) >= required_counts[product["id"]]
-            for product in PRODUCT_CONFIGS
-        )
-        
-        if all_complete:
-            break
-    
-    # 不足しているレビューを補完（マッチングできなかったレビューを使用）
-    unmatched_positives: List[Dict[str, object]] = []
-    unmatched_negatives: List[Dict[str, object]] = []
-    
-    for _, record in iter_dataset(dataset_paths):
-        label = int(record["label"])
-        sentiment = classify_sentiment(label)
-        if sentiment is None:
-            continue
-        
-        matched_product_id = match_review_to_product(record)
-        if not matched_product_id:
-            if sentiment == "positive":
-                unmatched_positives.append(record)
-            else:
-                unmatched_negatives.append(record)
-    
-    # 不足分をランダムに補完
-    random.shuffle(unmatched_positives)
-    random.shuffle(unmatched_negatives)
-    
-    for product in PRODUCT_CONFIGS:
-        product_id = product["id"]
-        # 肯定レビューの不足分を補完
-        while len(selected[product_id]["positive"]) < required_counts[product_id] and unmatched_positives:
-            selected[product_id]["positive"].append(unmatched_positives.pop())
-        # 否定レビューの不足分を補完
-        while len(selected[product_id]["negative"]) < required_counts[product_id] and unmatched_negatives:
-            selected[product_id]["negative"].append(unmatched_negatives.pop())
-
-    return selected
-
-
-def ensure_records_sufficient(
-    records: Dict[str, Dict[str, List[Dict[str, object]]]],
-    per_sentiment: int
+def print_stream_summary(
+    accumulators: Dict[str, ProductAccumulator],
+    product_documents: Dict[str, Dict[str, object]],
+    loaded: bool = True
 ) -> None:
-    shortages: List[str] = []
-    for product in PRODUCT_CONFIGS:
-        for sentiment in ("positive", "negative"):
-            count = len(records[product["id"]][sentiment])
-            if count < per_sentiment:
-                shortages.append(f"{product['id']} ({sentiment}): {count}/{per_sentiment}")
-    if shortages:
-        message = "十分な件数のレビューを収集できませんでした:\n  " + "\n  ".join(shortages)
-        raise RuntimeError(message)
-
-
-def upsert_products(db, product_documents: Dict[str, Dict[str, object]]) -> None:
-    for product_id, document in product_documents.items():
-        payload = document.copy()
-        created_at = payload.pop("createdAt")
-        payload["updatedAt"] = datetime.now(timezone.utc)
-
-        db[COLLECTION_PRODUCTS].update_one(
-            {"productId": product_id},
-            {
-                "$set": payload,
-                "$setOnInsert": {"createdAt": created_at},
-            },
-            upsert=True,
+    print("\n✅ データ投入が完了しました。概要:" if loaded else "\n✅ ダンプの書き出しが完了しました。概要:")
+    lines = []
+    for product_id, accumulator in accumulators.items():
+        name = product_documents.get(product_id, {}).get("name", accumulator.config["slug"])
+        lines.append(
+            f"{name}: {accumulator.total_reviews}件 "
+            f"(positive {accumulator.sentiments['positive']}, negative {accumulator.sentiments['negative']})"
         )
-
-
-def insert_reviews(db, product_reviews: Dict[str, List[Dict[str, object]]], keep_existing: bool) -> None:
-    for product in PRODUCT_CONFIGS:
-        reviews = product_reviews.get(product["id"], [])
-        if not reviews:
-            continue
-        if not keep_existing:
-            db[COLLECTION_REVIEWS].delete_many({"productId": product["id"]})
-        if reviews:
-            db[COLLECTION_REVIEWS].insert_many(reviews)
+    print_product_lines(lines)
+    if loaded:
+        print("\nMongoDBでデータが利用可能になりました。")
 
 
 def parse_args() -> argparse.Namespace:
@@ -459,6 +109,12 @@ def parse_args() -> argparse.Namespace:
         default=Path("data/amazon_reviews"),
         help="データファイルを保存するディレクトリ",
     )
+    parser.add_argument(
+        "--products",
+        type=Path,
+        default=None,
+        help=f"商品カタログ（JSON配列またはJSONL）。未指定時は環境変数{PRODUCT_CATALOG_ENV}、それもなければ組み込みの3商品",
+    )
     parser.add_argument(
         "--per-sentiment",
         type=int,
@@ -470,11 +126,170 @@ def parse_args() -> argparse.Namespace:
         action="store_true",
         help="既存のJSONLファイルを上書きダウンロードします",
     )
+    parser.add_argument(
+        "--pipeline",
+        choices=["sequential", "async"],
+        default="sequential",
+        help="async: 読み込み・マッチング・構築・書き込みを上限付きキューで並行に実行します（前処理キャッシュと--syncは使いません）",
+    )
+    parser.add_argument(
+        "--sync",
+        action="store_true",
+        help="既存レビューとの差分だけを書き込みます（変更のないレビューは書き換えません）",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="抽出件数の上限なしで全レビューを商品に割り当て、構築した順にバッチで投入します（負荷試験用。メモリ使用量は件数によらず一定）",
+    )
+    parser.add_argument(
+        "--stream-splits",
+        default="train",
+        help="--streamで読み込むsplit（カンマ区切り、既定: train）",
+    )
+    parser.add_argument(
+        "--compress",
+        choices=["none", "gzip", "zstd"],
+        default=None,
+        help="データセットを圧縮して保存します（既定: 既存のファイルの形式、なければ非圧縮。ダウンロード済みのファイルはその場で変換。zstdにはzstandardが必要）",
+    )
+    parser.add_argument(
+        "--index-build",
+        choices=["auto", "deferred", "online"],
+        default="auto",
+        help=(
+            "deferred: レビューのunique以外のインデックスを外して投入し、最後にまとめて作り直します。"
+            f"online: 投入前に作成します。auto: --streamまたは{DEFERRED_INDEX_THRESHOLD}件以上ならdeferred（--syncは常にonline）"
+        ),
+    )
+    parser.add_argument(
+        "--metadata-generator",
+        choices=list(METADATA_GENERATORS),
+        default="python",
+        help=(
+            "投稿日時・投票数などの合成フィールドの生成方法。numpy: チャンクごとに列としてまとめて生成します"
+            "（分布は同じで再現可能ですが値はpythonと異なるため、--syncで比較する場合は同じ方法を使ってください）"
+        ),
+    )
+    parser.add_argument(
+        "--annotation-schema",
+        choices=list(ANNOTATION_SCHEMAS),
+        default="embedded",
+        help=(
+            "文ごとのアノテーション件数の持ち方。embedded: {type, count}の配列（アプリの既定）、"
+            "array: ANNOTATION_TYPES順の件数の配列、counts: 種類をキーにした件数の文書"
+        ),
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="中断した取り込みを、ジャーナルに記録された書き込み済みのバッチを飛ばして再開します（中断時と同じ引数で実行）",
+    )
+    parser.add_argument(
+        "--journal",
+        type=Path,
+        default=None,
+        help=f"取り込みの進捗を記録するジャーナルのパス（既定: <data-dir>/{IMPORT_JOURNAL}）",
+    )
+    parser.add_argument(
+        "--max-retries",
+        type=int,
+        default=5,
+        help="接続断などの一時的なエラーで失敗したバッチを再送する最大回数",
+    )
+    parser.add_argument(
+        "--retry-delay",
+        type=float,
+        default=0.5,
+        help=f"再送の初回待ち時間（秒）。失敗するたびに倍にします（上限{RETRY_MAX_DELAY:.0f}秒）",
+    )
+    parser.add_argument(
+        "--output-dump",
+        type=Path,
+        default=None,
+        help="MongoDBに接続せず、商品とレビューの文書を<DIR>/<DB名>/にmongodump互換の形式で書き出します",
+    )
+    parser.add_argument(
+        "--dump-format",
+        choices=list(DUMP_FORMATS),
+        default="bson",
+        help="--output-dumpの形式（bson: mongorestore用、ndjson: mongoimport用の拡張JSON）",
+    )
+    parser.add_argument(
+        "--load-dump",
+        type=Path,
+        default=None,
+        help="--output-dumpで書き出したダンプを、データセットを読まずにそのまま投入します",
+    )
+    parser.add_argument(
+        "--download-workers",
+        type=int,
+        default=len(DATASET_URLS),
+        help="並列にダウンロードする分割の数",
+    )
     parser.add_argument(
         "--keep-existing",
         action="store_true",
         help="既存のレビューを削除せずに追加します（デフォルトは置き換え）",
     )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=42,
+        help="レビュー抽出と合成フィールド生成の乱数シード（同じシードなら同じ結果になります）",
+    )
+    parser.add_argument(
+        "--build-workers",
+        type=int,
+        default=1,
+        help="レビュー文書と商品文書を並列に構築するプロセス数（大量のレビューや商品を扱う場合に指定）",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=1000,
+        help="bulk_writeの1バッチあたりの操作数",
+    )
+    parser.add_argument(
+        "--writers",
+        type=int,
+        default=4,
+        help="MongoDBへ並列に書き込むスレッド数",
+    )
+    parser.add_argument(
+        "--json-decoder",
+        choices=["auto", "msgspec", "orjson", "json"],
+        default="auto",
+        help="JSONLの読み込みに使うデコーダ（auto: インストール済みの最速のもの）",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        type=Path,
+        default=None,
+        help="前処理キャッシュの保存先（未指定時は--data-dirと同じ階層の<data-dir>.cache）",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="前処理キャッシュを使わずにJSONLを直接読み込みます",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="各段階の実行時間・CPU時間・最大RSS・件数/秒とMongoDB呼び出しの所要時間を表示します",
+    )
+    parser.add_argument(
+        "--profile-dir",
+        type=Path,
+        default=None,
+        help="プロファイルの概要（import_profile.json）とプロファイラの出力を保存するディレクトリ（--profileを含む）",
+    )
+    parser.add_argument(
+        "--profiler",
+        choices=["none", "cprofile", "pyinstrument"],
+        default="none",
+        help="関数単位のプロファイラ（--profile-dirが必要で、結果はそこに保存。cProfileはメインスレッドのみ計測）",
+    )
     parser.add_argument(
         "--mongodb-uri",
         default=os.environ.get("MONGODB_URI"),
@@ -485,59 +300,270 @@ def parse_args() -> argparse.Namespace:
         default=os.environ.get("MONGODB_DB_NAME", "review-system"),
         help="MongoDBのデータベース名（未指定時は環境変数MONGODB_DB_NAMEまたはreview-system）",
     )
-    return parser.parse_args()
+    args = parser.parse_args()
+    if args.profiler != "none" and args.profile_dir is None:
+        # 結果の保存先がないとプロファイラの計測が捨てられてしまう
+        raise SystemExit(f"--profiler {args.profiler}には結果の保存先の--profile-dirを指定してください。")
+    return args
 
 
-def main() -> None:
-    args = parse_args()
+def print_import_summary(
+    product_reviews: Dict[str, List[ReviewDocument]],
+    product_documents: Dict[str, Dict[str, object]],
+    loaded: bool = True
+) -> None:
+    print("\n✅ データ投入が完了しました。概要:" if loaded else "\n✅ ダンプの書き出しが完了しました。概要:")
+    lines = []
+    for config in catalog.PRODUCT_CONFIGS:
+        reviews = product_reviews[config["id"]]
+        positives = sum(1 for review in reviews if review.sentiment == "positive")
+        negatives = sum(1 for review in reviews if review.sentiment == "negative")
+        name = product_documents.get(config["id"], {}).get("name", config["slug"])
+        lines.append(f"{name}: {len(reviews)}件 (positive {positives}, negative {negatives})")
+    print_product_lines(lines)
+    if loaded:
+        print("\nMongoDBでデータが利用可能になりました。")
+
 
-    if not args.mongodb_uri:
+def print_product_lines(lines: List[str]) -> None:
+    """商品ごとの内訳を先頭SUMMARY_PRODUCTS件まで表示する"""
+    for line in lines[:SUMMARY_PRODUCTS]:
+        print(f"  - {line}")
+    if len(lines) > SUMMARY_PRODUCTS:
+        print(f"  - ...ほか{len(lines) - SUMMARY_PRODUCTS}商品")
+
+
+def run_stream_import(
+    args: argparse.Namespace,
+    dataset_paths: Dict[str, Path],
+    mongodb_uri: str,
+    mongodb_db: str,
+    decoder: JsonlDecoder,
+    metrics: ImportMetrics
+) -> None:
+    splits = [split.strip() for split in args.stream_splits.split(",") if split.strip()]
+    unknown = [split for split in splits if split not in dataset_paths]
+    if unknown or not splits:
+        raise SystemExit(f"--stream-splitsには{', '.join(dataset_paths)}を指定してください: {args.stream_splits}")
+    stream_paths = {split: dataset_paths[split] for split in splits}
+
+    if args.output_dump is not None:
+        print(f"\n🌊 {', '.join(splits)}の全レビューをストリーミングでダンプに書き出しています...")
+        dump_writer = DumpWriter(args.output_dump, mongodb_db, args.dump_format, batch_size=args.batch_size)
+        accumulators = {str(product["id"]): ProductAccumulator(product) for product in catalog.PRODUCT_CONFIGS}
+        with metrics.stage("dump") as stage:
+            reviews = stream_review_documents(
+                stream_paths, accumulators, args.seed, decoder, args.build_workers, args.metadata_generator
+            )
+            review_stats = dump_writer.write(
+                COLLECTION_REVIEWS, (review.to_document(args.annotation_schema) for review in reviews), label="reviews"
+            )
+            product_documents = accumulated_product_documents(accumulators, args.seed, args.metadata_generator)
+            product_stats = dump_writer.write(COLLECTION_PRODUCTS, product_documents.values(), label="products")
+            stage["records"] = review_stats.documents + product_stats.documents
+        report_write_stats([review_stats, product_stats])
+        print_stream_summary(accumulators, product_documents, loaded=False)
+        print_dump_instructions(dump_writer, product_documents)
+        return
+
+    print(f"\n🌊 {', '.join(splits)}の全レビューをストリーミングで投入しています...")
+    journal = open_journal(args, "stream", mongodb_uri, mongodb_db, stream_paths.values())
+    with journal.track(), MongoClient(mongodb_uri, **mongo_client_options(mongodb_uri)) as client:
+        db = metrics.wrap_db(client[mongodb_db])
+        deferred = should_defer_indexes(args.index_build, None)
+        prepare_indexes(db, deferred)
+        writer = BulkWriter(
+            db,
+            batch_size=args.batch_size,
+            workers=args.writers,
+            max_retries=args.max_retries,
+            retry_delay=args.retry_delay,
+        )
+        with metrics.stage("stream") as stage:
+            accumulators, review_stats = stream_reviews(
+                db,
+                stream_paths,
+                seed=args.seed,
+                decoder=decoder,
+                keep_existing=args.keep_existing,
+                writer=writer,
+                build_workers=args.build_workers,
+                journal=journal,
+                generator=args.metadata_generator,
+                annotation_schema=args.annotation_schema,
+            )
+            stage["records"] = review_stats.documents
+        product_documents = accumulated_product_documents(accumulators, args.seed, args.metadata_generator)
+        with metrics.stage("product_upsert") as stage:
+            product_stats = upsert_products(db, product_documents, writer=writer)
+            stage["records"] = product_stats.documents
+        with metrics.stage("index_build") as stage:
+            built_indexes = finalize_indexes(db)
+            stage["records"] = sum(len(names) for names, _ in built_indexes.values())
+
+    report_write_stats([review_stats, product_stats])
+    report_indexes(built_indexes, deferred)
+    print_stream_summary(accumulators, product_documents)
+
+
+def run_load_dump(args: argparse.Namespace, mongodb_uri: str, mongodb_db: str, metrics: ImportMetrics) -> None:
+    print(f"📦 ダンプを読み込んでいます: {args.load_dump}")
+    journal = open_journal(args, "load", mongodb_uri, mongodb_db, find_dump_files(args.load_dump).values())
+    with journal.track(), MongoClient(mongodb_uri, **mongo_client_options(mongodb_uri)) as client:
+        db = metrics.wrap_db(client[mongodb_db])
+        # 件数はファイルを読むまで分からないので、autoでも大量投入として扱う
+        deferred = should_defer_indexes(args.index_build, None)
+        prepare_indexes(db, deferred)
+        writer = BulkWriter(
+            db,
+            batch_size=args.batch_size,
+            workers=args.writers,
+            max_retries=args.max_retries,
+            retry_delay=args.retry_delay,
+        )
+        with metrics.stage("review_insert") as stage:
+            product_documents, product_stats, review_stats = load_dump(
+                db, args.load_dump, keep_existing=args.keep_existing, writer=writer, journal=journal
+            )
+            stage["records"] = product_stats.documents + review_stats.documents
+        with metrics.stage("index_build") as stage:
+            built_indexes = finalize_indexes(db)
+            stage["records"] = sum(len(names) for names, _ in built_indexes.values())
+
+    report_write_stats([product_stats, review_stats])
+    report_indexes(built_indexes, deferred)
+    print("\n✅ データ投入が完了しました。概要:")
+    for product_id, document in product_documents.items():
+        print(f"  - {document.get('name', product_id)}: {document.get('totalReviews', 0)}件")
+    print("\nMongoDBでデータが利用可能になりました。")
+
+
+def run_import(args: argparse.Namespace, metrics: ImportMetrics) -> None:
+    if args.output_dump is not None and args.load_dump is not None:
+        raise SystemExit("--output-dumpと--load-dumpは同時に指定できません。")
+    if args.output_dump is not None and (args.sync or args.pipeline == "async"):
+        raise SystemExit("--output-dumpは--syncや--pipeline asyncと同時に指定できません。")
+    if not args.mongodb_uri and args.output_dump is None:
         raise SystemExit("MongoDBの接続URIが指定されていません。--mongodb-uriまたは環境変数MONGODB_URIを設定してください。")
 
-    mongodb_uri = args.mongodb_uri.strip().strip('"').strip("'")
+    if args.sync and args.keep_existing:
+        raise SystemExit("--syncと--keep-existingは同時に指定できません。")
+    if args.sync and args.pipeline == "async":
+        raise SystemExit("--syncは--pipeline asyncと同時に指定できません。")
+    if args.stream and (args.sync or args.pipeline == "async"):
+        raise SystemExit("--streamは--syncや--pipeline asyncと同時に指定できません。")
+    if args.metadata_generator == "numpy" and np is None:
+        raise SystemExit("--metadata-generator numpyにはnumpyが必要です。pip install numpyを実行してください。")
+    if args.resume and (args.sync or args.pipeline == "async" or args.output_dump is not None):
+        raise SystemExit("--resumeは--sync、--pipeline async、--output-dumpと同時に指定できません。")
+
+    mongodb_uri = (args.mongodb_uri or "").strip().strip('"').strip("'")
     mongodb_db = args.mongodb_db.strip().strip('"').strip("'")
 
-    dataset_paths = {
-        split: args.data_dir / f"amazon_reviews_{split}.jsonl" for split in DATASET_URLS.keys()
-    }
+    if args.load_dump is not None:
+        run_load_dump(args, mongodb_uri, mongodb_db, metrics)
+        return
+
+    if args.compress is None:
+        dataset_paths = find_dataset_paths(args.data_dir)
+    else:
+        if args.compress not in available_compressions():
+            raise SystemExit("--compress zstdにはzstandardが必要です。pip install zstandardを実行してください。")
+        dataset_paths = dataset_file_paths(args.data_dir, args.compress)
 
     print("📥 データセットを確認しています...")
-    for split, url in DATASET_URLS.items():
-        download_file(url, dataset_paths[split], overwrite=args.force_download)
-        print(f"  - {split}: {dataset_paths[split]}")
+    with metrics.stage("download") as stage:
+        download_results = download_datasets(
+            DATASET_URLS,
+            dataset_paths,
+            args.data_dir,
+            overwrite=args.force_download,
+            workers=args.download_workers,
+        )
+        stage["records"] = len(download_results)
+    for split in DATASET_URLS.keys():
+        print(f"  - {split}: {dataset_paths[split]} ({format_download_result(download_results[split])})")
+
+    decoder = get_decoder(args.json_decoder)
+    if args.stream:
+        run_stream_import(args, dataset_paths, mongodb_uri, mongodb_db, decoder, metrics)
+        return
+
+    expected_reviews = args.per_sentiment * 2 * len(catalog.PRODUCT_CONFIGS)
+    if args.pipeline == "async":
+        # インデックスの準備と再構築は投入の前後に1回ずつなので、同期クライアントで行う
+        deferred = should_defer_indexes(args.index_build, expected_reviews)
+        with MongoClient(mongodb_uri, **mongo_client_options(mongodb_uri)) as client:
+            prepare_indexes(metrics.wrap_db(client[mongodb_db]), deferred)
+        print("\n🚰 非同期パイプラインでレビューを抽出・投入しています...")
+        with metrics.stage("pipeline") as stage:
+            product_reviews, product_documents, write_stats = asyncio.run(
+                run_async_pipeline(args, dataset_paths, mongodb_uri, mongodb_db, decoder, metrics=metrics)
+            )
+            stage["records"] = sum(len(reviews) for reviews in product_reviews.values())
+        with MongoClient(mongodb_uri, **mongo_client_options(mongodb_uri)) as client:
+            with metrics.stage("index_build") as stage:
+                built_indexes = finalize_indexes(metrics.wrap_db(client[mongodb_db]))
+                stage["records"] = sum(len(names) for names, _ in built_indexes.values())
+        report_write_stats(write_stats)
+        report_indexes(built_indexes, deferred)
+        print_import_summary(product_reviews, product_documents)
+        return
 
     print("\n🔎 レビューを抽出しています...")
-    raw_records = collect_records(dataset_paths, args.per_sentiment)
+    with metrics.stage("selection") as stage:
+        cache: ReviewCache | None = None
+        if not args.no_cache:
+            cache_dir = args.cache_dir or default_cache_dir(args.data_dir)
+            cache, rebuilt = ReviewCache.open_or_build(cache_dir, dataset_paths, decoder)
+            status = "作成しました" if rebuilt else "再利用します"
+            print(f"🗃️  前処理キャッシュを{status}: {cache_dir} ({len(cache)}件)")
+
+        selection_stats: Dict[str, int] = {}
+        try:
+            raw_records = collect_records(
+                dataset_paths, args.per_sentiment, seed=args.seed, cache=cache, decoder=decoder, stats=selection_stats
+            )
+        finally:
+            if cache is not None:
+                cache.close()
+        stage["records"] = _selection_size(raw_records)
+    for name, value in selection_stats.items():
+        metrics.count(name, value)
     ensure_records_sufficient(raw_records, args.per_sentiment)
 
-    product_reviews: Dict[str, List[Dict[str, object]]] = {product["id"]: [] for product in PRODUCT_CONFIGS}
-
-    for product in PRODUCT_CONFIGS:
-        index = 1
-        for sentiment in ("positive", "negative"):
-            for record in raw_records[product["id"]][sentiment]:
-                review_doc = build_review_document(record, product, index, sentiment)
-                product_reviews[product["id"]].append(review_doc)
-                index += 1
-
-    product_documents: Dict[str, Dict[str, object]] = {}
-    for config in PRODUCT_CONFIGS:
-        reviews = product_reviews.get(config["id"], [])
-        if not reviews:
-            continue
-        product_documents[config["id"]] = build_product_document(config, reviews)
-
-    # MongoDB接続オプションを設定（DNS解決の問題を回避）
-    client_options = {
-        "serverSelectionTimeoutMS": 30000,  # 30秒
-        "connectTimeoutMS": 30000,
-    }
-    
-    # MongoDB Atlasの場合、Server APIを指定
-    if "mongodb+srv://" in mongodb_uri:
-        client_options["server_api"] = ServerApi("1")
-    
-    with MongoClient(mongodb_uri, **client_options) as client:
+    with metrics.stage("build") as stage:
+        product_reviews, product_documents = build_catalog_documents(
+            raw_records, seed=args.seed, workers=args.build_workers, generator=args.metadata_generator
+        )
+        stage["records"] = sum(len(reviews) for reviews in product_reviews.values())
+
+    if args.output_dump is not None:
+        dump_writer = DumpWriter(args.output_dump, mongodb_db, args.dump_format, batch_size=args.batch_size)
+        with metrics.stage("dump") as stage:
+            write_stats = [
+                dump_writer.write(COLLECTION_PRODUCTS, product_documents.values(), label="products"),
+                dump_writer.write(
+                    COLLECTION_REVIEWS,
+                    (
+                        review.to_document(args.annotation_schema)
+                        for reviews in product_reviews.values()
+                        for review in reviews
+                    ),
+                    label="reviews",
+                ),
+            ]
+            stage["records"] = sum(stats.documents for stats in write_stats)
+        report_write_stats(write_stats)
+        print_import_summary(product_reviews, product_documents, loaded=False)
+        print_dump_instructions(dump_writer, product_documents)
+        return
+
+    client_options = mongo_client_options(mongodb_uri)
+    # --syncは差分だけを書き込むので、そのまま再実行すれば続きから同期できる
+    journal = None if args.sync else open_journal(args, "insert", mongodb_uri, mongodb_db, dataset_paths.values())
+
+    with journal.track() if journal is not None else nullcontext(), MongoClient(mongodb_uri, **client_options) as client:
         # 接続テスト
         try:
             client.admin.command("ping")
@@ -546,18 +572,93 @@ def main() -> None:
             print(f"⚠️  MongoDB接続テストに失敗しました: {e}")
             print("接続を続行しますが、エラーが発生する可能性があります...")
         
-        db = client[mongodb_db]
-        upsert_products(db, product_documents)
-        insert_reviews(db, product_reviews, keep_existing=args.keep_existing)
+        db = metrics.wrap_db(client[mongodb_db])
+        # --syncは既存レビューとの照合にインデックスを使うので、常に投入前に作成しておく
+        deferred = not args.sync and should_defer_indexes(args.index_build, expected_reviews)
+        prepare_indexes(db, deferred)
+        writer = BulkWriter(
+            db,
+            batch_size=args.batch_size,
+            workers=args.writers,
+            max_retries=args.max_retries,
+            retry_delay=args.retry_delay,
+        )
+        if args.sync:
+            with metrics.stage("product_upsert") as stage:
+                product_counts, product_stats = sync_products(db, product_documents, writer=writer)
+                stage["records"] = product_stats.documents
+            with metrics.stage("review_insert") as stage:
+                review_counts, review_stats = sync_reviews(
+                    db, product_reviews, writer=writer, annotation_schema=args.annotation_schema
+                )
+                stage["records"] = review_stats.documents
+            print("\n🔁 差分同期の結果:")
+            print(f"  - {format_sync_counts('products', product_counts)}")
+            print(f"  - {format_sync_counts('reviews', review_counts)}")
+            write_stats = [product_stats, review_stats]
+        else:
+            with metrics.stage("product_upsert") as stage:
+                product_stats = upsert_products(db, product_documents, writer=writer)
+                stage["records"] = product_stats.documents
+            with metrics.stage("review_insert") as stage:
+                review_stats = insert_reviews(
+                    db,
+                    product_reviews,
+                    keep_existing=args.keep_existing,
+                    writer=writer,
+                    journal=journal,
+                    annotation_schema=args.annotation_schema,
+                )
+                stage["records"] = review_stats.documents
+            write_stats = [product_stats, review_stats]
+        with metrics.stage("index_build") as stage:
+            built_indexes = finalize_indexes(db)
+            stage["records"] = sum(len(names) for names, _ in built_indexes.values())
+
+    report_write_stats(write_stats)
+    report_indexes(built_indexes, deferred)
+    print_import_summary(product_reviews, product_documents)
 
-    print("\n✅ データ投入が完了しました。概要:")
-    for config in PRODUCT_CONFIGS:
-        reviews = product_reviews[config["id"]]
-        positives = sum(1 for review in reviews if review["sentiment"] == "positive")
-        negatives = sum(1 for review in reviews if review["sentiment"] == "negative")
-        name = product_documents.get(config["id"], {}).get("name", config["slug"])
-        print(f"  - {name}: {len(reviews)}件 (positive {positives}, negative {negatives})")
-    print("\nMongoDBでデータが利用可能になりました。")
+
+def main() -> None:
+    args = parse_args()
+    if args.products is not None:
+        use_product_catalog(args.products)
+
+    metrics = ImportMetrics(enabled=args.profile or args.profile_dir is not None)
+    if args.profiler == "pyinstrument" and pyinstrument is None:
+        raise SystemExit("pyinstrumentがインストールされていません。pip install pyinstrumentを実行してください。")
+    profiler = None
+    if args.profiler == "cprofile":
+        profiler = cProfile.Profile()
+        profiler.enable()
+    elif args.profiler == "pyinstrument":
+        profiler = pyinstrument.Profiler()
+        profiler.start()
+
+    try:
+        run_import(args, metrics)
+    finally:
+        if profiler is not None:
+            if args.profiler == "cprofile":
+                profiler.disable()
+            else:
+                profiler.stop()
+        if metrics.enabled:
+            metrics.report()
+        if args.profile_dir is not None:
+            args.profile_dir.mkdir(parents=True, exist_ok=True)
+            summary_path = args.profile_dir / "import_profile.json"
+            summary_path.write_text(json.dumps(metrics.to_dict(), ensure_ascii=False, indent=2), encoding="utf-8")
+            print(f"💾 プロファイルの概要を保存しました: {summary_path}")
+            if args.profiler == "cprofile":
+                dump_path = args.profile_dir / "import_profile.prof"
+                profiler.dump_stats(str(dump_path))
+                print(f"💾 cProfileの結果を保存しました: {dump_path}")
+            elif args.profiler == "pyinstrument":
+                dump_path = args.profile_dir / "import_profile.html"
+                dump_path.write_text(profiler.output_html(), encoding="utf-8")
+                print(f"💾 pyinstrumentの結果を保存しました: {dump_path}")
 
 
 if __name__ == "__main__":
@@ -566,4 +667,3 @@ if __name__ == "__main__":
     except Exception as exc:
         print(f"❌ エラー: {exc}", file=sys.stderr)
         sys.exit(1)
-
@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""
+reviewsコレクションの文ごとのアノテーション件数を、import_reviews.pyの--annotation-schemaで選べる
+別の形式（embedded/array/counts）にその場で書き換える移行スクリプト。
+
+レビューを_id順にカーソルで読み、件数を保ったまま文を書き換えてバッチでbulk_writeするため、
+件数によらずメモリは一定。読み込み後にアプリが件数を更新したレビューは上書きせずに残すので、
+中断した場合や更新と重なった場合は再実行すれば、移行済みのレビューを飛ばして残りだけを移行する。
+終了時に、移行前後の平均文書サイズを比較したレポートを表示する。--measure-updatesを指定すると、
+サンプルしたレビューを作業用のコレクションに写して、移行前後の形式での件数更新のレイテンシも比較する。
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+
+try:
+    from dotenv import load_dotenv  # type: ignore
+except ImportError:  # pragma: no cover - optional dependency
+    load_dotenv = None
+
+from bson import encode as bson_encode
+from pymongo import MongoClient, UpdateOne
+
+from review_import.documents import (
+    ANNOTATION_SCHEMAS,
+    ANNOTATION_TYPES,
+    annotation_increment,
+    convert_sentence_annotations,
+    sentence_annotation_schema,
+)
+from review_import.indexes import index_models
+from review_import.mongo import COLLECTION_REVIEWS, mongo_client_options
+from review_import.writer import BulkWriter, report_write_stats
+
+if load_dotenv is not None:
+    load_dotenv()
+
+sys.stdout.reconfigure(encoding="utf-8", errors="ignore")
+
+PERCENTILES = (50, 95)
+# 件数更新のレイテンシを測るときに、サンプルしたレビューを写す作業用のコレクション
+SCRATCH_COLLECTION = f"{COLLECTION_REVIEWS}_latency_scratch"
+
+
+class MigrationStats:
+    """走査したレビューの件数と、移行前後のBSONサイズの合計"""
+
+    def __init__(self) -> None:
+        self.scanned = 0
+        self.converted = 0
+        self.unchanged = 0
+        self.skipped: List[str] = []
+        self.bytes_before = 0
+        self.bytes_after = 0
+
+    def average_sizes(self) -> Tuple[float, float]:
+        scanned = max(self.scanned, 1)
+        return self.bytes_before / scanned, self.bytes_after / scanned
+
+
+def migration_operations(
+    documents: Iterable[Dict[str, object]],
+    annotation_schema: str,
+    stats: MigrationStats
+) -> Iterable[UpdateOne]:
+    for document in documents:
+        stats.scanned += 1
+        sentences = document.get("sentences") or []
+        size = len(bson_encode(document))
+        stats.bytes_before += size
+        if all(sentence_annotation_schema(sentence) in (annotation_schema, None) for sentence in sentences):
+            stats.unchanged += 1
+            stats.bytes_after += size
+            continue
+        try:
+            converted = [convert_sentence_annotations(sentence, annotation_schema) for sentence in sentences]
+        except ValueError as exc:
+            stats.skipped.append(f"{document.get('reviewId', document['_id'])}: {exc}")
+            stats.bytes_after += size
+            continue
+        stats.converted += 1
+        stats.bytes_after += len(bson_encode({**document, "sentences": converted}))
+        # 読み込み後に件数が更新されたレビューには一致しないので、その更新を上書きしない
+        yield UpdateOne({"_id": document["_id"], "sentences": sentences}, {"$set": {"sentences": converted}})
+
+
+def sample_documents(db, count: int) -> List[Dict[str, object]]:
+    """件数更新のレイテンシを測るレビュー。移行前後で同じレビューを測る"""
+    cursor = db[COLLECTION_REVIEWS].find({"sentences.0": {"$exists": True}}, limit=count)
+    return list(cursor)
+
+
+def measure_update_latency(
+    db,
+    documents: List[Dict[str, object]],
+    annotation_schema: str | None = None
+) -> List[float]:
+    """アプリと同じ形の件数の+1更新の所要時間（ミリ秒）
+
+    reviewsの件数は書き換えず、サンプルしたレビューを（annotation_schemaを指定すればその形式に変換して）
+    文IDのインデックスを張った作業用のコレクションに写して測り、終わったらコレクションごと削除する。
+    """
+    scratch = db[SCRATCH_COLLECTION]
+    scratch.drop()
+    try:
+        copies = []
+        for document in documents:
+            sentences = document["sentences"]
+            if annotation_schema is not None:
+                try:
+                    sentences = [convert_sentence_annotations(sentence, annotation_schema) for sentence in sentences]
+                except ValueError:
+                    continue
+            copies.append({**document, "sentences": sentences})
+        if not copies:
+            return []
+        scratch.insert_many(copies)
+        scratch.create_indexes(index_models(COLLECTION_REVIEWS, ["sentences.id_1"]))
+
+        latencies = []
+        for index, document in enumerate(copies):
+            sentence = document["sentences"][0]
+            schema = sentence_annotation_schema(sentence)
+            if schema is None:
+                continue
+            ann_type = ANNOTATION_TYPES[index % len(ANNOTATION_TYPES)]
+            query, update, array_filters = annotation_increment(sentence["id"], ann_type, schema)
+            started = time.perf_counter()
+            scratch.update_one(query, update, array_filters=array_filters)
+            latencies.append((time.perf_counter() - started) * 1000)
+        return latencies
+    finally:
+        scratch.drop()
+
+
+def detect_schema(db) -> str:
+    document = db[COLLECTION_REVIEWS].find_one({"sentences.0": {"$exists": True}}, {"sentences": {"$slice": 1}})
+    schema = sentence_annotation_schema(document["sentences"][0]) if document else None
+    return schema or "embedded"
+
+
+def summarize_latencies(latencies: List[float]) -> Dict[str, float]:
+    if not latencies:
+        return {}
+    ordered = sorted(latencies)
+    summary = {"mean": sum(ordered) / len(ordered)}
+    for percentile in PERCENTILES:
+        summary[f"p{percentile}"] = ordered[min(len(ordered) - 1, int(len(ordered) * percentile / 100))]
+    return summary
+
+
+def format_latency(summary: Dict[str, float]) -> str:
+    if not summary:
+        return "計測なし"
+    percentiles = " ".join(f"p{percentile} {summary[f'p{percentile}']:.2f}ms" for percentile in PERCENTILES)
+    return f"平均{summary['mean']:.2f}ms {percentiles}"
+
+
+def print_report(report: Dict[str, object]) -> None:
+    before, after = report["averageSize"]["before"], report["averageSize"]["after"]
+    change = (after / before - 1) * 100 if before else 0.0
+    print(f"\n📊 移行レポート（{report['from']} → {report['to']}）:")
+    print(
+        f"  - レビュー: {report['scanned']}件を走査, {report['converted']}件を移行, "
+        f"{report['unchanged']}件は移行済み, {len(report['skipped'])}件をスキップ"
+    )
+    print(f"  - 平均文書サイズ: {before:,.0f} → {after:,.0f} バイト（{change:+.1f}%）")
+    print(f"  - 件数更新のレイテンシ（移行前）: {format_latency(report['updateLatency']['before'])}")
+    print(f"  - 件数更新のレイテンシ（移行後）: {format_latency(report['updateLatency']['after'])}")
+    for message in report["skipped"][:5]:
+        print(f"  ⚠️  {message}")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="reviewsの文ごとのアノテーション件数を別の形式に移行します。")
+    parser.add_argument("--to", choices=ANNOTATION_SCHEMAS, required=True, help="移行先の形式")
+    parser.add_argument("--batch-size", type=int, default=500, help="bulk_writeの1バッチあたりのレビュー数")
+    parser.add_argument("--writers", type=int, default=4, help="書き込みスレッド数")
+    parser.add_argument("--max-retries", type=int, default=5, help="一時的なエラーで失敗したバッチを再送する最大回数")
+    parser.add_argument("--limit", type=int, default=0, help="走査するレビュー数の上限（0: すべて。試験的な移行用）")
+    parser.add_argument("--dry-run", action="store_true", help="書き込まずに、移行後のサイズだけを見積もります")
+    parser.add_argument(
+        "--measure-updates",
+        type=int,
+        default=0,
+        help=(
+            "件数更新のレイテンシを移行前後の形式で測るレビューの数（既定: 0で計測しません）。"
+            "reviewsは書き換えず、作業用のコレクションに写して測ります"
+        ),
+    )
+    parser.add_argument("--report", type=Path, default=None, help="レポートをJSONで保存するパス")
+    parser.add_argument(
+        "--mongodb-uri",
+        default=os.environ.get("MONGODB_URI"),
+        help="MongoDBの接続URI（未指定時は環境変数MONGODB_URI）",
+    )
+    parser.add_argument(
+        "--mongodb-db",
+        default=os.environ.get("MONGODB_DB_NAME", "review-system"),
+        help="MongoDBのデータベース名（未指定時は環境変数MONGODB_DB_NAMEまたはreview-system）",
+    )
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    if not args.mongodb_uri:
+        raise SystemExit("MongoDBの接続URIが指定されていません。--mongodb-uriまたは環境変数MONGODB_URIを設定してください。")
+    mongodb_uri = args.mongodb_uri.strip().strip('"').strip("'")
+    mongodb_db = args.mongodb_db.strip().strip('"').strip("'")
+
+    with MongoClient(mongodb_uri, **mongo_client_options(mongodb_uri)) as client:
+        db = client[mongodb_db]
+        source_schema = detect_schema(db)
+        samples = sample_documents(db, args.measure_updates) if args.measure_updates > 0 else []
+        latency_before = measure_update_latency(db, samples) if samples else []
+
+        print(f"🔁 reviewsのアノテーション件数を{source_schema}から{args.to}に移行しています...")
+        stats = MigrationStats()
+        cursor = db[COLLECTION_REVIEWS].find(
+            {}, sort=[("_id", 1)], batch_size=args.batch_size, limit=max(args.limit, 0)
+        )
+        operations = migration_operations(cursor, args.to, stats)
+        if args.dry_run:
+            for _ in operations:
+                pass
+            write_stats = None
+        else:
+            writer = BulkWriter(
+                db, batch_size=args.batch_size, workers=args.writers, max_retries=args.max_retries
+            )
+            write_stats = writer.write(COLLECTION_REVIEWS, operations, label="reviews (migrate)")
+
+        latency_after = measure_update_latency(db, samples, args.to) if samples else []
+
+    if write_stats is not None:
+        report_write_stats([write_stats])
+    average_before, average_after = stats.average_sizes()
+    report = {
+        "from": source_schema,
+        "to": args.to,
+        "dryRun": args.dry_run,
+        "scanned": stats.scanned,
+        "converted": stats.converted,
+        "unchanged": stats.unchanged,
+        "skipped": stats.skipped,
+        "averageSize": {"before": average_before, "after": average_after},
+        "updateLatency": {"before": summarize_latencies(latency_before), "after": summarize_latencies(latency_after)},
+    }
+    print_report(report)
+    if args.report is not None:
+        args.report.parent.mkdir(parents=True, exist_ok=True)
+        args.report.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"💾 レポートを保存しました: {args.report}")
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception as exc:
+        print(f"❌ エラー: {exc}", file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1 @@
+"""import_reviews.pyと各スクリプトが共有する、レビューデータの読み込み・構築・MongoDBへの書き込みの部品"""
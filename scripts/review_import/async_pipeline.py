@@ -0,0 +1,328 @@
+"""--pipeline async: 読み込み・マッチング・構築・書き込みを上限付きキューで並行に実行する"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+try:
+    from pymongo import AsyncMongoClient
+except ImportError:  # pragma: no cover - PyMongo 4.9未満
+    AsyncMongoClient = None
+
+from pymongo import MongoClient
+from pymongo.errors import BulkWriteError, PyMongoError
+
+from . import catalog
+from .catalog import match_review_to_product
+from .decoders import JsonlDecoder, ReviewRecord, iter_records
+from .documents import (
+    ProductAnalysis,
+    ReviewBuildTask,
+    ReviewDocument,
+    _build_review_chunk,
+    analyze_product_reviews,
+    assemble_product_documents,
+)
+from .metrics import ImportMetrics
+from .mongo import (
+    COLLECTION_PRODUCTS,
+    COLLECTION_REVIEWS,
+    DUPLICATE_KEY_ERROR,
+    RETRY_MAX_DELAY,
+    is_transient_error,
+    mongo_client_options,
+)
+from .selection import RecordSelector, _selection_size, ensure_records_sufficient
+from .text import classify_sentiment
+from .writer import WriteStats, product_upsert_operations
+
+
+class StageStats:
+    """非同期パイプラインの各ステージの処理時間（キュー待ちを除く）と件数"""
+
+    def __init__(self, name: str, workers: int = 1) -> None:
+        self.name = name
+        self.workers = workers
+        self.busy = 0.0
+        self.items = 0
+
+    def summary(self, wall: float) -> str:
+        utilization = self.busy / max(wall * self.workers, 1e-9) * 100
+        return f"{self.name}: {self.items}件, 稼働{self.busy:.2f}秒 (稼働率{utilization:.0f}%)"
+
+
+class _AsyncReviewStore:
+    """AsyncMongoClientがあればそれを、なければ同期クライアントをスレッド経由で使う"""
+
+    def __init__(
+        self,
+        mongodb_uri: str,
+        mongodb_db: str,
+        client_options: Dict[str, object],
+        metrics: ImportMetrics | None = None
+    ) -> None:
+        self.metrics = metrics if metrics is not None and metrics.enabled else None
+        self.native = AsyncMongoClient is not None
+        if self.native:
+            self.client = AsyncMongoClient(mongodb_uri, **client_options)
+        else:
+            self.client = MongoClient(mongodb_uri, **client_options)
+        self.db = self.client[mongodb_db]
+
+    async def call(self, collection_name: str | None, method: str, *args, **kwargs):
+        target = self.client.admin if collection_name is None else self.db[collection_name]
+        started = time.perf_counter()
+        try:
+            if self.native:
+                return await getattr(target, method)(*args, **kwargs)
+            return await asyncio.to_thread(getattr(target, method), *args, **kwargs)
+        finally:
+            if self.metrics is not None:
+                self.metrics.record_call(f"{collection_name or 'admin'}.{method}", time.perf_counter() - started)
+
+    async def close(self) -> None:
+        if self.native:
+            await self.client.close()
+        else:
+            self.client.close()
+
+
+def _take(iterator, size: int) -> list:
+    chunk = []
+    for item in iterator:
+        chunk.append(item)
+        if len(chunk) >= size:
+            break
+    return chunk
+
+
+def _match_chunk(
+    chunk: List[ReviewRecord],
+    selector: RecordSelector,
+    products: Dict[str, Dict[str, object]]
+) -> Tuple[List[ReviewBuildTask], bool]:
+    tasks: List[ReviewBuildTask] = []
+    for record in chunk:
+        sentiment = classify_sentiment(record.label)
+        if sentiment is None:
+            continue
+        matched_product_id = match_review_to_product(record)
+        review_index = selector.offer(record, sentiment, matched_product_id)
+        if review_index is None:
+            continue
+        tasks.append((record, products[matched_product_id], review_index, sentiment))
+        if selector.complete:
+            return tasks, True
+    return tasks, False
+
+
+async def _gather_or_cancel(*coroutines) -> None:
+    """すべてのコルーチンを並行に実行し、どれかが失敗したら残りをキャンセルして終了を待ってから送出する
+
+    asyncio.gatherは最初の例外を送出した時点で他のタスクを動かしたままにするため、
+    呼び出し側がストアを閉じた後も書き込みが続いてしまう。
+    """
+    tasks = [asyncio.ensure_future(coroutine) for coroutine in coroutines]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+    finally:
+        # 終了済みのタスクへのcancelは何もしない。呼び出し側がキャンセルされた場合も子タスクを残さない
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    for task in tasks:
+        if not task.cancelled() and task.exception() is not None:
+            raise task.exception()
+
+
+async def run_async_pipeline(
+    args: argparse.Namespace,
+    dataset_paths: Dict[str, Path],
+    mongodb_uri: str,
+    mongodb_db: str,
+    decoder: JsonlDecoder | None = None,
+    queue_size: int = 8,
+    chunk_size: int = 2000,
+    metrics: ImportMetrics | None = None
+) -> Tuple[Dict[str, List[ReviewDocument]], Dict[str, Dict[str, object]], List[WriteStats]]:
+    """読み込み→マッチング→構築→書き込みを上限付きキューでつないで並行に実行する
+
+    各キューに載るのは最大queue_sizeチャンクまでなので、遅いステージがあると前段が待たされ、
+    メモリ使用量は一定に保たれる。採用されたレビューは選択の完了を待たずに構築するが、書き込みは
+    選択が終わって全商品の件数が足りると確かめ、既存レビューを削除してから始める。
+    不足していれば既存のデータに触れずに失敗する。
+    """
+    loop = asyncio.get_running_loop()
+    products = {str(product["id"]): product for product in catalog.PRODUCT_CONFIGS}
+    selector = RecordSelector(args.per_sentiment, args.seed)
+    now = datetime.now(timezone.utc)
+    stop = asyncio.Event()
+    writable = asyncio.Event()
+    records_queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+    tasks_queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+    documents_queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+    writers = max(1, args.writers)
+    stages = {
+        "read": StageStats("読み込み"),
+        "match": StageStats("マッチング"),
+        "build": StageStats("構築"),
+        "write": StageStats("書き込み", workers=writers),
+    }
+    review_stats = WriteStats("reviews")
+    product_reviews: Dict[str, List[ReviewDocument]] = {product_id: [] for product_id in products}
+    selection_counts = {"backfilled": 0}
+
+    store = _AsyncReviewStore(mongodb_uri, mongodb_db, mongo_client_options(mongodb_uri), metrics)
+    build_executor = ProcessPoolExecutor(max_workers=args.build_workers) if args.build_workers > 1 else None
+
+    async def reader() -> None:
+        iterator = iter(iter_records(dataset_paths, decoder))
+        while not stop.is_set():
+            started = time.perf_counter()
+            chunk = await asyncio.to_thread(_take, iterator, chunk_size)
+            stages["read"].busy += time.perf_counter() - started
+            if not chunk:
+                break
+            stages["read"].items += len(chunk)
+            await records_queue.put(chunk)
+        await records_queue.put(None)
+
+    async def matcher() -> None:
+        while True:
+            chunk = await records_queue.get()
+            if chunk is None:
+                break
+            if stop.is_set():
+                # 全商品の枠が埋まった後は読み込み済みのチャンクを捨てるだけ
+                continue
+            started = time.perf_counter()
+            build_tasks, complete = await asyncio.to_thread(_match_chunk, chunk, selector, products)
+            stages["match"].busy += time.perf_counter() - started
+            stages["match"].items += len(chunk)
+            if complete:
+                stop.set()
+            if build_tasks:
+                await tasks_queue.put(build_tasks)
+        backfilled = [
+            (record, products[product_id], review_index, sentiment)
+            for product_id, sentiment, record, review_index in selector.finish()
+        ]
+        selection_counts["backfilled"] = len(backfilled)
+        # 既存のレビューを消してから不足で失敗しないよう、最初の書き込みより前に件数を確かめる
+        ensure_records_sufficient(selector.selected, args.per_sentiment)
+        if not args.keep_existing:
+            await store.call(COLLECTION_REVIEWS, "delete_many", {"productId": {"$in": list(products.keys())}})
+        writable.set()
+        if backfilled:
+            await tasks_queue.put(backfilled)
+        await tasks_queue.put(None)
+
+    async def builder() -> None:
+        while True:
+            build_tasks = await tasks_queue.get()
+            if build_tasks is None:
+                break
+            started = time.perf_counter()
+            documents = await loop.run_in_executor(
+                build_executor, _build_review_chunk, build_tasks, args.seed, now, args.metadata_generator
+            )
+            stages["build"].busy += time.perf_counter() - started
+            stages["build"].items += len(documents)
+            await documents_queue.put(documents)
+        for _ in range(writers):
+            await documents_queue.put(None)
+
+    jitter = random.Random()
+
+    async def flush(batch: List[ReviewDocument]) -> None:
+        started = time.perf_counter()
+        documents = [review.to_document(args.annotation_schema) for review in batch]
+        # BulkWriterと同じく、一時的なエラーは指数バックオフで同じ文書列を再送する
+        # （挿入済みの文書は同じ_idの重複として成功扱いになる）
+        for attempt in range(args.max_retries + 1):
+            try:
+                await store.call(COLLECTION_REVIEWS, "insert_many", documents, ordered=False)
+            except BulkWriteError as exc:
+                for error in exc.details.get("writeErrors", []):
+                    if error.get("code") != DUPLICATE_KEY_ERROR:
+                        review_stats.fail(str(error.get("errmsg", error)))
+            except PyMongoError as exc:
+                if attempt >= args.max_retries or not is_transient_error(exc):
+                    raise
+                review_stats.retry()
+                delay = min(RETRY_MAX_DELAY, args.retry_delay * 2 ** attempt)
+                await asyncio.sleep(delay * jitter.uniform(0.5, 1.0))
+                continue
+            break
+        elapsed = time.perf_counter() - started
+        stages["write"].busy += elapsed
+        stages["write"].items += len(batch)
+        review_stats.record(len(batch), elapsed)
+
+    async def writer() -> None:
+        buffer: List[ReviewDocument] = []
+        while True:
+            documents = await documents_queue.get()
+            if documents is None:
+                break
+            for document in documents:
+                product_reviews[document.product_id].append(document)
+            buffer.extend(documents)
+            # 書き込めるようになるまでは溜めておく（文書はproduct_reviewsにも保持しているので増える量は同じ）
+            while writable.is_set() and len(buffer) >= args.batch_size:
+                batch, buffer = buffer[:args.batch_size], buffer[args.batch_size:]
+                await flush(batch)
+        await writable.wait()
+        for start in range(0, len(buffer), args.batch_size):
+            await flush(buffer[start:start + args.batch_size])
+
+    try:
+        try:
+            await store.call(None, "command", "ping")
+            print("✅ MongoDB接続を確認しました")
+        except Exception as e:
+            print(f"⚠️  MongoDB接続テストに失敗しました: {e}")
+            print("接続を続行しますが、エラーが発生する可能性があります...")
+
+        started = time.perf_counter()
+        await _gather_or_cancel(reader(), matcher(), builder(), *(writer() for _ in range(writers)))
+        wall = time.perf_counter() - started
+        review_stats.finish()
+
+        if metrics is not None:
+            metrics.count("matched", _selection_size(selector.selected) - selection_counts["backfilled"])
+            metrics.count("backfilled", selection_counts["backfilled"])
+
+        analyses: Dict[str, Tuple[Dict[str, object], ProductAnalysis]] = {}
+        for config in catalog.PRODUCT_CONFIGS:
+            reviews = product_reviews[config["id"]]
+            # 並行に書き込んだ順ではなく、逐次版と同じレビュー番号順に並べてから商品情報を作る
+            reviews.sort(key=lambda review: review.review_index)
+            if reviews:
+                analyses[config["id"]] = (config, analyze_product_reviews(config, reviews))
+        product_documents = assemble_product_documents(analyses, args.seed, args.metadata_generator)
+
+        product_stats = WriteStats("products")
+        product_started = time.perf_counter()
+        operations = product_upsert_operations(product_documents)
+        if operations:
+            await store.call(COLLECTION_PRODUCTS, "bulk_write", operations, ordered=False)
+            product_stats.record(len(operations), time.perf_counter() - product_started)
+        product_stats.finish()
+    finally:
+        if build_executor is not None:
+            build_executor.shutdown()
+        await store.close()
+
+    print("\n⏱️  パイプラインの各ステージ:")
+    for stage in stages.values():
+        print(f"  - {stage.summary(wall)}")
+    print(f"  - 全体: {wall:.2f}秒（各ステージの稼働時間の合計 {sum(stage.busy for stage in stages.values()):.2f}秒）")
+    return product_reviews, product_documents, [product_stats, review_stats]
@@ -0,0 +1,240 @@
+"""前処理済みデータセットの列指向キャッシュ"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import mmap
+import os
+import shutil
+from array import array
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from . import catalog
+from .catalog import get_keyword_matcher
+from .dataset import _file_fingerprint
+from .decoders import JsonlDecoder, ReviewRecord, iter_dataset
+
+
+CACHE_VERSION = 1
+
+
+def _catalog_fingerprint(product_configs: List[Dict[str, object]]) -> str:
+    payload = json.dumps(product_configs, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _keyword_fingerprint(product_configs: List[Dict[str, object]]) -> str:
+    payload = [[product["id"], list(product["keywords"])] for product in product_configs]
+    return hashlib.sha256(json.dumps(payload, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class ReviewCache:
+    """前処理済みデータセットの列指向キャッシュ
+
+    ラベル・分割・マッチした商品などの列と、データセットID・本文を連結したblobを
+    個別のバイナリファイルとして保存し、読み出し時はmmapで必要な部分だけ参照する。
+    キャッシュは元のJSONLファイルのサイズ・更新時刻・SHA-256と商品キーワードに紐付く。
+    """
+
+    # 列名: (ファイル名, arrayの型コード)
+    COLUMNS = {
+        "labels": ("labels.bin", "b"),
+        "splits": ("splits.bin", "B"),
+        "matched": ("matched.bin", "i"),
+        "id_offsets": ("id_offsets.bin", "q"),
+        "text_offsets": ("text_offsets.bin", "q"),
+        "hit_offsets": ("hit_offsets.bin", "q"),
+        "hit_products": ("hit_products.bin", "i"),
+        "hit_counts": ("hit_counts.bin", "B"),
+    }
+    BLOBS = {"ids": "ids.bin", "text": "text.bin"}
+    MANIFEST = "manifest.json"
+
+    def __init__(self, directory: Path, manifest: Dict[str, object]) -> None:
+        self.directory = directory
+        self.manifest = manifest
+        self.splits: List[str] = list(manifest["splits"])
+        self.product_ids: List[str] = list(manifest["products"])
+        self._maps: List[mmap.mmap] = []
+        self._views: List[memoryview] = []
+        self._columns = {
+            name: self._map(filename).cast(typecode) for name, (filename, typecode) in self.COLUMNS.items()
+        }
+        self._blobs = {name: self._map(filename) for name, filename in self.BLOBS.items()}
+
+    def _map(self, filename: str) -> memoryview:
+        path = self.directory / filename
+        if path.stat().st_size == 0:
+            return memoryview(b"")
+        with path.open("rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(mapped)
+        self._maps.append(mapped)
+        self._views.append(view)
+        return view
+
+    def close(self) -> None:
+        for view in list(self._columns.values()) + self._views:
+            view.release()
+        for mapped in self._maps:
+            mapped.close()
+        self._maps.clear()
+        self._views.clear()
+
+    def __len__(self) -> int:
+        return len(self._columns["labels"])
+
+    def column(self, name: str) -> memoryview:
+        """列をゼロコピーのmemoryviewとして返す（numpyがあればnp.frombufferでそのまま配列化できる）"""
+        return self._columns[name]
+
+    def label(self, index: int) -> int:
+        return self._columns["labels"][index]
+
+    def split(self, index: int) -> str:
+        return self.splits[self._columns["splits"][index]]
+
+    def dataset_id(self, index: int) -> str:
+        offsets = self._columns["id_offsets"]
+        return str(self._blobs["ids"][offsets[index]:offsets[index + 1]], "utf-8")
+
+    def text(self, index: int) -> str:
+        offsets = self._columns["text_offsets"]
+        return str(self._blobs["text"][offsets[index]:offsets[index + 1]], "utf-8")
+
+    def matched_product(self, index: int) -> str | None:
+        product_index = self._columns["matched"][index]
+        return self.product_ids[product_index] if product_index >= 0 else None
+
+    def product_hits(self, index: int) -> Dict[str, int]:
+        offsets = self._columns["hit_offsets"]
+        products = self._columns["hit_products"]
+        counts = self._columns["hit_counts"]
+        return {
+            self.product_ids[products[pos]]: counts[pos] for pos in range(offsets[index], offsets[index + 1])
+        }
+
+    def record(self, index: int) -> ReviewRecord:
+        """iter_recordsと同じ形のレコードを復元する"""
+        return ReviewRecord(self.dataset_id(index), self.text(index), self.label(index), self.split(index))
+
+    @classmethod
+    def open(cls, directory: Path, dataset_paths: Dict[str, Path]) -> "ReviewCache | None":
+        """キャッシュが元データと商品キーワードに一致する場合のみ開く"""
+        manifest_path = directory / cls.MANIFEST
+        if not manifest_path.exists():
+            return None
+        try:
+            manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        if manifest.get("version") != CACHE_VERSION:
+            return None
+        if manifest.get("keywords") != _keyword_fingerprint(catalog.PRODUCT_CONFIGS):
+            return None
+        if manifest.get("splits") != list(dataset_paths.keys()):
+            return None
+
+        refreshed = False
+        for split, path in dataset_paths.items():
+            stored = manifest["sources"][split]
+            if not path.exists():
+                return None
+            current = _file_fingerprint(path, with_hash=False)
+            if current["size"] != stored["size"]:
+                return None
+            if current["mtime_ns"] != stored["mtime_ns"]:
+                # 再ダウンロードなどで更新時刻だけが変わった場合は内容のハッシュで判定する
+                if _file_fingerprint(path)["sha256"] != stored["sha256"]:
+                    return None
+                stored["mtime_ns"] = current["mtime_ns"]
+                refreshed = True
+        if refreshed:
+            manifest_path.write_text(json.dumps(manifest, ensure_ascii=False, indent=2), encoding="utf-8")
+        return cls(directory, manifest)
+
+    @classmethod
+    def build(
+        cls,
+        directory: Path,
+        dataset_paths: Dict[str, Path],
+        decoder: JsonlDecoder | None = None
+    ) -> "ReviewCache":
+        """JSONLを1回走査して列ファイルを作り、一時ディレクトリから置き換える"""
+        matcher = get_keyword_matcher()
+        splits = list(dataset_paths.keys())
+        split_index = {split: idx for idx, split in enumerate(splits)}
+        product_ids = [str(product["id"]) for product in catalog.PRODUCT_CONFIGS]
+        product_index = {product_id: idx for idx, product_id in enumerate(product_ids)}
+        columns = {name: array(typecode) for name, (_, typecode) in cls.COLUMNS.items()}
+        for name in ("id_offsets", "text_offsets", "hit_offsets"):
+            columns[name].append(0)
+
+        tmp_dir = directory.with_name(directory.name + ".tmp")
+        if tmp_dir.exists():
+            shutil.rmtree(tmp_dir)
+        tmp_dir.mkdir(parents=True)
+
+        id_offset = 0
+        text_offset = 0
+        with (tmp_dir / cls.BLOBS["ids"]).open("wb") as ids_blob, (tmp_dir / cls.BLOBS["text"]).open("wb") as text_blob:
+            for split, record in iter_dataset(dataset_paths, decoder):
+                text = str(record.get("text", ""))
+                encoded_id = str(record["id"]).encode("utf-8")
+                encoded_text = text.encode("utf-8")
+                ids_blob.write(encoded_id)
+                text_blob.write(encoded_text)
+                id_offset += len(encoded_id)
+                text_offset += len(encoded_text)
+
+                hits = matcher.count(text)["product"]
+                for product_id, count in hits.items():
+                    columns["hit_products"].append(product_index[product_id])
+                    columns["hit_counts"].append(min(count, 255))
+                best = max(hits.items(), key=lambda x: x[1])[0] if hits else None
+
+                columns["labels"].append(int(record["label"]))
+                columns["splits"].append(split_index[split])
+                columns["matched"].append(product_index[best] if best is not None else -1)
+                columns["id_offsets"].append(id_offset)
+                columns["text_offsets"].append(text_offset)
+                columns["hit_offsets"].append(len(columns["hit_products"]))
+
+        for name, (filename, _) in cls.COLUMNS.items():
+            with (tmp_dir / filename).open("wb") as f:
+                columns[name].tofile(f)
+
+        manifest = {
+            "version": CACHE_VERSION,
+            "splits": splits,
+            "products": product_ids,
+            "keywords": _keyword_fingerprint(catalog.PRODUCT_CONFIGS),
+            "records": len(columns["labels"]),
+            "sources": {split: _file_fingerprint(path) for split, path in dataset_paths.items()},
+        }
+        (tmp_dir / cls.MANIFEST).write_text(json.dumps(manifest, ensure_ascii=False, indent=2), encoding="utf-8")
+
+        if directory.exists():
+            shutil.rmtree(directory)
+        os.replace(tmp_dir, directory)
+        return cls(directory, manifest)
+
+    @classmethod
+    def open_or_build(
+        cls,
+        directory: Path,
+        dataset_paths: Dict[str, Path],
+        decoder: JsonlDecoder | None = None
+    ) -> Tuple["ReviewCache", bool]:
+        """有効なキャッシュがあれば開き、なければ作り直す。作り直したかどうかも返す"""
+        cache = cls.open(directory, dataset_paths)
+        if cache is not None:
+            return cache, False
+        return cls.build(directory, dataset_paths, decoder), True
+
+
+def default_cache_dir(data_dir: Path) -> Path:
+    """--data-dirと同じ階層に置くキャッシュディレクトリ"""
+    return data_dir.with_name(data_dir.name + ".cache")
@@ -0,0 +1,278 @@
+"""商品カタログとキーワード照合（PRODUCT_CONFIGSは--productsで置き換わるため、catalog.PRODUCT_CONFIGSとして参照する）"""
+
+from __future__ import annotations
+
+import json
+import os
+import queue
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+
+from .decoders import ReviewRecord
+
+
+PRODUCT_CONFIGS = [
+    {
+        "id": "prod-001",
+        "slug": "wireless-earbuds-pro",
+        "category": "家電・カメラ",
+        "image": "https://images.unsplash.com/photo-1590658268037-6bf12165a8df?w=400",
+        "keywords": ["イヤホン", "ヘッドホン", "ワイヤレス", "音質", "ノイズ"]
+    },
+    {
+        "id": "prod-002",
+        "slug": "smart-watch-x1",
+        "category": "家電・カメラ",
+        "image": "https://images.unsplash.com/photo-1523275335684-37898b6baf30?w=400",
+        "keywords": ["スマートウォッチ", "腕時計", "心拍", "睡眠", "フィットネス"]
+    },
+    {
+        "id": "prod-003",
+        "slug": "mechanical-keyboard-rgb",
+        "category": "パソコン・周辺機器",
+        "image": "https://images.unsplash.com/photo-1587829741301-dc798b83add3?w=400",
+        "keywords": ["キーボード", "タイピング", "キー", "打鍵", "メカニカル"]
+    }
+]
+
+CATEGORY_KEYWORDS = {
+    "家電・カメラ": ["充電", "電源", "バッテリー", "イヤホン", "ヘッドホン", "スピーカー", "カメラ", "レンズ", "テレビ", "冷蔵庫", "洗濯機"],
+    "パソコン・周辺機器": ["キーボード", "マウス", "モニター", "PC", "パソコン", "ノート", "タブレット", "USB", "ケーブル", "充電器"],
+    "スマートフォン・タブレット": ["iPhone", "Android", "スマホ", "スマートフォン", "タブレット", "アプリ", "画面", "タッチ"],
+    "ホビー・ゲーム": ["ゲーム", "プレイ", "コントローラー", "ソフト", "フィギュア", "プラモデル"],
+    "本・雑誌・コミック": ["本", "書籍", "雑誌", "コミック", "マンガ", "小説"],
+    "食品・飲料": ["食べ", "飲み", "味", "おいしい", "まずい", "料理", "レシピ"],
+    "ファッション": ["服", "靴", "バッグ", "アクセサリー", "サイズ", "着用"],
+    "美容・健康": ["化粧", "スキンケア", "シャンプー", "歯磨き", "サプリメント"],
+}
+
+# --productsの代わりに商品カタログのパスを指定する環境変数（ワーカープロセスにも引き継ぐ）
+PRODUCT_CATALOG_ENV = "PRODUCT_CATALOG"
+
+
+KeywordHits = Dict[str, Dict[str, int]]
+
+
+def _fold_case(text: str) -> str:
+    """文字数を保ったまま小文字化する（小文字化で文字数が変わる文字はそのまま残す）"""
+    lowered = text.lower()
+    if len(lowered) == len(text):
+        return lowered
+    return "".join(char.lower() if len(char.lower()) == 1 else char for char in text)
+
+
+class KeywordMatcher:
+    """商品・カテゴリのキーワードを1回の走査で数えるAho-Corasickオートマトン
+
+    各キーワードは所属グループ（"product"/"category"）とキー（商品ID・カテゴリ名）を持ち、
+    テキスト中に現れたキーワードの種類数をグループ・キーごとに返す。
+    大文字小文字を区別しないキーワードは小文字化したテキストに対して照合する。
+    """
+
+    def __init__(self) -> None:
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._outputs: List[List[int]] = [[]]
+        # エントリ: (グループ, キー, 元のキーワード, 大文字小文字を区別するか)
+        self._entries: List[Tuple[str, str, str, bool]] = []
+        self._empty_entries: List[int] = []
+        # グループごとのキーと登録順（一致したキーだけを登録順に並べるのに使う）
+        self._keys: Dict[str, Dict[str, int]] = {}
+        self._compiled = False
+
+    def add(self, group: str, key: str, keyword: str, case_sensitive: bool = False) -> None:
+        if self._compiled:
+            raise RuntimeError("コンパイル済みのKeywordMatcherにはキーワードを追加できません")
+        keys = self._keys.setdefault(group, {})
+        keys.setdefault(key, len(keys))
+        entry_index = len(self._entries)
+        self._entries.append((group, key, keyword, case_sensitive))
+        pattern = _fold_case(keyword) if case_sensitive else keyword.lower()
+        if not pattern:
+            self._empty_entries.append(entry_index)
+            return
+        node = 0
+        for char in pattern:
+            next_node = self._goto[node].get(char)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto[node][char] = next_node
+                self._goto.append({})
+                self._fail.append(0)
+                self._outputs.append([])
+            node = next_node
+        self._outputs[node].append(entry_index)
+
+    def compile(self) -> "KeywordMatcher":
+        """失敗リンクを幅優先で張り、出力を接尾辞側から継承させる"""
+        queue = list(self._goto[0].values())
+        head = 0
+        while head < len(queue):
+            node = queue[head]
+            head += 1
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fallback = self._fail[node]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[child] = target if target != child else 0
+                self._outputs[child] = self._outputs[child] + self._outputs[self._fail[child]]
+        self._compiled = True
+        return self
+
+    def _scan(self, folded: str, original: str, hit: set, case_sensitive: bool | None = None) -> None:
+        goto = self._goto
+        fail = self._fail
+        outputs = self._outputs
+        entries = self._entries
+        node = 0
+        for position, char in enumerate(folded):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if not outputs[node]:
+                continue
+            for entry_index in outputs[node]:
+                if entry_index in hit:
+                    continue
+                _, _, keyword, entry_case_sensitive = entries[entry_index]
+                if case_sensitive is not None and entry_case_sensitive != case_sensitive:
+                    continue
+                if not entry_case_sensitive:
+                    hit.add(entry_index)
+                    continue
+                # 区別するキーワードは小文字化した形で登録しているため、原文の同じ位置で確認する
+                start = position + 1 - len(keyword)
+                if start >= 0 and original.startswith(keyword, start):
+                    hit.add(entry_index)
+
+    def find_entries(self, text: str) -> set:
+        """テキスト中に現れたエントリ番号の集合を返す"""
+        if not self._compiled:
+            self.compile()
+        hit = set(self._empty_entries)
+        lowered = text.lower()
+        if len(lowered) == len(text):
+            # 小文字化で文字数が変わらなければ位置がそろうので、1回の走査で両方を判定できる
+            self._scan(lowered, text, hit)
+        else:
+            self._scan(lowered, text, hit, case_sensitive=False)
+            self._scan(_fold_case(text), text, hit, case_sensitive=True)
+        return hit
+
+    def count(self, text: str) -> KeywordHits:
+        """グループ・キーごとのキーワード一致数を登録順で返す（0件のキーは含めない）"""
+        return self.count_entries(self.find_entries(text))
+
+    def count_entries(self, entries: Iterable[int]) -> KeywordHits:
+        """find_entriesの結果（複数テキスト分の和集合でもよい）をグループ・キーごとに数える
+
+        一致したエントリだけを辿るので、手間は商品数ではなく一致したキーワードの数に比例する。
+        """
+        totals: Dict[str, Dict[str, int]] = {group: {} for group in self._keys}
+        for entry_index in entries:
+            group, key, _, _ = self._entries[entry_index]
+            totals[group][key] = totals[group].get(key, 0) + 1
+        return {
+            group: {key: counts[key] for key in sorted(counts, key=self._keys[group].__getitem__)}
+            for group, counts in totals.items()
+        }
+
+
+def build_keyword_matcher(
+    product_configs: List[Dict[str, object]],
+    category_keywords: Dict[str, List[str]]
+) -> KeywordMatcher:
+    matcher = KeywordMatcher()
+    for product in product_configs:
+        for keyword in product["keywords"]:
+            matcher.add("product", str(product["id"]), keyword)
+    # カテゴリ推定は従来どおり大文字小文字を区別して照合する
+    for category, keywords in category_keywords.items():
+        for keyword in keywords:
+            matcher.add("category", category, keyword, case_sensitive=True)
+    return matcher.compile()
+
+
+_keyword_matcher: KeywordMatcher | None = None
+
+
+def get_keyword_matcher() -> KeywordMatcher:
+    """PRODUCT_CONFIGSとCATEGORY_KEYWORDSから構築したオートマトンを実行中は使い回す"""
+    global _keyword_matcher
+    if _keyword_matcher is None:
+        _keyword_matcher = build_keyword_matcher(PRODUCT_CONFIGS, CATEGORY_KEYWORDS)
+    return _keyword_matcher
+
+
+def reset_keyword_matcher() -> None:
+    global _keyword_matcher
+    _keyword_matcher = None
+
+
+def load_product_catalog(path: Path) -> List[Dict[str, object]]:
+    """商品カタログを読み込んで検証する
+
+    PRODUCT_CONFIGSと同じ形（id, slug, category, keywords, 任意でimage）のオブジェクトを
+    JSONの配列、または1行1商品のJSONL（拡張子.jsonl）で並べたファイル。
+    """
+    text = path.read_text(encoding="utf-8")
+    if path.suffix == ".jsonl":
+        entries = [json.loads(line) for line in text.splitlines() if line.strip()]
+    else:
+        entries = json.loads(text)
+    if not isinstance(entries, list) or not entries:
+        raise ValueError(f"{path}: 商品カタログは1件以上の商品の配列にしてください")
+
+    products: List[Dict[str, object]] = []
+    seen: Dict[str, set] = {"id": set(), "slug": set()}
+    for number, entry in enumerate(entries, start=1):
+        if not isinstance(entry, dict):
+            raise ValueError(f"{path}: {number}件目がオブジェクトではありません")
+        missing = [field for field in ("id", "slug", "category", "keywords") if not entry.get(field)]
+        if missing:
+            raise ValueError(f"{path}: {number}件目に{', '.join(missing)}がありません")
+        keywords = entry["keywords"]
+        if not isinstance(keywords, list) or not all(isinstance(keyword, str) and keyword for keyword in keywords):
+            raise ValueError(f"{path}: {number}件目のkeywordsは空でない文字列の配列にしてください")
+        for field in ("id", "slug"):
+            value = str(entry[field])
+            if value in seen[field]:
+                raise ValueError(f"{path}: {field}「{value}」が重複しています")
+            seen[field].add(value)
+        products.append({
+            "id": str(entry["id"]),
+            "slug": str(entry["slug"]),
+            "category": str(entry["category"]),
+            "image": str(entry.get("image") or ""),
+            "keywords": list(keywords),
+        })
+    return products
+
+
+def use_product_catalog(path: Path) -> None:
+    """以降の抽出・構築・書き込みでPRODUCT_CONFIGSの代わりにカタログの商品を使う"""
+    global PRODUCT_CONFIGS
+    PRODUCT_CONFIGS = load_product_catalog(path)
+    # spawnで起動したワーカープロセスもモジュールの読み込み時に同じカタログを読む
+    os.environ[PRODUCT_CATALOG_ENV] = str(path.resolve())
+    reset_keyword_matcher()
+
+
+def match_review_to_product(record: ReviewRecord) -> str | None:
+    """レビューを最も適切な商品にマッチング"""
+    text = str(record.text)
+    
+    # 各商品のキーワードとのマッチングスコアを計算（一致したキーワードの種類数）
+    product_scores = get_keyword_matcher().count(text)["product"]
+    
+    # 最もスコアが高い商品を返す
+    if product_scores:
+        return max(product_scores.items(), key=lambda x: x[1])[0]
+    
+    return None
+
+
+if os.environ.get(PRODUCT_CATALOG_ENV):
+    PRODUCT_CONFIGS = load_product_catalog(Path(os.environ[PRODUCT_CATALOG_ENV]))
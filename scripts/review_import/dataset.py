@@ -0,0 +1,468 @@
+"""データセットのダウンロード・検証・圧縮と、JSONLファイルの行単位の読み込み"""
+
+from __future__ import annotations
+
+import gzip
+import hashlib
+import json
+import os
+import queue
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+from urllib.error import HTTPError, URLError
+from urllib.request import Request, urlopen
+
+try:
+    import zstandard  # type: ignore
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+
+DATASET_URLS = {
+    "train": "https://huggingface.co/datasets/SetFit/amazon_reviews_multi_ja/resolve/main/train.jsonl",
+    "validation": "https://huggingface.co/datasets/SetFit/amazon_reviews_multi_ja/resolve/main/validation.jsonl",
+    "test": "https://huggingface.co/datasets/SetFit/amazon_reviews_multi_ja/resolve/main/test.jsonl"
+}
+
+
+DOWNLOAD_MANIFEST = "download_manifest.json"
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+# 圧縮形式: 拡張子
+COMPRESSION_SUFFIXES = {"gzip": ".gz", "zstd": ".zst"}
+COMPRESSION_MAGIC = {b"\x1f\x8b": "gzip", b"\x28\xb5\x2f\xfd": "zstd"}
+DECOMPRESS_BLOCK_SIZE = 1024 * 1024
+
+
+class DownloadError(RuntimeError):
+    pass
+
+
+def load_download_manifest(data_dir: Path) -> Dict[str, Dict[str, object]]:
+    """ダウンロード済みファイルのURL・サイズ・SHA-256を記録したマニフェストを読む"""
+    path = data_dir / DOWNLOAD_MANIFEST
+    if not path.exists():
+        return {}
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def save_download_manifest(data_dir: Path, manifest: Dict[str, Dict[str, object]]) -> None:
+    data_dir.mkdir(parents=True, exist_ok=True)
+    tmp_path = data_dir / (DOWNLOAD_MANIFEST + ".tmp")
+    tmp_path.write_text(json.dumps(manifest, ensure_ascii=False, indent=2), encoding="utf-8")
+    os.replace(tmp_path, data_dir / DOWNLOAD_MANIFEST)
+
+
+def _header_sha256(headers) -> str | None:
+    """Hugging Faceなどが返すLFSのETag（SHA-256）を取り出す"""
+    for name in ("X-Linked-Etag", "ETag"):
+        value = (headers.get(name) or "").strip().strip('"')
+        if value.startswith("W/"):
+            continue
+        if len(value) == 64 and all(c in "0123456789abcdef" for c in value.lower()):
+            return value.lower()
+    return None
+
+
+def _remote_size(url: str) -> int | None:
+    req = Request(url, method="HEAD", headers={"User-Agent": "Mozilla/5.0"})
+    with urlopen(req, timeout=60) as response:
+        length = response.headers.get("Content-Length")
+    return int(length) if length is not None else None
+
+
+def _verify_existing(url: str, dest: Path, entry: Dict[str, object] | None) -> Dict[str, object] | None:
+    """既存ファイルがマニフェストと一致すれば記録を返し、一致しなければNoneを返す"""
+    current = _file_fingerprint(dest, with_hash=False)
+    if entry is not None and entry.get("url") == url:
+        if current["size"] != entry.get("size"):
+            return None
+        if current["mtime_ns"] == entry.get("mtime_ns"):
+            return entry
+        fingerprint = _file_fingerprint(dest)
+        if fingerprint["sha256"] != entry.get("sha256"):
+            return None
+        return {**entry, "mtime_ns": fingerprint["mtime_ns"]}
+
+    if detect_compression(dest) is not None:
+        # 圧縮済みのファイルはサーバー側のサイズと比べられないため、記録がなければ取り直す
+        return None
+
+    # マニフェスト導入前のファイルは途中で途切れている可能性があるため、サーバー側のサイズと比べる
+    try:
+        remote_size = _remote_size(url)
+    except (HTTPError, URLError, OSError):
+        remote_size = None
+    if remote_size is not None and remote_size != current["size"]:
+        return None
+    return {"url": url, **_file_fingerprint(dest)}
+
+
+def _convert_local_copy(url: str, dest: Path, entry: Dict[str, object] | None) -> Tuple[Dict[str, object], Path] | None:
+    """destと圧縮形式だけが違うローカルのコピーがマニフェストと一致すれば、取り直さずにdestの形式へ変換する
+
+    変換元のファイル（と行の索引）は削除し、マニフェストに記録する内容と変換元のパスを返す。
+    """
+    name = dest.name
+    for suffix in COMPRESSION_SUFFIXES.values():
+        name = name.removesuffix(suffix)
+    for source in (dest.with_name(name + suffix) for suffix in ("", *COMPRESSION_SUFFIXES.values())):
+        if source == dest or not source.exists():
+            continue
+        verified = _verify_existing(url, source, entry)
+        if verified is None:
+            continue
+        source_size = verified.get("source_size", verified["size"])
+        source_sha256 = verified.get("source_sha256", verified["sha256"])
+        compression = detect_compression(dest, sniff=False)
+        if compression is None:
+            tmp_path = dest.with_name(dest.name + ".tmp")
+            with open_dataset(source) as src, tmp_path.open("wb") as out:
+                shutil.copyfileobj(src, out, DECOMPRESS_BLOCK_SIZE)
+            os.replace(tmp_path, dest)
+            fingerprint = _file_fingerprint(dest)
+            if fingerprint["sha256"] != source_sha256:
+                dest.unlink()
+                continue
+        else:
+            compress_file(source, dest, compression)
+            fingerprint = _file_fingerprint(dest) | {
+                "compression": compression,
+                "source_size": source_size,
+                "source_sha256": source_sha256,
+            }
+        source.unlink()
+        line_index_path(source).unlink(missing_ok=True)
+        return {"url": url, **fingerprint}, source
+    return None
+
+
+def download_file(
+    url: str,
+    dest: Path,
+    overwrite: bool = False,
+    entry: Dict[str, object] | None = None,
+    retries: int = 3
+) -> Dict[str, object]:
+    """URLをdestへダウンロードし、マニフェストに記録する内容と転送統計を返す
+
+    途中のデータは`<dest>.part`に書き込み、中断された場合はRangeリクエストで続きから再開する。
+    サイズとSHA-256を確認してから`dest`へ置き換えるため、不完全なファイルが完成品として扱われることはない。
+    destの拡張子が`.gz`/`.zst`の場合は、検証後に圧縮して保存する（SHA-256は元データと保存したファイルの両方を記録）。
+    圧縮形式だけが違う検証済みのファイルが手元にあれば、ダウンロードせずにその場で変換する。
+    """
+    compression = detect_compression(dest, sniff=False)
+    if dest.exists() and not overwrite:
+        verified = _verify_existing(url, dest, entry)
+        if verified is not None:
+            return {"entry": verified, "skipped": True, "bytes": 0, "elapsed": 0.0, "resumed_from": 0}
+    if not overwrite:
+        started = time.perf_counter()
+        converted = _convert_local_copy(url, dest, entry)
+        if converted is not None:
+            return {
+                "entry": converted[0],
+                "skipped": True,
+                "bytes": 0,
+                "elapsed": time.perf_counter() - started,
+                "resumed_from": 0,
+                "converted_from": converted[1],
+            }
+
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    part = dest.with_name(dest.name + ".part")
+    if overwrite and part.exists():
+        part.unlink()
+
+    started = time.perf_counter()
+    transferred = 0
+    resumed_from = part.stat().st_size if part.exists() else 0
+    expected_sha256: str | None = None
+    expected_size: int | None = None
+
+    for attempt in range(retries + 1):
+        offset = part.stat().st_size if part.exists() else 0
+        headers = {"User-Agent": "Mozilla/5.0"}
+        if offset:
+            headers["Range"] = f"bytes={offset}-"
+        try:
+            with urlopen(Request(url, headers=headers), timeout=60) as response:
+                expected_sha256 = _header_sha256(response.headers) or expected_sha256
+                if offset and response.status == 206:
+                    content_range = response.headers.get("Content-Range", "")
+                    total = content_range.rsplit("/", 1)[-1]
+                    expected_size = int(total) if total.isdigit() else None
+                    mode = "ab"
+                else:
+                    # サーバーがRangeに対応していない場合は最初から取り直す
+                    length = response.headers.get("Content-Length")
+                    expected_size = int(length) if length is not None else None
+                    offset = 0
+                    resumed_from = 0
+                    mode = "wb"
+                with part.open(mode) as f:
+                    while True:
+                        chunk = response.read(DOWNLOAD_CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        f.write(chunk)
+                        transferred += len(chunk)
+            if expected_size is not None and part.stat().st_size < expected_size:
+                raise OSError("接続が途中で切断されました")
+            break
+        except HTTPError as exc:
+            if exc.code == 416 and offset:
+                # 既に全体を受信済み
+                content_range = exc.headers.get("Content-Range", "")
+                total = content_range.rsplit("/", 1)[-1]
+                expected_size = int(total) if total.isdigit() else offset
+                break
+            if attempt >= retries or exc.code < 500:
+                raise DownloadError(f"{url} のダウンロードに失敗しました: HTTP {exc.code}") from exc
+        except (URLError, OSError) as exc:
+            if attempt >= retries:
+                raise DownloadError(f"{url} のダウンロードに失敗しました: {exc}") from exc
+        time.sleep(min(2 ** attempt, 10))
+
+    fingerprint = _file_fingerprint(part)
+    if expected_size is not None and fingerprint["size"] != expected_size:
+        raise DownloadError(
+            f"{dest.name} のサイズが一致しません: {fingerprint['size']} / {expected_size} bytes（再実行すると続きから再開します）"
+        )
+    if (
+        expected_sha256 is None
+        and entry is not None
+        and entry.get("url") == url
+        and entry.get("source_size", entry.get("size")) == fingerprint["size"]
+    ):
+        # 同じURL・同じサイズのファイルを以前検証済みなら、その時のハッシュと一致するはず
+        expected_sha256 = str(entry.get("source_sha256", entry.get("sha256")))
+    if expected_sha256 is not None and fingerprint["sha256"] != expected_sha256:
+        part.unlink()
+        raise DownloadError(f"{dest.name} のチェックサムが一致しません（破損した一時ファイルを削除しました）")
+
+    if compression is None:
+        os.replace(part, dest)
+        fingerprint = _file_fingerprint(dest, with_hash=False) | {"sha256": fingerprint["sha256"]}
+    else:
+        compress_file(part, dest, compression)
+        part.unlink()
+        fingerprint = _file_fingerprint(dest) | {
+            "compression": compression,
+            "source_size": fingerprint["size"],
+            "source_sha256": fingerprint["sha256"],
+        }
+    return {
+        "entry": {"url": url, **fingerprint},
+        "skipped": False,
+        "bytes": transferred,
+        "elapsed": time.perf_counter() - started,
+        "resumed_from": resumed_from,
+    }
+
+
+def download_datasets(
+    urls: Dict[str, str],
+    dataset_paths: Dict[str, Path],
+    data_dir: Path,
+    overwrite: bool = False,
+    workers: int = 3
+) -> Dict[str, Dict[str, object]]:
+    """各分割を並列にダウンロードし、検証結果をマニフェストに保存する"""
+    manifest = load_download_manifest(data_dir)
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = {
+            split: executor.submit(download_file, url, dataset_paths[split], overwrite, manifest.get(split))
+            for split, url in urls.items()
+        }
+        results: Dict[str, Dict[str, object]] = {}
+        errors: List[str] = []
+        for split, future in futures.items():
+            try:
+                results[split] = future.result()
+            except DownloadError as exc:
+                errors.append(f"{split}: {exc}")
+                continue
+            manifest[split] = results[split]["entry"]
+    save_download_manifest(data_dir, manifest)
+    if errors:
+        raise DownloadError("データセットのダウンロードに失敗しました:\n  " + "\n  ".join(errors))
+    return results
+
+
+def format_download_result(result: Dict[str, object]) -> str:
+    if result.get("converted_from") is not None:
+        return f"{result['converted_from'].name}から変換, {result['elapsed']:.1f}秒"
+    if result["skipped"]:
+        return "検証済み"
+    megabytes = result["bytes"] / (1024 * 1024)
+    elapsed = max(result["elapsed"], 1e-9)
+    message = f"{megabytes:.1f} MB / {elapsed:.1f}秒 ({megabytes / elapsed:.1f} MB/s)"
+    if result["resumed_from"]:
+        message += f"、{result['resumed_from'] / (1024 * 1024):.1f} MBから再開"
+    return message
+
+
+def available_compressions() -> List[str]:
+    names = ["none", "gzip"]
+    if zstandard is not None:
+        names.append("zstd")
+    return names
+
+
+def dataset_file_paths(data_dir: Path, compression: str = "none") -> Dict[str, Path]:
+    """各分割の保存先（compressionに応じて`.jsonl.gz`/`.jsonl.zst`）"""
+    suffix = COMPRESSION_SUFFIXES.get(compression, "")
+    return {split: data_dir / f"amazon_reviews_{split}.jsonl{suffix}" for split in DATASET_URLS.keys()}
+
+
+def find_dataset_paths(data_dir: Path) -> Dict[str, Path]:
+    """各分割について、非圧縮・gzip・zstdの順に存在するファイルを返す（どれもなければ非圧縮のパス）"""
+    candidates = [dataset_file_paths(data_dir, compression) for compression in ("none", *COMPRESSION_SUFFIXES)]
+    return {
+        split: next((paths[split] for paths in candidates if paths[split].exists()), candidates[0][split])
+        for split in DATASET_URLS.keys()
+    }
+
+
+def detect_compression(path: Path, sniff: bool = True) -> str | None:
+    """拡張子から、分からなければ先頭のマジックバイトから圧縮形式を判定する"""
+    for compression, suffix in COMPRESSION_SUFFIXES.items():
+        if path.name.endswith(suffix):
+            return compression
+    if not sniff or not path.exists():
+        return None
+    with path.open("rb") as f:
+        head = f.read(4)
+    for magic, compression in COMPRESSION_MAGIC.items():
+        if head.startswith(magic):
+            return compression
+    return None
+
+
+def _require_zstandard() -> None:
+    if zstandard is None:
+        raise SystemExit("zstd形式の読み書きにはzstandardが必要です。pip install zstandardを実行してください。")
+
+
+def open_dataset(path: Path):
+    """JSONLファイルを展開済みのバイナリストリームとして開く"""
+    compression = detect_compression(path)
+    if compression == "gzip":
+        return gzip.open(path, "rb")
+    if compression == "zstd":
+        _require_zstandard()
+        f = path.open("rb")
+        return zstandard.ZstdDecompressor().stream_reader(f, closefd=True)
+    return path.open("rb")
+
+
+def compress_file(source: Path, dest: Path, compression: str) -> None:
+    """sourceを圧縮してdestに書き込む（一時ファイルから置き換える）。sourceが`.gz`/`.zst`なら展開しながら読む"""
+    tmp_path = dest.with_name(dest.name + ".tmp")
+    with open_dataset(source) if detect_compression(source, sniff=False) else source.open("rb") as src:
+        if compression == "gzip":
+            with gzip.open(tmp_path, "wb", compresslevel=6) as out:
+                shutil.copyfileobj(src, out, DECOMPRESS_BLOCK_SIZE)
+        elif compression == "zstd":
+            _require_zstandard()
+            with tmp_path.open("wb") as out:
+                zstandard.ZstdCompressor(level=10, threads=-1).copy_stream(src, out)
+        else:
+            raise ValueError(f"未対応の圧縮形式です: {compression}")
+    os.replace(tmp_path, dest)
+
+
+def _read_blocks(stream, blocks: queue.Queue, stop: threading.Event) -> None:
+    try:
+        with stream:
+            while not stop.is_set():
+                block = stream.read(DECOMPRESS_BLOCK_SIZE)
+                if not block:
+                    break
+                while not stop.is_set():
+                    try:
+                        blocks.put(block, timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+    except Exception as exc:  # 読み込み側のスレッドで送出し直す
+        blocks.put(exc)
+    finally:
+        blocks.put(None)
+
+
+def iter_lines(path: Path, threaded: bool = True, buffer_blocks: int = 8) -> Iterable[bytes]:
+    """JSONLファイルの各行を返す（末尾の改行は付いている場合といない場合がある）
+
+    圧縮ファイルは別スレッドで展開し、上限buffer_blocks個のブロックをキュー経由で受け取るため、
+    展開（zlib/zstdはGILを解放する）とJSONの解析が重なって進む。
+    """
+    if detect_compression(path) is None:
+        with path.open("rb") as f:
+            yield from f
+        return
+    stream = open_dataset(path)
+    if not threaded:
+        with stream:
+            pending = b""
+            for block in iter(lambda: stream.read(DECOMPRESS_BLOCK_SIZE), b""):
+                lines = block.split(b"\n")
+                lines[0] = pending + lines[0]
+                pending = lines.pop()
+                yield from lines
+            if pending:
+                yield pending
+        return
+
+    blocks: queue.Queue = queue.Queue(maxsize=max(1, buffer_blocks))
+    stop = threading.Event()
+    reader = threading.Thread(target=_read_blocks, args=(stream, blocks, stop), daemon=True)
+    reader.start()
+    pending = b""
+    try:
+        while True:
+            block = blocks.get()
+            if block is None:
+                break
+            if isinstance(block, Exception):
+                raise block
+            lines = block.split(b"\n")
+            lines[0] = pending + lines[0]
+            pending = lines.pop()
+            yield from lines
+        if pending:
+            yield pending
+    finally:
+        stop.set()
+        # 途中で読むのをやめた場合も、展開スレッドがキュー待ちのまま残らないようにする
+        while reader.is_alive():
+            try:
+                blocks.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        reader.join()
+
+
+def line_index_path(path: Path) -> Path:
+    """JSONLファイルの行オフセット索引（LineIndex）の置き場所"""
+    return path.with_name(path.name + ".idx")
+
+
+def _file_fingerprint(path: Path, with_hash: bool = True) -> Dict[str, object]:
+    stat = path.stat()
+    fingerprint: Dict[str, object] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    if with_hash:
+        digest = hashlib.sha256()
+        with path.open("rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        fingerprint["sha256"] = digest.hexdigest()
+    return fingerprint
@@ -0,0 +1,266 @@
+"""JSONLの行をレビューのレコードに変換するデコーダ（json/orjson/msgspec）"""
+
+from __future__ import annotations
+
+import json
+import mmap
+import os
+import random
+import struct
+import sys
+import time
+from array import array
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Tuple
+
+try:
+    import orjson  # type: ignore
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+try:
+    import msgspec  # type: ignore
+except ImportError:  # pragma: no cover - optional dependency
+    msgspec = None
+
+from .dataset import detect_compression, iter_lines, line_index_path
+
+
+# 取り込みで実際に使うフィールド（label_textなどは読み捨てる）
+REVIEW_FIELDS = ("id", "text", "label")
+
+
+class JsonlDecoder:
+    """JSONLの1行（bytes）をdictに変換する。fieldsを指定するとそのフィールドだけを返す"""
+
+    name = "json"
+
+    def __init__(self, fields: Tuple[str, ...] | None = None) -> None:
+        self.fields = fields
+
+    def _loads(self, line: bytes) -> Dict[str, object]:
+        return json.loads(line)
+
+    def decode(self, line: bytes) -> Dict[str, object]:
+        """fieldsを指定した場合、どれかが欠けた行は壊れた行と同じくValueErrorにする"""
+        record = self._loads(line)
+        if self.fields is None:
+            return record
+        missing = [field for field in self.fields if field not in record]
+        if missing:
+            raise ValueError(f"必須のフィールドがありません: {', '.join(missing)}")
+        return {field: record[field] for field in self.fields}
+
+
+class OrjsonDecoder(JsonlDecoder):
+    name = "orjson"
+
+    def _loads(self, line: bytes) -> Dict[str, object]:
+        return orjson.loads(line)
+
+
+if msgspec is not None:
+    class ReviewLine(msgspec.Struct):
+        """msgspecで宣言したフィールドだけを型付きで読み出す。欠けた行は他のデコーダと同じく不正な行として扱う"""
+
+        id: str
+        text: str
+        label: int
+
+
+class MsgspecDecoder(JsonlDecoder):
+    name = "msgspec"
+
+    def __init__(self, fields: Tuple[str, ...] | None = None) -> None:
+        super().__init__(fields)
+        self._typed = fields is not None and set(fields) == set(REVIEW_FIELDS)
+        self._decoder = msgspec.json.Decoder(ReviewLine) if self._typed else msgspec.json.Decoder()
+
+    def decode(self, line: bytes) -> Dict[str, object]:
+        if not self._typed:
+            return super().decode(line)
+        review = self._decoder.decode(line)
+        return {field: getattr(review, field) for field in self.fields}
+
+    def _loads(self, line: bytes) -> Dict[str, object]:
+        return self._decoder.decode(line)
+
+
+def available_decoders() -> List[str]:
+    names = []
+    if orjson is not None:
+        names.append("orjson")
+    if msgspec is not None:
+        names.append("msgspec")
+    names.append("json")
+    return names
+
+
+def get_decoder(name: str = "auto", fields: Tuple[str, ...] | None = REVIEW_FIELDS) -> JsonlDecoder:
+    """利用可能な中で最も速いデコーダを返す（orjson > msgspec > 標準のjson）"""
+    if name == "auto":
+        name = available_decoders()[0]
+    if name == "msgspec" and msgspec is not None:
+        return MsgspecDecoder(fields)
+    if name == "orjson" and orjson is not None:
+        return OrjsonDecoder(fields)
+    if name == "json":
+        return JsonlDecoder(fields)
+    raise ValueError(f"JSONデコーダ {name} は利用できません（利用可能: {', '.join(available_decoders())}）")
+
+
+def iter_dataset(
+    paths: Dict[str, Path],
+    decoder: JsonlDecoder | None = None,
+    threaded: bool = True
+) -> Iterable[Tuple[str, Dict[str, object]]]:
+    """各分割のレコードを読む。gzip/zstdで圧縮されたファイルも拡張子かマジックバイトで判別して展開する"""
+    decoder = decoder or get_decoder()
+    for split, path in paths.items():
+        for line in iter_lines(path, threaded=threaded):
+            line = line.strip()
+            if not line:
+                continue
+            record = decoder.decode(line)
+            record["split"] = split
+            yield split, record
+
+
+class ReviewRecord(NamedTuple):
+    """抽出・構築で持ち回るレビュー1件分の生データ
+
+    デコード結果のdictより小さく、splitは全レコードで同じ文字列オブジェクトを共有する。
+    """
+
+    id: str
+    text: str
+    label: int
+    split: str
+
+    @classmethod
+    def from_mapping(cls, record: Dict[str, object], split: str | None = None) -> "ReviewRecord":
+        split = str(record.get("split", "")) if split is None else split
+        return cls(record["id"], record.get("text", ""), int(record["label"]), sys.intern(split))
+
+
+def as_review_record(record: "ReviewRecord | Dict[str, object]") -> ReviewRecord:
+    return record if isinstance(record, ReviewRecord) else ReviewRecord.from_mapping(record)
+
+
+def iter_records(paths: Dict[str, Path], decoder: JsonlDecoder | None = None) -> Iterable[ReviewRecord]:
+    """iter_datasetのレコードをReviewRecordにして返す"""
+    for split, record in iter_dataset(paths, decoder):
+        yield ReviewRecord.from_mapping(record, split)
+
+
+class LineIndex:
+    """JSONLファイルの各レコード（空行を除く）の開始位置を記録したサイドカー索引
+
+    `<path>.idx`に元ファイルのサイズ・更新時刻と開始位置の配列を保存し、
+    読み出し時はmmapでN件目のレコードへ直接移動する。
+    """
+
+    MAGIC = b"JLIX"
+    HEADER = struct.Struct("<4sIqqq")
+    VERSION = 1
+
+    def __init__(self, path: Path, index_path: Path) -> None:
+        self.path = path
+        self.index_path = index_path
+        self._index_file = index_path.open("rb")
+        self._index_map = mmap.mmap(self._index_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._index_view = memoryview(self._index_map)
+        self.offsets = self._index_view[self.HEADER.size:].cast("q")
+        self._data_file = path.open("rb")
+        size = path.stat().st_size
+        self._data_map = mmap.mmap(self._data_file.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+
+    @staticmethod
+    def index_path_for(path: Path) -> Path:
+        return line_index_path(path)
+
+    def close(self) -> None:
+        self.offsets.release()
+        self._index_view.release()
+        self._index_map.close()
+        self._index_file.close()
+        if self._data_map is not None:
+            self._data_map.close()
+        self._data_file.close()
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def line(self, number: int) -> bytes:
+        """0始まりでnumber件目のレコードの行を返す"""
+        start = self.offsets[number]
+        end = self._data_map.find(b"\n", start)
+        if end < 0:
+            end = len(self._data_map)
+        return self._data_map[start:end].strip()
+
+    def record(self, number: int, decoder: JsonlDecoder | None = None) -> Dict[str, object]:
+        return (decoder or get_decoder(fields=None)).decode(self.line(number))
+
+    def sample(self, count: int, seed: int = 42) -> List[int]:
+        """シード付きで重複なしにレコード番号を選ぶ（ファイル順に並べて返す）"""
+        count = min(count, len(self))
+        return sorted(random.Random(seed).sample(range(len(self)), count))
+
+    @classmethod
+    def open(cls, path: Path) -> "LineIndex | None":
+        index_path = cls.index_path_for(path)
+        if not index_path.exists() or not path.exists():
+            return None
+        with index_path.open("rb") as f:
+            header = f.read(cls.HEADER.size)
+        if len(header) != cls.HEADER.size:
+            return None
+        magic, version, size, mtime_ns, count = cls.HEADER.unpack(header)
+        stat = path.stat()
+        if magic != cls.MAGIC or version != cls.VERSION or size != stat.st_size or mtime_ns != stat.st_mtime_ns:
+            return None
+        if index_path.stat().st_size != cls.HEADER.size + count * 8:
+            return None
+        return cls(path, index_path)
+
+    @classmethod
+    def build(cls, path: Path) -> "LineIndex":
+        if detect_compression(path) is not None:
+            raise ValueError(f"{path.name} は圧縮されているため行オフセット索引を作れません")
+        offsets = array("q")
+        position = 0
+        with path.open("rb") as f:
+            for line in f:
+                if line.strip():
+                    offsets.append(position)
+                position += len(line)
+        stat = path.stat()
+        index_path = cls.index_path_for(path)
+        tmp_path = index_path.with_name(index_path.name + ".tmp")
+        with tmp_path.open("wb") as f:
+            f.write(cls.HEADER.pack(cls.MAGIC, cls.VERSION, stat.st_size, stat.st_mtime_ns, len(offsets)))
+            offsets.tofile(f)
+        os.replace(tmp_path, index_path)
+        return cls(path, index_path)
+
+    @classmethod
+    def open_or_build(cls, path: Path) -> "LineIndex":
+        return cls.open(path) or cls.build(path)
+
+
+def benchmark_decoders(path: Path, fields: Tuple[str, ...] | None = REVIEW_FIELDS) -> Dict[str, float]:
+    """利用可能な各デコーダでファイル全体を読み、1秒あたりの行数を返す"""
+    results: Dict[str, float] = {}
+    for name in available_decoders():
+        decoder = get_decoder(name, fields)
+        lines = 0
+        started = time.perf_counter()
+        for line in iter_lines(path):
+            line = line.strip()
+            if not line:
+                continue
+            decoder.decode(line)
+            lines += 1
+        results[name] = lines / max(time.perf_counter() - started, 1e-9)
+    return results
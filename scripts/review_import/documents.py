@@ -0,0 +1,720 @@
+"""レコードからレビュー文書・商品文書を構築する（合成フィールドはシードとデータセットIDから決まる）"""
+
+from __future__ import annotations
+
+import random
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, NamedTuple, Tuple
+
+try:
+    import numpy as np  # type: ignore
+except ImportError:  # pragma: no cover - optional dependency
+    np = None
+
+from . import catalog
+from .catalog import get_keyword_matcher
+from .decoders import ReviewRecord, as_review_record
+from .text import _fallback_product_name, create_title, product_name_candidates, segment_text, summarize_text
+
+
+ANNOTATION_TYPES = ["insightful", "unclear", "empathy", "helpful"]
+# 文ごとのアノテーション件数の持ち方
+#   embedded: annotations=[{"type": 種類, "count": 件数}, ...]（既定。アプリの型定義どおり）
+#   array:    annotationCounts=[件数, ...]（ANNOTATION_TYPESの順）
+#   counts:   annotationCounts={種類: 件数, ...}
+ANNOTATION_SCHEMAS = ("embedded", "array", "counts")
+
+
+def build_sentence_entities(
+    review_id: str,
+    sentences: List[str],
+    annotation_schema: str = "embedded"
+) -> List[Dict[str, object]]:
+    entities = []
+    for idx, sentence in enumerate(sentences, start=1):
+        entity = {"id": f"{review_id}-sentence-{idx:02d}", "text": sentence}
+        if annotation_schema == "embedded":
+            entity["annotations"] = [{"type": ann_type, "count": 0} for ann_type in ANNOTATION_TYPES]
+        else:
+            entity.update(annotation_fields(dict.fromkeys(ANNOTATION_TYPES, 0), annotation_schema))
+        entities.append(entity)
+    return entities
+
+
+def annotation_fields(counts: Dict[str, int], annotation_schema: str) -> Dict[str, object]:
+    """種類ごとの件数を、スキーマに応じた文のフィールドにする"""
+    if annotation_schema == "embedded":
+        return {"annotations": [{"type": ann_type, "count": count} for ann_type, count in counts.items()]}
+    if annotation_schema == "counts":
+        return {"annotationCounts": dict(counts)}
+    if annotation_schema == "array":
+        unknown = [ann_type for ann_type, count in counts.items() if ann_type not in ANNOTATION_TYPES and count]
+        if unknown:
+            raise ValueError(f"ANNOTATION_TYPESにない種類は配列形式で表せません: {', '.join(unknown)}")
+        return {"annotationCounts": [counts.get(ann_type, 0) for ann_type in ANNOTATION_TYPES]}
+    raise ValueError(f"不明なアノテーションのスキーマです: {annotation_schema}")
+
+
+def sentence_annotation_schema(sentence: Dict[str, object]) -> str | None:
+    counts = sentence.get("annotationCounts")
+    if isinstance(counts, list):
+        return "array"
+    if isinstance(counts, dict):
+        return "counts"
+    return "embedded" if "annotations" in sentence else None
+
+
+def sentence_annotation_counts(sentence: Dict[str, object]) -> Dict[str, int]:
+    """どのスキーマの文からも種類ごとの件数を読み出す（ANNOTATION_TYPESの順、未知の種類はその後ろ）"""
+    counts = dict.fromkeys(ANNOTATION_TYPES, 0)
+    stored = sentence.get("annotationCounts")
+    if isinstance(stored, list):
+        counts.update(zip(ANNOTATION_TYPES, (int(count) for count in stored)))
+    elif isinstance(stored, dict):
+        counts.update((str(ann_type), int(count)) for ann_type, count in stored.items())
+    else:
+        for annotation in sentence.get("annotations", []):
+            ann_type = str(annotation["type"])
+            counts[ann_type] = counts.get(ann_type, 0) + int(annotation.get("count", 0))
+    return counts
+
+
+def convert_sentence_annotations(sentence: Dict[str, object], annotation_schema: str) -> Dict[str, object]:
+    """件数を保ったまま、文のアノテーションを指定のスキーマに書き換えた文を返す"""
+    converted = {key: value for key, value in sentence.items() if key not in ("annotations", "annotationCounts")}
+    converted.update(annotation_fields(sentence_annotation_counts(sentence), annotation_schema))
+    return converted
+
+
+def annotation_increment(
+    sentence_id: str,
+    ann_type: str,
+    annotation_schema: str = "embedded",
+    amount: int = 1
+) -> Tuple[Dict[str, object], Dict[str, object], List[Dict[str, object]]]:
+    """文のアノテーション件数を増やすupdate_oneの(フィルタ, 更新, arrayFilters)"""
+    query = {"sentences.id": sentence_id}
+    if annotation_schema == "embedded":
+        path = "sentences.$[s].annotations.$[a].count"
+        return query, {"$inc": {path: amount}}, [{"s.id": sentence_id}, {"a.type": ann_type}]
+    if annotation_schema == "array":
+        path = f"sentences.$[s].annotationCounts.{ANNOTATION_TYPES.index(ann_type)}"
+    else:
+        path = f"sentences.$[s].annotationCounts.{ann_type}"
+    return query, {"$inc": {path: amount}}, [{"s.id": sentence_id}]
+
+
+def random_datetime_within(
+    days: int = 365,
+    rng: random.Random | None = None,
+    now: datetime | None = None
+) -> datetime:
+    rng = rng or random
+    now = now or datetime.now(timezone.utc)
+    delta_days = rng.randint(0, days)
+    delta_minutes = rng.randint(0, 23 * 60 + 59)
+    return now - timedelta(days=delta_days, minutes=delta_minutes)
+
+
+def record_rng(dataset_id: object, seed: int = 42) -> random.Random:
+    """データセットIDから導いた乱数生成器（処理順やワーカー数に依存しない）"""
+    return random.Random(f"{seed}:{dataset_id}")
+
+
+METADATA_GENERATORS = ("python", "numpy")
+
+
+class ReviewMetadata(NamedTuple):
+    """generate_review_metadataが返す、レビューごとの合成フィールドの列"""
+
+    rating: "np.ndarray"
+    created_at: "np.ndarray"
+    total_votes: "np.ndarray"
+    helpful_votes: "np.ndarray"
+    verified_purchase: "np.ndarray"
+
+
+def generate_review_metadata(
+    labels: "np.ndarray",
+    positive: "np.ndarray",
+    rng: "np.random.Generator",
+    now: datetime,
+    days: int = 365
+) -> ReviewMetadata:
+    """評価・投稿日時・投票数・購入確認フラグを、レビュー1件ずつではなく列としてまとめて生成する
+
+    分布はbuild_review_documentと同じ（投稿日時はnowから0〜days日と0〜23時59分前、
+    総投票数は0〜120、参考になった数は肯定なら総数の半分以上、否定なら半分以下、購入確認は85%）。
+    created_atはUTCのdatetime64[us]。
+    """
+    count = len(labels)
+    minutes = rng.integers(0, days, size=count, endpoint=True) * (24 * 60)
+    minutes += rng.integers(0, 23 * 60 + 59, size=count, endpoint=True)
+    base = np.datetime64(now.astimezone(timezone.utc).replace(tzinfo=None), "us")
+    total_votes = rng.integers(0, 120, size=count, endpoint=True)
+    half = total_votes // 2
+    # 総投票数が0ならlow=high=0になり、参考になった数も0になる
+    helpful_votes = rng.integers(np.where(positive, half, 0), np.where(positive, total_votes, half), endpoint=True)
+    return ReviewMetadata(
+        rating=np.clip(labels.astype(np.int64) + 1, 1, 5),
+        created_at=base - minutes.astype("timedelta64[m]"),
+        total_votes=total_votes,
+        helpful_votes=helpful_votes,
+        verified_purchase=rng.random(count) < 0.85,
+    )
+
+
+def metadata_rng(tasks: List["ReviewBuildTask"], seed: int = 42) -> "np.random.Generator":
+    """チャンクの先頭レコードのIDと件数から導いたGenerator（ワーカー数や処理順に依存しない）"""
+    first_id = str(as_review_record(tasks[0][0]).id) if tasks else ""
+    return np.random.default_rng([seed % 2**64, zlib.crc32(first_id.encode("utf-8")), len(tasks)])
+
+
+def _base_price(average_rating: float) -> int:
+    # 平均評価に基づいて価格の基準を決める
+    return 3000 if average_rating >= 4.0 else 2000 if average_rating >= 3.0 else 1500
+
+
+def product_prices(
+    product_ids: List[str],
+    average_ratings: List[float],
+    seed: int = 42,
+    generator: str = "python"
+) -> List[int]:
+    """商品ごとの価格（基準価格に-500〜2000円の揺らぎを加え、500〜50000円に収める）
+
+    pythonでは商品IDから導いたrecord_rngで1件ずつ、numpyでは商品IDの並びから導いたGeneratorで
+    列としてまとめて引く。どちらもシードと商品だけで決まり、構築の順序やワーカー数に依存しない。
+    """
+    if generator == "numpy":
+        if not product_ids:
+            return []
+        keys = zlib.crc32("\n".join(product_ids).encode("utf-8"))
+        rng = np.random.default_rng([seed % 2**64, keys, len(product_ids)])
+        ratings = np.asarray(average_ratings, dtype=np.float64)
+        base = np.where(ratings >= 4.0, 3000, np.where(ratings >= 3.0, 2000, 1500))
+        variation = rng.integers(-500, 2000, size=len(product_ids), endpoint=True)
+        return np.clip(base + variation, 500, 50000).tolist()
+    return [
+        max(500, min(50000, _base_price(average_rating) + record_rng(product_id, seed).randint(-500, 2000)))
+        for product_id, average_rating in zip(product_ids, average_ratings)
+    ]
+
+
+class ReviewDocument:
+    """構築済みレビューの内部表現。MongoDBに渡すdictは書き込み時にto_document()で作る
+
+    ユーザー名や文ごとのアノテーション（4種類×0件）のように他の値から決まるフィールドは保持せず、
+    文はタプルで持つ。
+    """
+
+    __slots__ = (
+        "review_index", "product_id", "product_slug", "dataset_id", "dataset_label", "dataset_split",
+        "sentiment", "rating", "title", "content", "verified_purchase", "helpful_votes", "total_votes",
+        "created_at", "sentences",
+    )
+
+    def __init__(
+        self,
+        review_index: int,
+        product_id: str,
+        product_slug: str,
+        dataset_id: str,
+        dataset_label: int,
+        dataset_split: str,
+        sentiment: str,
+        rating: int,
+        title: str,
+        content: str,
+        verified_purchase: bool,
+        helpful_votes: int,
+        total_votes: int,
+        created_at: datetime,
+        sentences: Tuple[str, ...]
+    ) -> None:
+        self.review_index = review_index
+        self.product_id = product_id
+        self.product_slug = product_slug
+        self.dataset_id = dataset_id
+        self.dataset_label = dataset_label
+        self.dataset_split = dataset_split
+        self.sentiment = sentiment
+        self.rating = rating
+        self.title = title
+        self.content = content
+        self.verified_purchase = verified_purchase
+        self.helpful_votes = helpful_votes
+        self.total_votes = total_votes
+        self.created_at = created_at
+        self.sentences = sentences
+
+    @property
+    def review_id(self) -> str:
+        return f"{self.product_id}-rev-{self.review_index:04d}"
+
+    def to_document(self, annotation_schema: str = "embedded") -> Dict[str, object]:
+        review_id = self.review_id
+        return {
+            "reviewId": review_id,
+            "productId": self.product_id,
+            "productSlug": self.product_slug,
+            "datasetId": self.dataset_id,
+            "datasetLabel": self.dataset_label,
+            "datasetSplit": self.dataset_split,
+            "sentiment": self.sentiment,
+            "rating": self.rating,
+            "title": self.title,
+            "content": self.content,
+            "userId": f"user-{review_id}",
+            "userName": f"ユーザー{self.review_index:04d}",
+            "userAvatar": f"https://i.pravatar.cc/150?u={review_id}",
+            "verifiedPurchase": self.verified_purchase,
+            "helpfulVotes": self.helpful_votes,
+            "totalVotes": self.total_votes,
+            "createdAt": self.created_at,
+            "updatedAt": self.created_at,
+            "language": "ja",
+            "sentences": build_sentence_entities(review_id, self.sentences, annotation_schema),
+        }
+
+
+def build_review_document(
+    record: "ReviewRecord | Dict[str, object]",
+    product: Dict[str, object],
+    review_index: int,
+    sentiment: str,
+    seed: int = 42,
+    now: datetime | None = None
+) -> ReviewDocument:
+    record = as_review_record(record)
+    rng = record_rng(record.id, seed)
+    rating = max(1, min(5, record.label + 1))
+    created_at = random_datetime_within(rng=rng, now=now)
+    total_votes = rng.randint(0, 120)
+    if total_votes == 0:
+        helpful_votes = 0
+    elif sentiment == "positive":
+        helpful_votes = rng.randint(max(0, total_votes // 2), total_votes)
+    else:
+        helpful_votes = rng.randint(0, total_votes // 2)
+
+    segments = segment_text(record.text, summary_length=None)
+
+    return ReviewDocument(
+        review_index=review_index,
+        product_id=product["id"],
+        product_slug=product["slug"],
+        dataset_id=record.id,
+        dataset_label=record.label,
+        dataset_split=record.split,
+        sentiment=sentiment,
+        rating=rating,
+        title=segments.title,
+        content=record.text,
+        verified_purchase=rng.random() < 0.85,
+        helpful_votes=helpful_votes,
+        total_votes=total_votes,
+        created_at=created_at,
+        sentences=tuple(segments.sentences),
+    )
+
+
+ReviewBuildTask = Tuple[ReviewRecord, Dict[str, object], int, str]
+
+
+def _build_review_chunk(
+    tasks: List[ReviewBuildTask],
+    seed: int,
+    now: datetime,
+    generator: str = "python"
+) -> List[ReviewDocument]:
+    if generator == "numpy":
+        return build_review_chunk_vectorized(tasks, seed, now)
+    return [
+        build_review_document(record, product, review_index, sentiment, seed=seed, now=now)
+        for record, product, review_index, sentiment in tasks
+    ]
+
+
+def build_review_chunk_vectorized(
+    tasks: List[ReviewBuildTask],
+    seed: int = 42,
+    now: datetime | None = None
+) -> List[ReviewDocument]:
+    """build_review_documentのチャンク版。合成フィールドはgenerate_review_metadataでまとめて作る
+
+    乱数はチャンクごとのGeneratorから引くので、値はbuild_review_documentとは一致しないが分布は同じで、
+    同じシード・同じタスク列なら同じ結果になる。
+    """
+    now = now or datetime.now(timezone.utc)
+    records = [as_review_record(record) for record, _, _, _ in tasks]
+    labels = np.fromiter((record.label for record in records), dtype=np.int64, count=len(records))
+    positive = np.fromiter((task[3] == "positive" for task in tasks), dtype=bool, count=len(tasks))
+    metadata = generate_review_metadata(labels, positive, metadata_rng(tasks, seed), now)
+    # BSONにはnumpyの数値型を渡せないので、tolist()でPythonの値に戻す
+    columns = zip(
+        metadata.rating.tolist(),
+        metadata.created_at.tolist(),
+        metadata.total_votes.tolist(),
+        metadata.helpful_votes.tolist(),
+        metadata.verified_purchase.tolist(),
+    )
+
+    documents: List[ReviewDocument] = []
+    for record, (_, product, review_index, sentiment), (rating, created_at, total_votes, helpful_votes, verified) in zip(
+        records, tasks, columns
+    ):
+        segments = segment_text(record.text, summary_length=None)
+        documents.append(ReviewDocument(
+            review_index=review_index,
+            product_id=product["id"],
+            product_slug=product["slug"],
+            dataset_id=record.id,
+            dataset_label=record.label,
+            dataset_split=record.split,
+            sentiment=sentiment,
+            rating=rating,
+            title=segments.title,
+            content=record.text,
+            verified_purchase=verified,
+            helpful_votes=helpful_votes,
+            total_votes=total_votes,
+            created_at=created_at.replace(tzinfo=timezone.utc),
+            sentences=tuple(segments.sentences),
+        ))
+    return documents
+
+
+def build_review_documents(
+    tasks: List[ReviewBuildTask],
+    seed: int = 42,
+    now: datetime | None = None,
+    workers: int = 1,
+    chunk_size: int = 2000,
+    generator: str = "python"
+) -> List[ReviewDocument]:
+    """(レコード, 商品, 番号, 感情)の列からレビュー文書を作る
+
+    workersが2以上ならチャンクに分けてプロセスプールで並列に構築する。
+    各レビューの乱数はデータセットIDから（generator="numpy"ではチャンクの内容から）導き、
+    基準時刻も全体で1つに固定するため、ワーカー数によらず同じ結果になる。
+    """
+    now = now or datetime.now(timezone.utc)
+    chunks = [tasks[start:start + chunk_size] for start in range(0, len(tasks), chunk_size)]
+    if workers <= 1 or len(chunks) <= 1:
+        return [document for chunk in chunks for document in _build_review_chunk(chunk, seed, now, generator)]
+
+    documents: List[ReviewDocument] = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for chunk_documents in executor.map(
+            _build_review_chunk, chunks, [seed] * len(chunks), [now] * len(chunks), [generator] * len(chunks)
+        ):
+            documents.extend(chunk_documents)
+    return documents
+
+
+# (商品, その商品のレビューの構築タスク)
+ProductBuildTask = Tuple[Dict[str, object], List[ReviewBuildTask]]
+# 商品文書のうちレビューから決まる値（商品名, カテゴリ, 説明文, 平均評価, レビュー数）
+ProductAnalysis = Tuple[str, str, str, float, int]
+
+
+def _build_product_chunk(
+    products: List[ProductBuildTask],
+    seed: int,
+    now: datetime,
+    generator: str = "python"
+) -> List[Tuple[List[ReviewDocument], ProductAnalysis | None]]:
+    """商品単位のチャンクのレビュー文書を作り、続けて商品ごとにレビューから決まる値を求める"""
+    reviews = _build_review_chunk([task for _, tasks in products for task in tasks], seed, now, generator)
+    results = []
+    start = 0
+    for config, tasks in products:
+        product_reviews = reviews[start:start + len(tasks)]
+        start += len(tasks)
+        results.append((product_reviews, analyze_product_reviews(config, product_reviews) if product_reviews else None))
+    return results
+
+
+def build_catalog_documents(
+    raw_records: Dict[str, Dict[str, List[ReviewRecord]]],
+    seed: int = 42,
+    now: datetime | None = None,
+    workers: int = 1,
+    chunk_size: int = 2000,
+    generator: str = "python"
+) -> Tuple[Dict[str, List[ReviewDocument]], Dict[str, Dict[str, object]]]:
+    """選択したレコードから、商品ごとのレビュー文書と商品文書を作る
+
+    商品をまたがないように合計chunk_size件前後のチャンクにまとめ、workersが2以上なら
+    レビュー文書の構築から商品名・カテゴリ・説明文の抽出までをチャンクごとにプロセスプールで並列に行う。
+    価格もシードと商品IDから引くので、ワーカー数によらず同じ結果になる。
+    """
+    now = now or datetime.now(timezone.utc)
+    chunks: List[List[ProductBuildTask]] = []
+    chunk: List[ProductBuildTask] = []
+    chunk_tasks = 0
+    for config in catalog.PRODUCT_CONFIGS:
+        tasks: List[ReviewBuildTask] = []
+        for sentiment in ("positive", "negative"):
+            for record in raw_records[config["id"]][sentiment]:
+                tasks.append((record, config, len(tasks) + 1, sentiment))
+        if chunk and chunk_tasks + len(tasks) > chunk_size:
+            chunks.append(chunk)
+            chunk = []
+            chunk_tasks = 0
+        chunk.append((config, tasks))
+        chunk_tasks += len(tasks)
+    if chunk:
+        chunks.append(chunk)
+
+    if workers <= 1 or len(chunks) <= 1:
+        results = [result for chunk in chunks for result in _build_product_chunk(chunk, seed, now, generator)]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = [
+                result
+                for chunk_results in executor.map(
+                    _build_product_chunk, chunks, [seed] * len(chunks), [now] * len(chunks), [generator] * len(chunks)
+                )
+                for result in chunk_results
+            ]
+
+    product_reviews: Dict[str, List[ReviewDocument]] = {}
+    analyses: Dict[str, Tuple[Dict[str, object], ProductAnalysis]] = {}
+    for config, (reviews, analysis) in zip(catalog.PRODUCT_CONFIGS, results):
+        product_reviews[config["id"]] = reviews
+        if analysis is not None:
+            analyses[config["id"]] = (config, analysis)
+    return product_reviews, assemble_product_documents(analyses, seed, generator)
+
+
+def iter_review_documents(
+    tasks: Iterable[ReviewBuildTask],
+    seed: int = 42,
+    now: datetime | None = None,
+    workers: int = 1,
+    chunk_size: int = 2000,
+    generator: str = "python"
+) -> Iterable[ReviewDocument]:
+    """build_review_documentsの逐次版。タスク列を少しずつ読み、構築した順に返す
+
+    並列時も処理中のチャンクはワーカー数の2倍までに抑えるため、
+    タスク列がどれだけ長くてもメモリ使用量は一定に保たれる。
+    """
+    now = now or datetime.now(timezone.utc)
+    chunks = _chunked(tasks, chunk_size)
+    if workers <= 1:
+        for chunk in chunks:
+            yield from _build_review_chunk(chunk, seed, now, generator)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending: List = []
+        for chunk in chunks:
+            pending.append(executor.submit(_build_review_chunk, chunk, seed, now, generator))
+            if len(pending) >= workers * 2:
+                yield from pending.pop(0).result()
+        for future in pending:
+            yield from future.result()
+
+
+def extract_product_name_from_reviews(reviews: List[ReviewDocument]) -> str:
+    """レビューから商品名を推測"""
+    # レビュー本文から商品名らしき単語を抽出
+    product_keywords = {}
+    for review in reviews:
+        for keyword in product_name_candidates(str(review.content)):
+            product_keywords[keyword] = product_keywords.get(keyword, 0) + 1
+    
+    if product_keywords:
+        # 最も頻出するキーワードを商品名として使用
+        most_common = max(product_keywords.items(), key=lambda x: x[1])
+        return most_common[0]
+    
+    # フォールバック: レビューの最初の文から抽出
+    if reviews:
+        return _fallback_product_name(str(reviews[0].content))
+    
+    return "商品"
+
+
+def infer_category_from_reviews(reviews: List[ReviewDocument]) -> str:
+    """レビューからカテゴリを推測"""
+    text_content = " ".join(str(r.content) for r in reviews)
+    category_scores = get_keyword_matcher().count(text_content)["category"]
+    
+    if category_scores:
+        return max(category_scores.items(), key=lambda x: x[1])[0]
+    
+    return "その他"
+
+
+def build_product_document(
+    config: Dict[str, str],
+    reviews: List[ReviewDocument],
+    seed: int = 42,
+    generator: str = "python"
+) -> Dict[str, object]:
+    analysis = analyze_product_reviews(config, reviews)
+    return assemble_product_documents({config["id"]: (config, analysis)}, seed, generator)[config["id"]]
+
+
+def assemble_product_documents(
+    analyses: Dict[str, Tuple[Dict[str, object], ProductAnalysis]],
+    seed: int = 42,
+    generator: str = "python"
+) -> Dict[str, Dict[str, object]]:
+    """商品IDごとの(商品設定, レビューから決まる値)から商品文書を作る。価格はここでまとめて引く"""
+    prices = product_prices(list(analyses), [analysis[3] for _, analysis in analyses.values()], seed, generator)
+    return {
+        product_id: assemble_product_document(config, *analysis, price=price)
+        for (product_id, (config, analysis)), price in zip(analyses.items(), prices)
+    }
+
+
+def analyze_product_reviews(
+    config: Dict[str, str],
+    reviews: List[ReviewDocument]
+) -> ProductAnalysis:
+    """商品文書のうちレビューから決まる値（商品名, カテゴリ, 説明文, 平均評価, レビュー数）"""
+    average_rating = round(sum(review.rating for review in reviews) / len(reviews), 2)
+    
+    # レビューから実際の商品名を抽出
+    extracted_name = extract_product_name_from_reviews(reviews)
+    if extracted_name and extracted_name != "商品":
+        product_name = extracted_name
+    else:
+        # フォールバック: レビューのタイトルから生成
+        positive_reviews = [review for review in reviews if review.sentiment == "positive"]
+        representative_review = positive_reviews[0] if positive_reviews else reviews[0]
+        representative_text = str(representative_review.content)
+        product_name = create_title(representative_text)
+    
+    # カテゴリを推測
+    inferred_category = infer_category_from_reviews(reviews)
+    category = inferred_category if inferred_category != "その他" else config["category"]
+    
+    # 説明文を生成
+    all_reviews_text = " ".join(str(r.content) for r in reviews[:5])
+    description = summarize_text(all_reviews_text, 220)
+
+    return product_name, category, description, average_rating, len(reviews)
+
+
+def assemble_product_document(
+    config: Dict[str, str],
+    product_name: str,
+    category: str,
+    description: str,
+    average_rating: float,
+    total_reviews: int,
+    price: int
+) -> Dict[str, object]:
+    now = datetime.now(timezone.utc)
+
+    return {
+        "productId": config["id"],
+        "slug": config["slug"],
+        "name": product_name,
+        "category": category,
+        "image": config["image"],
+        "price": price,
+        "description": description,
+        "averageRating": average_rating,
+        "totalReviews": total_reviews,
+        "updatedAt": now,
+        "createdAt": now,
+    }
+
+
+def _chunked(items: Iterable, size: int) -> Iterable[list]:
+    batch: list = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class ProductAccumulator:
+    """ストリーミング取り込みで商品文書の集計値を逐次更新する
+
+    レビュー文書を保持せず、評価の合計・件数、カテゴリキーワードの一致集合、
+    説明文用の先頭レビュー、商品名候補の出現回数だけを持つ。商品名候補は
+    Misra-Gries法でmax_candidates件に抑えるため、件数が増えてもメモリは一定。
+    """
+
+    DESCRIPTION_REVIEWS = 5
+
+    def __init__(self, config: Dict[str, object], max_candidates: int = 10000) -> None:
+        self.config = config
+        self.max_candidates = max_candidates
+        self.total_reviews = 0
+        self.rating_sum = 0
+        self.sentiments = {"positive": 0, "negative": 0}
+        self.keyword_entries: set = set()
+        self.name_candidates: Dict[str, int] = {}
+        self.leading_texts: List[str] = []
+        self.first_positive_text: str | None = None
+
+    def observe_keywords(self, entries: Iterable[int]) -> None:
+        self.keyword_entries.update(entries)
+
+    def add(self, review: ReviewDocument) -> None:
+        content = str(review.content)
+        self.total_reviews += 1
+        self.rating_sum += review.rating
+        self.sentiments[review.sentiment] += 1
+        if len(self.leading_texts) < self.DESCRIPTION_REVIEWS:
+            self.leading_texts.append(content)
+        if self.first_positive_text is None and review.sentiment == "positive":
+            self.first_positive_text = content
+        candidates = self.name_candidates
+        for keyword in product_name_candidates(content):
+            candidates[keyword] = candidates.get(keyword, 0) + 1
+        if len(candidates) > self.max_candidates:
+            self._prune_candidates()
+
+    def _prune_candidates(self) -> None:
+        # 全候補を1ずつ減らして0になったものを捨てる（頻出する候補は残る）
+        self.name_candidates = {
+            keyword: count - 1 for keyword, count in self.name_candidates.items() if count > 1
+        }
+
+    def product_name(self) -> str:
+        if self.name_candidates:
+            return max(self.name_candidates.items(), key=lambda x: x[1])[0]
+        fallback = _fallback_product_name(self.leading_texts[0]) if self.leading_texts else "商品"
+        if fallback and fallback != "商品":
+            return fallback
+        return create_title(self.first_positive_text or (self.leading_texts[0] if self.leading_texts else ""))
+
+    def analysis(self) -> ProductAnalysis:
+        """analyze_product_reviewsと同じ、商品文書のうちレビューから決まる値"""
+        average_rating = round(self.rating_sum / self.total_reviews, 2)
+        category_scores = get_keyword_matcher().count_entries(self.keyword_entries)["category"]
+        category = max(category_scores.items(), key=lambda x: x[1])[0] if category_scores else self.config["category"]
+        description = summarize_text(" ".join(self.leading_texts), 220)
+        return self.product_name(), category, description, average_rating, self.total_reviews
+
+
+def accumulated_product_documents(
+    accumulators: Dict[str, ProductAccumulator],
+    seed: int = 42,
+    generator: str = "python"
+) -> Dict[str, Dict[str, object]]:
+    """レビューが1件以上ある商品の商品文書を作る"""
+    return assemble_product_documents(
+        {
+            product_id: (accumulator.config, accumulator.analysis())
+            for product_id, accumulator in accumulators.items()
+            if accumulator.total_reviews
+        },
+        seed,
+        generator,
+    )
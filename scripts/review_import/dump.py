@@ -0,0 +1,173 @@
+"""--output-dump/--load-dump: mongodump互換のダンプの書き出しと読み込み"""
+
+from __future__ import annotations
+
+import json
+import os
+import time
+from datetime import timezone
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+
+from bson import CodecOptions, decode_file_iter, encode as bson_encode, json_util
+
+from .documents import _chunked
+from .indexes import INDEX_DEFINITIONS
+from .journal import CheckpointJournal, review_insert_batches
+from .mongo import COLLECTION_PRODUCTS, COLLECTION_REVIEWS
+from .writer import BulkWriter, WriteStats, delete_existing_reviews, upsert_products
+
+
+DUMP_FORMATS = {"bson": ".bson", "ndjson": ".json"}
+DUMP_COLLECTIONS = (COLLECTION_PRODUCTS, COLLECTION_REVIEWS)
+# 読み込んだ日時はbuild_*_documentと同じくUTCのaware datetimeにそろえる
+DUMP_CODEC_OPTIONS = CodecOptions(tz_aware=True, tzinfo=timezone.utc)
+DUMP_JSON_OPTIONS = json_util.JSONOptions(
+    json_mode=json_util.JSONMode.RELAXED, tz_aware=True, tzinfo=timezone.utc
+)
+
+
+def dump_index_metadata(collection_name: str) -> Dict[str, object]:
+    """mongorestoreが読み込む<collection>.metadata.json（INDEX_DEFINITIONSのインデックスを含む）"""
+    indexes: List[Dict[str, object]] = [{"v": 2, "key": {"_id": 1}, "name": "_id_"}]
+    for name, (keys, options) in INDEX_DEFINITIONS[collection_name].items():
+        indexes.append({"v": 2, "key": dict(keys), "name": name, **options})
+    return {"options": {}, "indexes": indexes, "collectionName": collection_name, "type": "collection"}
+
+
+class DumpWriter:
+    """データベースに接続せず、文書をmongodump互換のBSONまたは拡張JSON（NDJSON）に書き出す
+
+    <dump_dir>/<db>/<collection>.bson（ndjsonは.json）と<collection>.metadata.jsonを作るので、
+    mongorestore/mongoimportや--load-dumpでそのまま読み込める。文書はバッチごとに書き出すため、
+    件数によらずメモリは一定。
+    """
+
+    def __init__(self, dump_dir: Path, db_name: str, dump_format: str = "bson", batch_size: int = 1000) -> None:
+        self.dump_dir = dump_dir
+        self.directory = dump_dir / db_name
+        self.dump_format = dump_format
+        self.batch_size = max(1, batch_size)
+
+    def path(self, collection_name: str) -> Path:
+        return self.directory / f"{collection_name}{DUMP_FORMATS[self.dump_format]}"
+
+    def _encode(self, document: Dict[str, object]) -> bytes:
+        if self.dump_format == "bson":
+            return bson_encode(document)
+        return json_util.dumps(document, json_options=json_util.RELAXED_JSON_OPTIONS, ensure_ascii=False).encode("utf-8") + b"\n"
+
+    def write(self, collection_name: str, documents: Iterable[Dict[str, object]], label: str | None = None) -> WriteStats:
+        stats = WriteStats(label or collection_name)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        dest = self.path(collection_name)
+        tmp_path = dest.with_name(dest.name + ".tmp")
+        with tmp_path.open("wb") as out:
+            for batch in _chunked(documents, self.batch_size):
+                started = time.perf_counter()
+                out.write(b"".join(self._encode(document) for document in batch))
+                stats.record(len(batch), time.perf_counter() - started)
+        os.replace(tmp_path, dest)
+        # 別の形式で書き出した古いダンプが残っていると--load-dumpがどちらを読むか曖昧になる
+        for suffix in DUMP_FORMATS.values():
+            stale = self.directory / f"{collection_name}{suffix}"
+            if stale != dest:
+                stale.unlink(missing_ok=True)
+        metadata = self.directory / f"{collection_name}.metadata.json"
+        metadata.write_text(json.dumps(dump_index_metadata(collection_name), indent=2), encoding="utf-8")
+        return stats.finish()
+
+    def write_prepare_script(self, product_ids: Iterable[str]) -> Path:
+        """mongoimportの前にmongoshで実行するスクリプト
+
+        mongoimportはインデックスを作らないので、INDEX_DEFINITIONSのインデックスを作成し、
+        --load-dumpと同じくダンプに含まれる商品の既存レビューだけを削除する。
+        """
+        lines = [
+            "// mongoimportでproducts/reviewsを読み込む前に実行します（import_reviews.py --output-dumpが生成）",
+            f"db = db.getSiblingDB({json.dumps(self.directory.name)});",
+        ]
+        for collection_name in DUMP_COLLECTIONS:
+            indexes = dump_index_metadata(collection_name)["indexes"][1:]
+            command = {"createIndexes": collection_name, "indexes": indexes}
+            lines.append(f"db.runCommand({json.dumps(command, ensure_ascii=False)});")
+        query = {"productId": {"$in": list(product_ids)}}
+        lines.append(f"db.getCollection({json.dumps(COLLECTION_REVIEWS)}).deleteMany({json.dumps(query, ensure_ascii=False)});")
+        path = self.directory / "prepare.js"
+        path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+        return path
+
+
+def print_dump_instructions(writer: DumpWriter, product_ids: Iterable[str]) -> None:
+    print(f"\n💾 ダンプを書き出しました: {writer.directory}")
+    print("  読み込み方法（ダンプに含まれる商品とそのレビューが置き換えられます）:")
+    print(f"  - python scripts/import_reviews.py --load-dump {writer.dump_dir}")
+    if writer.dump_format == "bson":
+        # mongorestoreはmetadata.jsonからインデックスも作り直すが、--dropでコレクション全体を置き換える
+        print(
+            f'  - mongorestore --uri "$MONGODB_URI" --drop --numInsertionWorkersPerCollection 4 '
+            f'--nsInclude "{writer.directory.name}.*" {writer.dump_dir}（products/reviews全体を置き換えます）'
+        )
+        return
+    # mongoimport --dropはインデックスごとコレクションを削除し、作り直さないので使わない
+    script = writer.write_prepare_script(product_ids)
+    print(f'  - mongosh "$MONGODB_URI" --file {script}（インデックスの作成と既存レビューの削除）')
+    for collection_name in DUMP_COLLECTIONS:
+        mode = "--mode upsert --upsertFields productId " if collection_name == COLLECTION_PRODUCTS else ""
+        print(
+            f'  - mongoimport --uri "$MONGODB_URI" --db {writer.directory.name} --collection {collection_name} '
+            f"{mode}--numInsertionWorkers 4 --file {writer.path(collection_name)}"
+        )
+
+
+def find_dump_files(dump_dir: Path) -> Dict[str, Path]:
+    """dump_dir直下または1階層下（<db>/）から、products/reviewsのダンプファイルを探す"""
+    if not dump_dir.is_dir():
+        raise SystemExit(f"ダンプのディレクトリが見つかりません: {dump_dir}")
+    for directory in [dump_dir, *sorted(path for path in dump_dir.iterdir() if path.is_dir())]:
+        found = {
+            collection_name: directory / f"{collection_name}{suffix}"
+            for collection_name in DUMP_COLLECTIONS
+            for suffix in DUMP_FORMATS.values()
+            if (directory / f"{collection_name}{suffix}").exists()
+        }
+        if len(found) == len(DUMP_COLLECTIONS):
+            return found
+    raise SystemExit(f"{dump_dir}にproducts/reviewsのダンプが見つかりません。--output-dumpで作成してください。")
+
+
+def iter_dump_documents(path: Path) -> Iterable[Dict[str, object]]:
+    if path.suffix == DUMP_FORMATS["bson"]:
+        with path.open("rb") as handle:
+            yield from decode_file_iter(handle, codec_options=DUMP_CODEC_OPTIONS)
+        return
+    with path.open("r", encoding="utf-8") as handle:
+        for line in handle:
+            if line.strip():
+                yield json_util.loads(line, json_options=DUMP_JSON_OPTIONS)
+
+
+def load_dump(
+    db,
+    dump_dir: Path,
+    keep_existing: bool,
+    writer: BulkWriter | None = None,
+    journal: CheckpointJournal | None = None
+) -> Tuple[Dict[str, Dict[str, object]], WriteStats, WriteStats]:
+    """--output-dumpで書き出したダンプを、文書を再構築せずにそのまま投入する
+
+    レビューはファイルから読んだ順にBulkWriterへ流すので、ダンプ全体をメモリに載せない。
+    """
+    writer = writer or BulkWriter(db)
+    paths = find_dump_files(dump_dir)
+    product_documents: Dict[str, Dict[str, object]] = {}
+    for document in iter_dump_documents(paths[COLLECTION_PRODUCTS]):
+        # mongodumpで取り直したダンプには_idが含まれるが、$setでは書き換えられない
+        document.pop("_id", None)
+        product_documents[str(document["productId"])] = document
+    product_stats = upsert_products(db, product_documents, writer=writer)
+    if not keep_existing:
+        delete_existing_reviews(writer, product_documents, journal)
+    batches = review_insert_batches(iter_dump_documents(paths[COLLECTION_REVIEWS]), writer.batch_size, journal)
+    review_stats = writer.write_batches(COLLECTION_REVIEWS, batches, label="reviews", journal=journal)
+    return product_documents, product_stats, review_stats
@@ -0,0 +1,140 @@
+"""インポーターが管理するインデックスの作成・遅延構築・検証"""
+
+from __future__ import annotations
+
+import time
+from typing import Dict, Iterable, List, Tuple
+
+from pymongo import IndexModel
+
+from .mongo import COLLECTION_PRODUCTS, COLLECTION_REVIEWS
+
+
+# インポーターが管理するインデックス: コレクション -> 名前 -> (キー, オプション)
+INDEX_DEFINITIONS: Dict[str, Dict[str, Tuple[List[Tuple[str, int]], Dict[str, object]]]] = {
+    COLLECTION_PRODUCTS: {
+        "productId_1": ([("productId", 1)], {"unique": True}),
+        "slug_1": ([("slug", 1)], {}),
+    },
+    COLLECTION_REVIEWS: {
+        # productId単独の検索と、--syncでの(productId, datasetId)の照合を兼ねる
+        "productId_1_datasetId_1": ([("productId", 1), ("datasetId", 1)], {}),
+        # --keep-existingでは同じreviewIdが重複しうるためuniqueにはしない
+        "reviewId_1": ([("reviewId", 1)], {}),
+        "datasetId_1": ([("datasetId", 1)], {}),
+        "sentences.id_1": ([("sentences.id", 1)], {}),
+    },
+}
+# この件数以上のレビューを投入するときは、autoでもセカンダリインデックスを投入後にまとめて作る
+DEFERRED_INDEX_THRESHOLD = 50000
+
+
+def _index_matches(info: Dict[str, object], keys: List[Tuple[str, int]], options: Dict[str, object]) -> bool:
+    current = [(str(field), int(direction)) for field, direction in info.get("key", [])]
+    return current == keys and all(info.get(option, False) == value for option, value in options.items())
+
+
+def index_models(collection_name: str, names: Iterable[str] | None = None) -> List[IndexModel]:
+    definitions = INDEX_DEFINITIONS[collection_name]
+    return [
+        IndexModel(definitions[name][0], name=name, **definitions[name][1])
+        for name in (names if names is not None else definitions)
+    ]
+
+
+def ensure_indexes(db, collection_name: str) -> Tuple[List[str], float]:
+    """定義と異なるインデックスを作り直し、足りないものを1回のcreate_indexesでまとめて作る
+
+    作成したインデックス名と構築にかかった秒数を返す。
+    """
+    collection = db[collection_name]
+    existing = collection.index_information()
+    missing: List[str] = []
+    for name, (keys, options) in INDEX_DEFINITIONS[collection_name].items():
+        info = existing.get(name)
+        if info is not None and _index_matches(info, keys, options):
+            continue
+        if info is not None:
+            collection.drop_index(name)
+        missing.append(name)
+    started = time.perf_counter()
+    if missing:
+        collection.create_indexes(index_models(collection_name, missing))
+    return missing, time.perf_counter() - started
+
+
+def defer_indexes(db, collection_name: str) -> List[str]:
+    """一括投入の前に、管理対象のうちunique以外のセカンダリインデックスを削除する
+
+    uniqueインデックスは重複の検出に必要なので残す。管理対象外のインデックスには触れない。
+    """
+    collection = db[collection_name]
+    existing = collection.index_information()
+    dropped: List[str] = []
+    for name, (_, options) in INDEX_DEFINITIONS[collection_name].items():
+        if options.get("unique") or name not in existing:
+            continue
+        collection.drop_index(name)
+        dropped.append(name)
+    return dropped
+
+
+def verify_indexes(db, collection_name: str) -> List[str]:
+    """定義どおりになっていないインデックス名を返す"""
+    existing = db[collection_name].index_information()
+    return [
+        name for name, (keys, options) in INDEX_DEFINITIONS[collection_name].items()
+        if name not in existing or not _index_matches(existing[name], keys, options)
+    ]
+
+
+def should_defer_indexes(mode: str, expected_reviews: int | None) -> bool:
+    if mode == "deferred":
+        return True
+    if mode == "online":
+        return False
+    return expected_reviews is None or expected_reviews >= DEFERRED_INDEX_THRESHOLD
+
+
+def prepare_indexes(db, deferred: bool) -> List[str]:
+    """投入前の準備。商品側は常に作成し、レビュー側は遅延時はunique以外を外し、そうでなければ作成する
+
+    遅延のために削除したインデックス名を返す。
+    """
+    ensure_indexes(db, COLLECTION_PRODUCTS)
+    if deferred:
+        dropped = defer_indexes(db, COLLECTION_REVIEWS)
+        # uniqueなものは投入中も必要なので、足りなければ先に作る
+        unique = [
+            name for name, (_, options) in INDEX_DEFINITIONS[COLLECTION_REVIEWS].items() if options.get("unique")
+        ]
+        existing = db[COLLECTION_REVIEWS].index_information()
+        if any(name not in existing for name in unique):
+            db[COLLECTION_REVIEWS].create_indexes(index_models(COLLECTION_REVIEWS, unique))
+        return dropped
+    ensure_indexes(db, COLLECTION_REVIEWS)
+    return []
+
+
+def finalize_indexes(db) -> Dict[str, Tuple[List[str], float]]:
+    """投入後にインデックスをまとめて作り、定義どおりになっているか確認する"""
+    built = {collection_name: ensure_indexes(db, collection_name) for collection_name in INDEX_DEFINITIONS}
+    problems = [
+        f"{collection_name}.{name}"
+        for collection_name in INDEX_DEFINITIONS
+        for name in verify_indexes(db, collection_name)
+    ]
+    if problems:
+        raise RuntimeError(f"インデックスが定義どおりに作成されていません: {', '.join(problems)}")
+    return built
+
+
+def report_indexes(built: Dict[str, Tuple[List[str], float]], deferred: bool) -> None:
+    mode = "投入後に一括構築" if deferred else "投入前に作成"
+    print(f"\n🗂️  インデックス（{mode}、すべて定義どおりであることを確認しました）:")
+    for collection_name, (names, elapsed) in built.items():
+        total = len(INDEX_DEFINITIONS[collection_name])
+        if names:
+            print(f"  - {collection_name}: {total}件中{len(names)}件を構築 {elapsed:.2f}秒 ({', '.join(names)})")
+        else:
+            print(f"  - {collection_name}: {total}件とも作成済み")
@@ -0,0 +1,182 @@
+"""中断した取り込みを再開するためのチェックポイントジャーナル"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import struct
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+
+from bson import ObjectId
+from pymongo import InsertOne
+
+from . import catalog
+from .cache import _catalog_fingerprint
+
+
+IMPORT_JOURNAL = "import_journal.json"
+
+
+class CheckpointJournal:
+    """置き換え型の取り込みの進捗を記録するジャーナル
+
+    既存レビューを削除済みの商品と、書き込みを終えたバッチの通し番号を持ち、バッチが終わるたびに
+    一時ファイル経由で保存する。番号は先頭から途切れずに終わった分を件数（batchesThrough）にまとめるので、
+    バッチ数が増えても保存する内容は並行して書き込み中の分程度に収まる。
+    --resumeでは削除をやり直さず、未完了のバッチだけを再送する。
+    レビューの_idは実行ID（runId）とreviewIdから決まるObjectIdにするので、書き込み途中だった
+    バッチを再送しても重複キーになるだけでレビューは二重にならない。
+    """
+
+    def __init__(self, path: Path, fingerprint: str, state: Dict[str, object] | None = None) -> None:
+        self.path = path
+        self.state = state or {
+            "fingerprint": fingerprint,
+            "runId": os.urandom(8).hex(),
+            "startedAt": int(time.time()),
+            "deleted": [],
+            "batchesThrough": 0,
+            "batches": [],
+        }
+        self.deleted = set(self.state["deleted"])
+        self.committed_through = int(self.state["batchesThrough"])
+        self.committed = set(self.state["batches"])
+        self.failed = False
+        self._lock = threading.Lock()
+
+    @classmethod
+    def open(cls, path: Path, fingerprint: str, resume: bool) -> "CheckpointJournal":
+        if resume and path.exists():
+            state = json.loads(path.read_text(encoding="utf-8"))
+            if state.get("fingerprint") != fingerprint:
+                raise SystemExit(
+                    f"{path}は別の条件で実行した取り込みのジャーナルです。"
+                    "中断時と同じ引数で--resumeを指定するか、--resumeなしで最初からやり直してください。"
+                )
+            journal = cls(path, fingerprint, state)
+            print(f"⏯️  {path}から再開します（書き込み済み{journal.committed_batches()}バッチを省略します）")
+            return journal
+        if resume:
+            print(f"⏯️  ジャーナル{path}がないため、最初から取り込みます")
+        journal = cls(path, fingerprint)
+        journal.save()
+        return journal
+
+    def committed_batches(self) -> int:
+        return self.committed_through + len(self.committed)
+
+    def is_deleted(self, product_id: str) -> bool:
+        return product_id in self.deleted
+
+    def mark_deleted(self, product_ids: Iterable[str]) -> None:
+        with self._lock:
+            self.deleted.update(product_ids)
+            self.save()
+
+    def is_committed(self, sequence: int) -> bool:
+        return sequence < self.committed_through or sequence in self.committed
+
+    def commit(self, sequence: int) -> None:
+        with self._lock:
+            self.committed.add(sequence)
+            while self.committed_through in self.committed:
+                self.committed.remove(self.committed_through)
+                self.committed_through += 1
+            self.save()
+
+    def object_id(self, review_id: str) -> ObjectId:
+        # 先頭4バイトは通常のObjectIdと同じく生成時刻（ここでは実行開始時刻）
+        digest = hashlib.blake2b(f"{self.state['runId']}:{review_id}".encode("utf-8"), digest_size=8).digest()
+        return ObjectId(struct.pack(">I", int(self.state["startedAt"])) + digest)
+
+    def save(self) -> None:
+        self.state["deleted"] = sorted(self.deleted)
+        self.state["batchesThrough"] = self.committed_through
+        self.state["batches"] = sorted(self.committed)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        tmp_path.write_text(json.dumps(self.state, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp_path, self.path)
+
+    @contextmanager
+    def track(self):
+        """書き込みが最後まで成功したらジャーナルを消し、中断・失敗したら再開方法を表示する"""
+        try:
+            yield self
+        except BaseException:
+            self._print_resume_hint()
+            raise
+        if self.failed:
+            self._print_resume_hint()
+        else:
+            self.path.unlink(missing_ok=True)
+
+    def _print_resume_hint(self) -> None:
+        print(
+            f"⏯️  書き込みが完了していません。同じ引数に--resumeを付けて実行すると、{self.path}から"
+            f"未完了のバッチだけを再送します（書き込み済み{self.committed_batches()}バッチ）",
+            file=sys.stderr,
+        )
+
+
+def journal_fingerprint(mode: str, args: argparse.Namespace, mongodb_uri: str, mongodb_db: str, sources: Iterable[Path]) -> str:
+    """再開してよいかの判定に使う、書き込む文書とバッチの区切りを決める条件のハッシュ"""
+    settings = {
+        "mode": mode,
+        # 認証情報を含みうるのでURIはハッシュだけを使う
+        "uri": hashlib.sha256(mongodb_uri.encode("utf-8")).hexdigest(),
+        "db": mongodb_db,
+        "seed": args.seed,
+        "perSentiment": args.per_sentiment,
+        "keepExisting": args.keep_existing,
+        "batchSize": args.batch_size,
+        "streamSplits": args.stream_splits,
+        "metadataGenerator": args.metadata_generator,
+        "annotationSchema": args.annotation_schema,
+        "catalog": _catalog_fingerprint(catalog.PRODUCT_CONFIGS),
+        "sources": {str(path): path.stat().st_size for path in sources},
+    }
+    return hashlib.sha256(json.dumps(settings, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def open_journal(
+    args: argparse.Namespace,
+    mode: str,
+    mongodb_uri: str,
+    mongodb_db: str,
+    sources: Iterable[Path]
+) -> CheckpointJournal:
+    path = args.journal or args.data_dir / IMPORT_JOURNAL
+    return CheckpointJournal.open(path, journal_fingerprint(mode, args, mongodb_uri, mongodb_db, sources), args.resume)
+
+
+def review_insert_batches(
+    documents: Iterable[Dict[str, object]],
+    batch_size: int,
+    journal: CheckpointJournal | None = None
+) -> Iterable[Tuple[int, List[InsertOne]]]:
+    """レビュー文書を届いた順にbatch_size件ずつのバッチにまとめる
+
+    キーはバッチの通し番号で、ジャーナルに記録する単位になる。文書の順序は再開の判定条件
+    （journal_fingerprint）が同じなら変わらないので、同じ番号のバッチには同じレビューが入る。
+    商品ごとに分けないため、商品が多くても小さなバッチが増えず、保留する文書も1バッチ分で済む。
+    """
+    batch: List[InsertOne] = []
+    sequence = 0
+    for document in documents:
+        if journal is not None:
+            document.setdefault("_id", journal.object_id(str(document["reviewId"])))
+        batch.append(InsertOne(document))
+        if len(batch) >= batch_size:
+            yield sequence, batch
+            sequence += 1
+            batch = []
+    if batch:
+        yield sequence, batch
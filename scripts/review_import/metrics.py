@@ -0,0 +1,154 @@
+"""--profile: 段階ごとの実行時間・メモリとMongoDB呼び出しの計測"""
+
+from __future__ import annotations
+
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - Windows
+    resource = None
+
+
+def peak_rss_mb() -> float | None:
+    """プロセス開始からの最大常駐メモリ（MB）"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linuxはキロバイト、macOSはバイト単位
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+class ImportMetrics:
+    """--profile指定時に各段階の実行時間・CPU時間・最大RSS・件数とMongoDB呼び出しを記録する
+
+    無効時はstage()が何もしないコンテキストを返し、wrap_db()はDBをそのまま返すため、
+    計測のためのオーバーヘッドはほぼない。
+    """
+
+    STAGE_LABELS = {
+        "download": "ダウンロード",
+        "selection": "抽出",
+        "build": "文書構築",
+        "product_upsert": "商品の書き込み",
+        "review_insert": "レビューの書き込み",
+        "pipeline": "非同期パイプライン",
+        "stream": "ストリーミング取り込み",
+        "index_build": "インデックス構築",
+        "dump": "ダンプの書き出し",
+    }
+
+    def __init__(self, enabled: bool = False) -> None:
+        self.enabled = enabled
+        self.stages: List[Dict[str, object]] = []
+        self.counters: Dict[str, int] = {}
+        self.mongo_calls: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str):
+        """with metrics.stage("build") as stage: ... stage["records"] = 件数"""
+        info: Dict[str, object] = {"records": None}
+        if not self.enabled:
+            yield info
+            return
+        wall_started = time.perf_counter()
+        cpu_started = time.process_time()
+        try:
+            yield info
+        finally:
+            wall = time.perf_counter() - wall_started
+            records = info["records"]
+            self.stages.append({
+                "stage": name,
+                "wall_seconds": round(wall, 6),
+                "cpu_seconds": round(time.process_time() - cpu_started, 6),
+                "peak_rss_mb": peak_rss_mb(),
+                "records": records,
+                "records_per_second": round(records / wall, 1) if records and wall > 0 else None,
+            })
+
+    def count(self, name: str, value: int) -> None:
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def record_call(self, name: str, seconds: float) -> None:
+        with self._lock:
+            call = self.mongo_calls.setdefault(name, {"calls": 0, "total_seconds": 0.0, "max_seconds": 0.0})
+            call["calls"] += 1
+            call["total_seconds"] += seconds
+            call["max_seconds"] = max(call["max_seconds"], seconds)
+
+    def wrap_db(self, db):
+        return _InstrumentedDatabase(db, self) if self.enabled else db
+
+    def to_dict(self) -> Dict[str, object]:
+        return {
+            "stages": self.stages,
+            "counters": self.counters,
+            "mongo_calls": {
+                name: {key: round(value, 6) if isinstance(value, float) else value for key, value in call.items()}
+                for name, call in sorted(self.mongo_calls.items())
+            },
+            "peak_rss_mb": peak_rss_mb(),
+        }
+
+    def report(self) -> None:
+        print("\n📈 プロファイル:")
+        for stage in self.stages:
+            label = self.STAGE_LABELS.get(str(stage["stage"]), stage["stage"])
+            message = f"  - {label}: {stage['wall_seconds']:.2f}秒 (CPU {stage['cpu_seconds']:.2f}秒)"
+            if stage["records"] is not None:
+                message += f", {stage['records']}件"
+                if stage["records_per_second"]:
+                    message += f" ({stage['records_per_second']:,.0f}件/s)"
+            if stage["peak_rss_mb"] is not None:
+                message += f", 最大RSS {stage['peak_rss_mb']:.1f} MB"
+            print(message)
+        if self.counters:
+            print("  - 件数: " + ", ".join(f"{name} {value}" for name, value in self.counters.items()))
+        for name, call in sorted(self.mongo_calls.items()):
+            print(
+                f"  - MongoDB {name}: {call['calls']}回, 合計{call['total_seconds']:.3f}秒, "
+                f"最大{call['max_seconds'] * 1000:.0f}ms"
+            )
+
+
+class _InstrumentedCollection:
+    """コレクションのメソッド呼び出しごとの所要時間をImportMetricsに記録する"""
+
+    def __init__(self, collection, metrics: ImportMetrics) -> None:
+        self._collection = collection
+        self._metrics = metrics
+
+    def __getattr__(self, name: str):
+        attribute = getattr(self._collection, name)
+        if not callable(attribute):
+            return attribute
+        label = f"{self._collection.name}.{name}"
+        metrics = self._metrics
+
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return attribute(*args, **kwargs)
+            finally:
+                metrics.record_call(label, time.perf_counter() - started)
+
+        return timed
+
+
+class _InstrumentedDatabase:
+    def __init__(self, db, metrics: ImportMetrics) -> None:
+        self._db = db
+        self._metrics = metrics
+
+    def __getitem__(self, name: str) -> _InstrumentedCollection:
+        return _InstrumentedCollection(self._db[name], self._metrics)
+
+    def __getattr__(self, name: str):
+        return getattr(self._db, name)
@@ -0,0 +1,39 @@
+"""MongoDBの接続オプション・コレクション名と、一時的なエラーの判定"""
+
+from __future__ import annotations
+
+from typing import Dict
+
+from pymongo.errors import ConnectionFailure, PyMongoError
+from pymongo.server_api import ServerApi
+
+
+DUPLICATE_KEY_ERROR = 11000
+
+COLLECTION_PRODUCTS = "products"
+COLLECTION_REVIEWS = "reviews"
+
+
+# 一時的な障害の再送間隔の上限（秒）
+RETRY_MAX_DELAY = 30.0
+
+
+def is_transient_error(exc: BaseException) -> bool:
+    """接続断・タイムアウト・フェイルオーバーなど、同じバッチを再送すれば成功しうるエラーか"""
+    # ConnectionFailureはAutoReconnect、NetworkTimeout、ServerSelectionTimeoutErrorを含む
+    if isinstance(exc, ConnectionFailure):
+        return True
+    return isinstance(exc, PyMongoError) and exc.has_error_label("RetryableWriteError")
+
+
+def mongo_client_options(mongodb_uri: str) -> Dict[str, object]:
+    # MongoDB接続オプションを設定（DNS解決の問題を回避）
+    client_options: Dict[str, object] = {
+        "serverSelectionTimeoutMS": 30000,  # 30秒
+        "connectTimeoutMS": 30000,
+    }
+    
+    # MongoDB Atlasの場合、Server APIを指定
+    if "mongodb+srv://" in mongodb_uri:
+        client_options["server_api"] = ServerApi("1")
+    return client_options
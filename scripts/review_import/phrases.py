@@ -0,0 +1,147 @@
+"""データセット全体から商品名候補の語句を数える"""
+
+from __future__ import annotations
+
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+
+from .catalog import match_review_to_product
+from .dataset import DOWNLOAD_CHUNK_SIZE, detect_compression, iter_lines
+from .decoders import ReviewRecord, get_decoder
+from .text import classify_sentiment, product_name_candidates
+
+
+PHRASE_GROUPS = ("all", "product", "sentiment")
+
+
+def _phrase_group(record: ReviewRecord, group_by: str) -> str | None:
+    if group_by == "product":
+        return match_review_to_product(record) or "none"
+    if group_by == "sentiment":
+        return classify_sentiment(record.label)
+    return "all"
+
+
+def _shard_ranges(path: Path, shards: int) -> List[Tuple[int, int]]:
+    """ファイルを行の境界でそろえたおよそ等しいバイト範囲に分ける"""
+    size = path.stat().st_size
+    if size == 0:
+        return []
+    boundaries = [0]
+    with path.open("rb") as f:
+        for shard in range(1, shards):
+            f.seek(max(boundaries[-1], size * shard // shards))
+            f.readline()
+            position = f.tell()
+            if position >= size:
+                break
+            if position > boundaries[-1]:
+                boundaries.append(position)
+    boundaries.append(size)
+    return list(zip(boundaries, boundaries[1:]))
+
+
+def _shard_lines(path: Path, start: int, end: int | None) -> Iterable[bytes]:
+    """start〜endバイトの行を返す（endがNoneならファイル全体。圧縮ファイルはこちらのみ）"""
+    if end is None:
+        yield from iter_lines(path)
+        return
+    with path.open("rb") as f:
+        f.seek(start)
+        position = start
+        while position < end:
+            line = f.readline()
+            if not line:
+                break
+            position += len(line)
+            yield line
+
+
+def _mine_shard(
+    path: Path,
+    split: str,
+    start: int,
+    end: int | None,
+    group_by: str,
+    contains: str | None,
+    decoder_name: str
+) -> Dict[str, Counter]:
+    decoder = get_decoder(decoder_name)
+    counts: Dict[str, Counter] = {}
+    for line in _shard_lines(path, start, end):
+        line = line.strip()
+        if not line:
+            continue
+        record = ReviewRecord.from_mapping(decoder.decode(line), split)
+        if contains and contains not in record.text:
+            continue
+        candidates = product_name_candidates(str(record.text))
+        if not candidates:
+            continue
+        # 候補のないレビューではキーワード照合を省く
+        group = _phrase_group(record, group_by)
+        if group is None:
+            continue
+        counter = counts.get(group)
+        if counter is None:
+            counter = counts[group] = Counter()
+        counter.update(candidates)
+    return counts
+
+
+def merge_phrase_counts(parts: Iterable[Dict[str, Counter]]) -> Dict[str, Counter]:
+    merged: Dict[str, Counter] = {}
+    for part in parts:
+        for group, counter in part.items():
+            if group in merged:
+                merged[group].update(counter)
+            else:
+                merged[group] = Counter(counter)
+    return merged
+
+
+def mine_phrases(
+    dataset_paths: Dict[str, Path],
+    group_by: str = "product",
+    contains: str | None = None,
+    workers: int = 1,
+    decoder_name: str = "auto"
+) -> Dict[str, Counter]:
+    """データセット全体から商品名候補をグループ（商品・感情・全体）ごとに数える
+
+    各ファイルを行境界でそろえたバイト範囲に分け、ワーカープロセスごとに数えた結果を
+    ファイル順に足し合わせる。同数の候補の順序（最初に現れた順）はワーカー数によらない。
+    """
+    if group_by not in PHRASE_GROUPS:
+        raise ValueError(f"group_byは{', '.join(PHRASE_GROUPS)}のいずれかです: {group_by}")
+    shards = []
+    for split, path in dataset_paths.items():
+        if detect_compression(path) is not None:
+            # 圧縮ファイルは途中から読めないため1ファイル1シャードにする
+            shards.append((path, split, 0, None))
+            continue
+        per_file = max(1, min(workers * 4, path.stat().st_size // DOWNLOAD_CHUNK_SIZE)) if workers > 1 else 1
+        shards.extend((path, split, start, end) for start, end in _shard_ranges(path, per_file))
+    arguments = [
+        (path, split, start, end, group_by, contains, decoder_name) for path, split, start, end in shards
+    ]
+    if workers <= 1 or len(shards) <= 1:
+        return merge_phrase_counts(_mine_shard(*argument) for argument in arguments)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return merge_phrase_counts(executor.map(_mine_shard, *zip(*arguments)))
+
+
+def mine_product_names(
+    dataset_paths: Dict[str, Path],
+    workers: int = 1,
+    decoder_name: str = "auto"
+) -> Dict[str, str]:
+    """コーパスを1回走査し、キーワードでマッチした各商品の最頻出の商品名候補を返す"""
+    counts = mine_phrases(dataset_paths, group_by="product", workers=workers, decoder_name=decoder_name)
+    return {
+        product_id: counter.most_common(1)[0][0]
+        for product_id, counter in counts.items()
+        if product_id != "none" and counter
+    }
@@ -0,0 +1,276 @@
+"""商品ごと・感情ごとの件数を満たすレビューの抽出"""
+
+from __future__ import annotations
+
+import random
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+
+try:
+    import numpy as np  # type: ignore
+except ImportError:  # pragma: no cover - optional dependency
+    np = None
+
+from . import catalog
+from .cache import ReviewCache
+from .catalog import match_review_to_product
+from .decoders import JsonlDecoder, ReviewRecord, iter_records
+from .text import classify_sentiment
+
+
+# 完了時の概要に商品ごとの内訳を表示する上限
+SUMMARY_PRODUCTS = 20
+
+
+class ReservoirSampler:
+    """シード付きの固定長リザーバーサンプリング（Algorithm R）"""
+
+    def __init__(self, capacity: int, rng: random.Random) -> None:
+        self.capacity = capacity
+        self.rng = rng
+        self.items: List[Dict[str, object]] = []
+        self.seen = 0
+
+    def offer(self, item: Dict[str, object]) -> None:
+        self.seen += 1
+        if len(self.items) < self.capacity:
+            self.items.append(item)
+            return
+        slot = self.rng.randrange(self.seen)
+        if slot < self.capacity:
+            self.items[slot] = item
+
+    def drain(self) -> List[Dict[str, object]]:
+        """サンプルをシャッフルして取り出す（末尾からpopして使う）"""
+        items = self.items
+        self.items = []
+        self.rng.shuffle(items)
+        return items
+
+
+def _empty_selection() -> Dict[str, Dict[str, list]]:
+    return {product["id"]: {"positive": [], "negative": []} for product in catalog.PRODUCT_CONFIGS}
+
+
+def _unmatched_pools(per_sentiment: int, seed: int) -> Dict[str, ReservoirSampler]:
+    # マッチングできなかったレビューは補完用にリザーバーで保持する。
+    # 補完で使われ得るのは最大で「商品数 × per_sentiment」件なので、
+    # メモリ使用量はコーパスサイズではなくこの上限で決まる。
+    # 肯定/否定で乱数列を分け、走査方法によらず同じサンプルになるようにする。
+    capacity = per_sentiment * len(catalog.PRODUCT_CONFIGS)
+    return {
+        sentiment: ReservoirSampler(capacity, random.Random(f"{seed}:{sentiment}"))
+        for sentiment in ("positive", "negative")
+    }
+
+
+def _backfill(selected: Dict[str, Dict[str, list]], pools: Dict[str, ReservoirSampler], per_sentiment: int) -> None:
+    # 不足分をランダムに補完（マッチングできなかったレビューを使用）
+    unmatched_positives = pools["positive"].drain()
+    unmatched_negatives = pools["negative"].drain()
+    
+    for product in catalog.PRODUCT_CONFIGS:
+        product_id = product["id"]
+        # 肯定レビューの不足分を補完
+        while len(selected[product_id]["positive"]) < per_sentiment and unmatched_positives:
+            selected[product_id]["positive"].append(unmatched_positives.pop())
+        # 否定レビューの不足分を補完
+        while len(selected[product_id]["negative"]) < per_sentiment and unmatched_negatives:
+            selected[product_id]["negative"].append(unmatched_negatives.pop())
+
+
+class RecordSelector:
+    """商品×感情ごとの枠を出現順に埋め、最後に未マッチのサンプルで不足分を補完する
+
+    逐次の走査（_select_records）と非同期パイプラインの両方から使う。
+    埋まっていない枠の数を数えておくので、商品数が多くても完了の判定は定数時間で済む。
+    """
+
+    def __init__(self, per_sentiment: int, seed: int) -> None:
+        self.per_sentiment = per_sentiment
+        self.selected = _empty_selection()
+        self.pools = _unmatched_pools(per_sentiment, seed)
+        self.unfilled = len(self.selected) * 2 if per_sentiment > 0 else 0
+
+    def offer(self, item: object, sentiment: str, matched_product_id: str | None) -> int | None:
+        """枠に採用した場合は商品内のレビュー番号（1始まり）を返す"""
+        if not matched_product_id:
+            self.pools[sentiment].offer(item)
+            return None
+
+        # 必要なレビュー数に達していない場合のみ追加
+        bucket = self.selected[matched_product_id][sentiment]
+        if len(bucket) >= self.per_sentiment:
+            return None
+        bucket.append(item)
+        if len(bucket) == self.per_sentiment:
+            self.unfilled -= 1
+        return self.review_index(sentiment, len(bucket))
+
+    def review_index(self, sentiment: str, position: int) -> int:
+        # 肯定レビューに1..per_sentiment、否定レビューにその続きの番号を振る
+        return position if sentiment == "positive" else self.per_sentiment + position
+
+    @property
+    def complete(self) -> bool:
+        """すべての商品で必要なレビュー数に達したか"""
+        return self.unfilled == 0
+
+    def finish(self) -> List[Tuple[str, str, object, int]]:
+        """不足分を補完し、補完した(商品ID, 感情, レコード, レビュー番号)の一覧を返す"""
+        before = {
+            product_id: {sentiment: len(items) for sentiment, items in by_sentiment.items()}
+            for product_id, by_sentiment in self.selected.items()
+        }
+        _backfill(self.selected, self.pools, self.per_sentiment)
+        added: List[Tuple[str, str, object, int]] = []
+        for product_id, by_sentiment in self.selected.items():
+            for sentiment, items in by_sentiment.items():
+                for position in range(before[product_id][sentiment], len(items)):
+                    added.append((product_id, sentiment, items[position], self.review_index(sentiment, position + 1)))
+        return added
+
+
+def _selection_size(selected: Dict[str, Dict[str, list]]) -> int:
+    return sum(len(items) for by_sentiment in selected.values() for items in by_sentiment.values())
+
+
+def _select_records(
+    candidates: Iterable[Tuple[object, str, str | None]],
+    per_sentiment: int,
+    seed: int,
+    stats: Dict[str, int] | None = None
+) -> Dict[str, Dict[str, list]]:
+    """(レコード, 感情, マッチした商品ID)の列から商品ごとの枠を埋め、不足分を補完する"""
+    selector = RecordSelector(per_sentiment, seed)
+    for item, sentiment, matched_product_id in candidates:
+        if selector.offer(item, sentiment, matched_product_id) is not None and selector.complete:
+            break
+    backfilled = selector.finish()
+    if stats is not None:
+        stats["backfilled"] = len(backfilled)
+        stats["matched"] = _selection_size(selector.selected) - len(backfilled)
+    return selector.selected
+
+
+def _iter_dataset_candidates(
+    dataset_paths: Dict[str, Path],
+    decoder: JsonlDecoder | None = None
+) -> Iterable[Tuple[object, str, str | None]]:
+    for record in iter_records(dataset_paths, decoder):
+        sentiment = classify_sentiment(record.label)
+        if sentiment is None:
+            continue
+        # レビューを最も適切な商品にマッチング
+        yield record, sentiment, match_review_to_product(record)
+
+
+def _iter_cache_candidates(cache: ReviewCache) -> Iterable[Tuple[object, str, str | None]]:
+    labels = cache.column("labels")
+    matched = cache.column("matched")
+    product_ids = cache.product_ids
+    for index in range(len(cache)):
+        sentiment = classify_sentiment(labels[index])
+        if sentiment is None:
+            continue
+        product_index = matched[index]
+        yield index, sentiment, product_ids[product_index] if product_index >= 0 else None
+
+
+def _select_cached_vectorized(
+    cache: ReviewCache,
+    per_sentiment: int,
+    seed: int,
+    stats: Dict[str, int] | None = None
+) -> Dict[str, Dict[str, list]]:
+    """_select_recordsと同じ選択をnumpyの列演算で行い、レコード番号を返す"""
+    labels = np.frombuffer(cache.column("labels"), dtype=np.int8)
+    matched = np.frombuffer(cache.column("matched"), dtype=np.int32)
+    total = len(labels)
+    sentiment_masks = {"positive": labels >= 3, "negative": labels <= 1}
+
+    # 商品×感情ごとに、出現順で先頭per_sentiment件のレコード番号を取る
+    candidates = np.flatnonzero((matched >= 0) & (sentiment_masks["positive"] | sentiment_masks["negative"]))
+    group_keys = matched[candidates].astype(np.int64) * 2 + sentiment_masks["negative"][candidates]
+    order = np.argsort(group_keys, kind="stable")
+    sorted_keys = group_keys[order]
+    sorted_candidates = candidates[order]
+
+    selected = _empty_selection()
+    stop = total
+    complete = per_sentiment > 0
+    last_needed = -1
+    for product_index, product_id in enumerate(cache.product_ids):
+        for offset, sentiment in enumerate(("positive", "negative")):
+            key = product_index * 2 + offset
+            start, end = np.searchsorted(sorted_keys, [key, key + 1])
+            picked = sorted_candidates[start:min(end, start + per_sentiment)]
+            selected[product_id][sentiment] = picked.tolist()
+            if len(picked) < per_sentiment:
+                complete = False
+            elif len(picked):
+                last_needed = max(last_needed, int(picked[-1]))
+    # 全商品の枠が埋まった時点で逐次版は走査を打ち切るため、それ以降の未マッチは対象外
+    if complete:
+        stop = last_needed
+
+    pools = _unmatched_pools(per_sentiment, seed)
+    unmatched = matched[:stop] < 0
+    for sentiment, mask in sentiment_masks.items():
+        pool = pools[sentiment]
+        for index in np.flatnonzero(unmatched & mask[:stop]).tolist():
+            pool.offer(index)
+
+    matched_count = _selection_size(selected)
+    _backfill(selected, pools, per_sentiment)
+    if stats is not None:
+        stats["matched"] = matched_count
+        stats["backfilled"] = _selection_size(selected) - matched_count
+    return selected
+
+
+def collect_records(
+    dataset_paths: Dict[str, Path],
+    per_sentiment: int,
+    seed: int = 42,
+    cache: ReviewCache | None = None,
+    decoder: JsonlDecoder | None = None,
+    stats: Dict[str, int] | None = None
+) -> Dict[str, Dict[str, List[ReviewRecord]]]:
+    """データセットを1回だけ走査し、商品ごとの枠と補完用のサンプルを同時に確保する
+
+    キャッシュが渡された場合はJSONLを読まずに列データから選択し、
+    選ばれたレコードだけ本文を復元する。statsを渡すと、キーワードでマッチした件数（matched）と
+    未マッチのレビューで補完した件数（backfilled）を書き込む。
+    """
+    if cache is None:
+        return _select_records(_iter_dataset_candidates(dataset_paths, decoder), per_sentiment, seed, stats)
+
+    if np is not None:
+        selected_indices = _select_cached_vectorized(cache, per_sentiment, seed, stats)
+    else:
+        selected_indices = _select_records(_iter_cache_candidates(cache), per_sentiment, seed, stats)
+    return {
+        product_id: {
+            sentiment: [cache.record(index) for index in indices]
+            for sentiment, indices in by_sentiment.items()
+        }
+        for product_id, by_sentiment in selected_indices.items()
+    }
+
+
+def ensure_records_sufficient(
+    records: Dict[str, Dict[str, List[ReviewRecord]]],
+    per_sentiment: int
+) -> None:
+    shortages: List[str] = []
+    for product in catalog.PRODUCT_CONFIGS:
+        for sentiment in ("positive", "negative"):
+            count = len(records[product["id"]][sentiment])
+            if count < per_sentiment:
+                shortages.append(f"{product['id']} ({sentiment}): {count}/{per_sentiment}")
+    if shortages:
+        message = "十分な件数のレビューを収集できませんでした:\n  " + "\n  ".join(shortages[:SUMMARY_PRODUCTS])
+        if len(shortages) > SUMMARY_PRODUCTS:
+            message += f"\n  ...ほか{len(shortages) - SUMMARY_PRODUCTS}件"
+        raise RuntimeError(message)
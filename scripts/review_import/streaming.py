@@ -0,0 +1,89 @@
+"""--stream: 全レビューを商品に割り当て、構築した順に返す"""
+
+from __future__ import annotations
+
+import zlib
+from pathlib import Path
+from typing import Dict, Iterable, Tuple
+
+from . import catalog
+from .catalog import get_keyword_matcher
+from .decoders import JsonlDecoder, iter_records
+from .documents import ProductAccumulator, ReviewBuildTask, ReviewDocument, iter_review_documents
+from .journal import CheckpointJournal, review_insert_batches
+from .mongo import COLLECTION_REVIEWS
+from .text import classify_sentiment
+from .writer import BulkWriter, WriteStats, delete_existing_reviews
+
+
+def _assign_product(record_id: object, scores: Dict[str, int], seed: int) -> str:
+    """キーワードで商品が決まらないレビューはIDのハッシュで商品に振り分ける"""
+    if scores:
+        return max(scores.items(), key=lambda x: x[1])[0]
+    bucket = zlib.crc32(f"{seed}:{record_id}".encode("utf-8")) % len(catalog.PRODUCT_CONFIGS)
+    return str(catalog.PRODUCT_CONFIGS[bucket]["id"])
+
+
+def _stream_build_tasks(
+    dataset_paths: Dict[str, Path],
+    accumulators: Dict[str, ProductAccumulator],
+    seed: int,
+    decoder: JsonlDecoder | None = None
+) -> Iterable[ReviewBuildTask]:
+    matcher = get_keyword_matcher()
+    products = {str(product["id"]): product for product in catalog.PRODUCT_CONFIGS}
+    review_counts = {product_id: 0 for product_id in products}
+    for record in iter_records(dataset_paths, decoder):
+        sentiment = classify_sentiment(record.label)
+        if sentiment is None:
+            continue
+        entries = matcher.find_entries(str(record.text))
+        product_id = _assign_product(record.id, matcher.count_entries(entries)["product"], seed)
+        accumulators[product_id].observe_keywords(entries)
+        review_counts[product_id] += 1
+        yield record, products[product_id], review_counts[product_id], sentiment
+
+
+def stream_reviews(
+    db,
+    dataset_paths: Dict[str, Path],
+    seed: int = 42,
+    decoder: JsonlDecoder | None = None,
+    keep_existing: bool = False,
+    writer: BulkWriter | None = None,
+    build_workers: int = 1,
+    journal: CheckpointJournal | None = None,
+    generator: str = "python",
+    annotation_schema: str = "embedded"
+) -> Tuple[Dict[str, ProductAccumulator], WriteStats]:
+    """データセットの全レビューを商品に割り当て、構築した順にバッチで書き込む
+
+    抽出・構築・書き込みはジェネレータでつながっており、保持するのは
+    書き込み待ちのバッチと商品ごとの集計値だけなので、件数によらずメモリは一定。
+    """
+    writer = writer or BulkWriter(db)
+    accumulators = {str(product["id"]): ProductAccumulator(product) for product in catalog.PRODUCT_CONFIGS}
+    if not keep_existing:
+        delete_existing_reviews(writer, accumulators, journal)
+
+    # 再開時も商品の集計のために全レビューを構築し直すが、書き込み済みのバッチは送らない
+    reviews = stream_review_documents(dataset_paths, accumulators, seed, decoder, build_workers, generator)
+    documents = (review.to_document(annotation_schema) for review in reviews)
+    batches = review_insert_batches(documents, writer.batch_size, journal)
+    stats = writer.write_batches(COLLECTION_REVIEWS, batches, label="reviews", journal=journal)
+    return accumulators, stats
+
+
+def stream_review_documents(
+    dataset_paths: Dict[str, Path],
+    accumulators: Dict[str, ProductAccumulator],
+    seed: int = 42,
+    decoder: JsonlDecoder | None = None,
+    build_workers: int = 1,
+    generator: str = "python"
+) -> Iterable[ReviewDocument]:
+    """全レビューを構築した順に返し、その都度accumulatorsに集計する"""
+    tasks = _stream_build_tasks(dataset_paths, accumulators, seed, decoder)
+    for review in iter_review_documents(tasks, seed=seed, workers=build_workers, generator=generator):
+        accumulators[review.product_id].add(review)
+        yield review
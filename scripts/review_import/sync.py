@@ -0,0 +1,109 @@
+"""--sync: 内容ハッシュで既存の文書と照合し、差分だけを書き込む"""
+
+from __future__ import annotations
+
+from typing import Dict, List, Tuple
+
+from pymongo import DeleteMany, InsertOne, ReplaceOne, UpdateOne
+
+from . import catalog
+from .documents import ReviewDocument, _chunked
+from .mongo import COLLECTION_PRODUCTS, COLLECTION_REVIEWS
+from .writer import BulkWriter, WriteStats, content_hash, upsert_products
+
+
+def format_sync_counts(label: str, counts: Dict[str, int]) -> str:
+    return (
+        f"{label}: 追加{counts['inserted']}件, 更新{counts['updated']}件, "
+        f"変更なし{counts['unchanged']}件, 削除{counts['removed']}件"
+    )
+
+
+def sync_products(
+    db,
+    product_documents: Dict[str, Dict[str, object]],
+    writer: BulkWriter | None = None
+) -> Tuple[Dict[str, int], WriteStats]:
+    """内容ハッシュが変わった商品だけをupsertする"""
+    writer = writer or BulkWriter(db)
+    existing = {
+        document["productId"]: document.get("contentHash")
+        for document in db[COLLECTION_PRODUCTS].find(
+            {"productId": {"$in": list(product_documents.keys())}},
+            {"productId": 1, "contentHash": 1},
+        )
+    }
+    counts = {"inserted": 0, "updated": 0, "unchanged": 0, "removed": 0}
+    changed: Dict[str, Dict[str, object]] = {}
+    for product_id, document in product_documents.items():
+        digest = content_hash(document)
+        if product_id not in existing:
+            counts["inserted"] += 1
+        elif existing[product_id] == digest:
+            counts["unchanged"] += 1
+            continue
+        else:
+            counts["updated"] += 1
+        changed[product_id] = {**document, "contentHash": digest}
+    return counts, upsert_products(db, changed, writer=writer)
+
+
+def sync_reviews(
+    db,
+    product_reviews: Dict[str, List[ReviewDocument]],
+    writer: BulkWriter | None = None,
+    annotation_schema: str = "embedded"
+) -> Tuple[Dict[str, int], WriteStats]:
+    """datasetIdとproductIdをキーに既存レビューと差分を取り、必要な書き込みだけを行う
+
+    内容ハッシュが同じレビューは書き込まず、変わったものは置き換え、
+    今回の選択から外れたレビュー（と重複分）だけを削除する。
+    --syncでない投入のレビューは内容ハッシュを持たないので、その分だけ文書全体を読んでハッシュを求め、
+    内容が同じならハッシュだけを書き足す（次回からは読み直さない）。
+    """
+    writer = writer or BulkWriter(db)
+    product_ids = [product["id"] for product in catalog.PRODUCT_CONFIGS if product_reviews.get(product["id"])]
+    existing: Dict[Tuple[str, str], Tuple[object, str | None]] = {}
+    stale_ids: List[object] = []
+    unhashed: Dict[object, Tuple[str, str]] = {}
+    for document in db[COLLECTION_REVIEWS].find(
+        {"productId": {"$in": product_ids}},
+        {"_id": 1, "productId": 1, "datasetId": 1, "contentHash": 1},
+    ):
+        key = (document["productId"], document.get("datasetId"))
+        if key in existing:
+            # --keep-existingで追加された重複は1件だけ残す
+            stale_ids.append(document["_id"])
+            continue
+        existing[key] = (document["_id"], document.get("contentHash"))
+        if document.get("contentHash") is None:
+            unhashed[document["_id"]] = key
+    for batch in _chunked(list(unhashed), writer.batch_size):
+        for document in db[COLLECTION_REVIEWS].find({"_id": {"$in": batch}}):
+            key = unhashed[document["_id"]]
+            existing[key] = (document["_id"], content_hash(document))
+
+    counts = {"inserted": 0, "updated": 0, "unchanged": 0, "removed": 0}
+    operations = []
+    for product_id in product_ids:
+        for review in product_reviews[product_id]:
+            key = (product_id, review.dataset_id)
+            document = review.to_document(annotation_schema)
+            digest = content_hash(document)
+            current = existing.pop(key, None)
+            if current is None:
+                counts["inserted"] += 1
+                operations.append(InsertOne({**document, "contentHash": digest}))
+            elif current[1] == digest:
+                counts["unchanged"] += 1
+                if current[0] in unhashed:
+                    operations.append(UpdateOne({"_id": current[0]}, {"$set": {"contentHash": digest}}))
+            else:
+                counts["updated"] += 1
+                operations.append(ReplaceOne({"_id": current[0]}, {**document, "contentHash": digest}))
+
+    stale_ids.extend(document_id for document_id, _ in existing.values())
+    counts["removed"] = len(stale_ids)
+    for batch in _chunked(stale_ids, writer.batch_size):
+        operations.append(DeleteMany({"_id": {"$in": batch}}))
+    return counts, writer.write(COLLECTION_REVIEWS, operations, label="reviews (sync)")
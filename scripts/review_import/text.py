@@ -0,0 +1,120 @@
+"""レビュー本文の文分割・タイトル・要約と、商品名らしき語句の抽出"""
+
+from __future__ import annotations
+
+import re
+from typing import Iterable, List, NamedTuple, Tuple
+
+
+def classify_sentiment(label: int) -> str | None:
+    if label <= 1:
+        return "negative"
+    if label >= 3:
+        return "positive"
+    return None
+
+
+# 文の区切り（split_into_sentencesの従来の挙動どおり、半角の「!」は区切りに含めない）
+_SENTENCE_PATTERN = re.compile(r"[^。！?？\n]*[。！?？\n]|[^。！?？\n]+")
+# str.splitlines()が改行として扱う文字
+_LINE_BREAKS = "\n\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029"
+_LINE_BREAK_PATTERN = re.compile(f"[{_LINE_BREAKS}]")
+# タイトルは最初の行の、最初の文末記号（半角の「!」を含む）までを使う
+_TITLE_BREAK_PATTERN = re.compile(f"[。！？!?{_LINE_BREAKS}]")
+
+
+class TextSegments(NamedTuple):
+    sentences: List[str]
+    spans: List[Tuple[int, int]]
+    title: str
+    summary: str
+
+
+def _title_from_stripped(stripped: str) -> str:
+    if not stripped:
+        return "レビュー"
+    match = _TITLE_BREAK_PATTERN.search(stripped)
+    first_sentence = (stripped[:match.start()] if match else stripped).strip()
+    if not first_sentence:
+        # 先頭が文末記号の場合は最初の行全体を使う
+        match = _LINE_BREAK_PATTERN.search(stripped)
+        first_sentence = (stripped[:match.start()] if match else stripped).strip()
+    return first_sentence[:30] + ("…" if len(first_sentence) > 30 else "")
+
+
+def _truncate_summary(collapsed: str, max_length: int) -> str:
+    if len(collapsed) <= max_length:
+        return collapsed
+    return collapsed[:max_length].rstrip() + "…"
+
+
+def sentence_spans(text: str) -> List[Tuple[int, int]]:
+    """前後の空白を除いた各文の元のテキスト上の位置（開始, 終了）を返す"""
+    spans: List[Tuple[int, int]] = []
+    for match in _SENTENCE_PATTERN.finditer(text):
+        raw = match.group()
+        sentence = raw.strip()
+        if sentence:
+            start = match.start() + len(raw) - len(raw.lstrip())
+            spans.append((start, start + len(sentence)))
+    return spans
+
+
+def segment_text(text: str, summary_length: int | None = 220, with_spans: bool = False) -> TextSegments:
+    """文の分割・タイトル・要約をまとめて求める
+
+    summary_lengthにNoneを渡すと要約は作らない。with_spansを指定すると各文の位置も返す。
+    """
+    sentences = [sentence for sentence in map(str.strip, _SENTENCE_PATTERN.findall(text)) if sentence]
+    spans = sentence_spans(text) if with_spans else []
+    title = _title_from_stripped(text.strip())
+    summary = _truncate_summary(" ".join(text.split()), summary_length) if summary_length is not None else ""
+    return TextSegments(sentences, spans, title, summary)
+
+
+def segment_texts(
+    texts: Iterable[str],
+    summary_length: int | None = 220,
+    with_spans: bool = False
+) -> List[TextSegments]:
+    """複数のテキストをまとめて処理するバッチ版"""
+    return [segment_text(text, summary_length, with_spans) for text in texts]
+
+
+def create_title(text: str) -> str:
+    return _title_from_stripped(text.strip())
+
+
+def split_into_sentences(text: str) -> List[str]:
+    return segment_text(text, summary_length=None).sentences
+
+
+def summarize_text(text: str, max_length: int = 220) -> str:
+    # \sとstr.split()はどちらもstr.isspace()の空白文字で区切るため結果は同じ
+    return _truncate_summary(" ".join(text.split()), max_length)
+
+
+# 一般的な商品名パターン
+# 「○○を購入」「○○が届いた」「○○を使った」などのパターン
+# 1つの正規表現にまとめると一致した文字列を消費して重なった候補を取りこぼすため、パターンごとに走査する
+_PRODUCT_NAME_PATTERNS = [
+    re.compile(r"([^。、\s]{2,15}?)(?:を|が|の)(?:購入|届いた|使った|使用|試した)"),
+    re.compile(r"([^。、\s]{2,15}?)の(?:レビュー|感想|評価)"),
+]
+
+
+def product_name_candidates(text: str) -> List[str]:
+    """レビュー本文から商品名らしき単語をパターンの順、パターン内では出現順に返す"""
+    return [
+        keyword
+        for pattern in _PRODUCT_NAME_PATTERNS
+        for keyword in pattern.findall(text)
+        if 2 <= len(keyword) <= 15
+    ]
+
+
+def _fallback_product_name(first_review: str) -> str:
+    # レビューの最初の文から抽出
+    first_sentence = re.split(r"[。！？!?\n]", first_review, maxsplit=1)[0]
+    # 最初の10文字程度を商品名として使用
+    return first_sentence[:15].strip()
@@ -0,0 +1,308 @@
+"""BulkWriterによるバッチ書き込みと、商品のupsert・レビューの挿入"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Tuple
+
+from pymongo import DeleteMany, UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
+
+from . import catalog
+from .documents import ReviewDocument, _chunked
+from .journal import CheckpointJournal, review_insert_batches
+from .mongo import COLLECTION_PRODUCTS, COLLECTION_REVIEWS, DUPLICATE_KEY_ERROR, RETRY_MAX_DELAY, is_transient_error
+
+
+class WriteStats:
+    """bulk_writeのバッチごとの件数と所要時間を集計する（複数スレッドから記録される）"""
+
+    def __init__(self, label: str) -> None:
+        self.label = label
+        self.batches: List[Tuple[int, float]] = []
+        self.failures: List[str] = []
+        self.retries = 0
+        self.skipped = 0
+        self.started = time.perf_counter()
+        self.finished: float | None = None
+        self._lock = threading.Lock()
+
+    def record(self, documents: int, latency: float) -> None:
+        with self._lock:
+            self.batches.append((documents, latency))
+
+    def fail(self, message: str) -> None:
+        with self._lock:
+            self.failures.append(message)
+
+    def retry(self) -> None:
+        with self._lock:
+            self.retries += 1
+
+    def skip(self, documents: int) -> None:
+        with self._lock:
+            self.skipped += documents
+
+    def finish(self) -> "WriteStats":
+        self.finished = time.perf_counter()
+        return self
+
+    @property
+    def documents(self) -> int:
+        return sum(documents for documents, _ in self.batches)
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished or time.perf_counter()) - self.started
+
+    def summary(self) -> str:
+        if not self.batches:
+            if self.skipped:
+                return f"{self.label}: 書き込みなし（再開により{self.skipped}件を省略）"
+            return f"{self.label}: 書き込みなし"
+        latencies = sorted(latency for _, latency in self.batches)
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        rate = self.documents / max(self.elapsed, 1e-9)
+        message = (
+            f"{self.label}: {self.documents}件 / {len(self.batches)}バッチ, {self.elapsed:.2f}秒 ({rate:.0f} docs/s), "
+            f"バッチ遅延 平均{sum(latencies) / len(latencies) * 1000:.0f}ms p95 {p95 * 1000:.0f}ms 最大{latencies[-1] * 1000:.0f}ms"
+        )
+        if self.retries:
+            message += f", 再試行{self.retries}回"
+        if self.skipped:
+            message += f", 再開により{self.skipped}件を省略"
+        if self.failures:
+            message += f", 失敗{len(self.failures)}件"
+        return message
+
+
+class BulkWriter:
+    """bulk_write(ordered=False)をバッチ単位で複数スレッドから発行する書き込みエンジン
+
+    スレッドは同じMongoClientのコネクションプールを共有する。接続断などの一時的なエラーで
+    失敗したバッチは指数バックオフで同じ操作列を再送する（挿入済みの文書は同じ_idの重複として
+    成功扱いになる）。一部の操作が失敗したバッチは、失敗した操作だけを1件ずつ再送し、
+    それでも失敗したものをWriteStatsに記録する。
+    """
+
+    def __init__(
+        self,
+        db,
+        batch_size: int = 1000,
+        workers: int = 4,
+        max_retries: int = 5,
+        retry_delay: float = 0.5
+    ) -> None:
+        self.db = db
+        self.batch_size = max(1, batch_size)
+        self.workers = max(1, workers)
+        self.max_retries = max(0, max_retries)
+        self.retry_delay = retry_delay
+        # 構築側が使うグローバルの乱数状態を変えないよう、ジッター用に別の生成器を使う
+        self._jitter = random.Random()
+
+    def write(self, collection_name: str, operations: Iterable, label: str | None = None) -> WriteStats:
+        return self.write_batches(collection_name, enumerate(_chunked(operations, self.batch_size)), label=label)
+
+    def write_batches(
+        self,
+        collection_name: str,
+        batches: Iterable[Tuple[object, list]],
+        label: str | None = None,
+        journal: CheckpointJournal | None = None
+    ) -> WriteStats:
+        """(キー, 操作列)のバッチを書き込む
+
+        journalを渡すと、書き込み済みのバッチを飛ばし、失敗なく書き込めたバッチのキーを記録する。
+        """
+        stats = WriteStats(label or collection_name)
+        collection = self.db[collection_name]
+        if journal is not None:
+            batches = self._skip_committed(batches, journal, stats)
+        if self.workers == 1:
+            for key, batch in batches:
+                self._write_batch(collection, batch, stats, key, journal)
+            return stats.finish()
+
+        # 実行待ちのバッチ数を制限し、操作列をすべてメモリに展開しないようにする
+        max_pending = self.workers * 2
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            pending = set()
+            for key, batch in batches:
+                if len(pending) >= max_pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        future.result()
+                pending.add(executor.submit(self._write_batch, collection, batch, stats, key, journal))
+            for future in pending:
+                future.result()
+        return stats.finish()
+
+    @staticmethod
+    def _skip_committed(
+        batches: Iterable[Tuple[object, list]],
+        journal: CheckpointJournal,
+        stats: WriteStats
+    ) -> Iterable[Tuple[object, list]]:
+        for key, batch in batches:
+            if journal.is_committed(key):
+                stats.skip(len(batch))
+                continue
+            yield key, batch
+
+    def _write_batch(
+        self,
+        collection,
+        batch: list,
+        stats: WriteStats,
+        key: object = None,
+        journal: CheckpointJournal | None = None
+    ) -> None:
+        started = time.perf_counter()
+        failures = 0
+        for attempt in range(self.max_retries + 1):
+            try:
+                collection.bulk_write(batch, ordered=False)
+            except BulkWriteError as exc:
+                failures = self._retry_failed(collection, batch, exc.details, stats)
+            except PyMongoError as exc:
+                if attempt >= self.max_retries or not is_transient_error(exc):
+                    if journal is not None:
+                        journal.failed = True
+                    raise
+                stats.retry()
+                delay = min(RETRY_MAX_DELAY, self.retry_delay * 2 ** attempt)
+                time.sleep(delay * self._jitter.uniform(0.5, 1.0))
+                continue
+            break
+        stats.record(len(batch), time.perf_counter() - started)
+        if journal is not None:
+            if failures:
+                journal.failed = True
+            else:
+                journal.commit(key)
+
+    def _retry_failed(self, collection, batch: list, details: Dict[str, object], stats: WriteStats) -> int:
+        """失敗した操作を1件ずつ再送し、それでも失敗した件数を返す"""
+        failures = 0
+        for error in details.get("writeErrors", []):
+            if error.get("code") == DUPLICATE_KEY_ERROR:
+                # 同じ_idで既に書き込まれている（再送時など）ので成功扱い
+                continue
+            operation = batch[error["index"]]
+            try:
+                collection.bulk_write([operation], ordered=True)
+            except BulkWriteError as retry_exc:
+                retry_errors = retry_exc.details.get("writeErrors", [])
+                if retry_errors and retry_errors[0].get("code") == DUPLICATE_KEY_ERROR:
+                    continue
+                message = retry_errors[0].get("errmsg") if retry_errors else str(retry_exc)
+                stats.fail(str(message))
+                failures += 1
+            except PyMongoError as retry_exc:
+                stats.fail(str(retry_exc))
+                failures += 1
+        for error in details.get("writeConcernErrors", []):
+            stats.fail(str(error.get("errmsg", error)))
+            failures += 1
+        return failures
+
+
+def product_upsert_operations(product_documents: Dict[str, Dict[str, object]]) -> List[UpdateOne]:
+    operations = []
+    for product_id, document in product_documents.items():
+        payload = document.copy()
+        created_at = payload.pop("createdAt")
+        payload["updatedAt"] = datetime.now(timezone.utc)
+        # --syncでない投入でも内容ハッシュを書き直し、古いハッシュのせいで次の--syncが変更を見逃さないようにする
+        payload["contentHash"] = content_hash(document)
+
+        operations.append(
+            UpdateOne(
+                {"productId": product_id},
+                {
+                    "$set": payload,
+                    "$setOnInsert": {"createdAt": created_at},
+                },
+                upsert=True,
+            )
+        )
+    return operations
+
+
+def upsert_products(
+    db,
+    product_documents: Dict[str, Dict[str, object]],
+    writer: BulkWriter | None = None
+) -> WriteStats:
+    writer = writer or BulkWriter(db)
+    return writer.write(COLLECTION_PRODUCTS, product_upsert_operations(product_documents), label="products")
+
+
+def insert_reviews(
+    db,
+    product_reviews: Dict[str, List[ReviewDocument]],
+    keep_existing: bool,
+    writer: BulkWriter | None = None,
+    journal: CheckpointJournal | None = None,
+    annotation_schema: str = "embedded"
+) -> WriteStats:
+    writer = writer or BulkWriter(db)
+    product_ids = [product["id"] for product in catalog.PRODUCT_CONFIGS if product_reviews.get(product["id"])]
+    if not keep_existing:
+        # 置き換え対象の商品のレビューを先にまとめて削除してから挿入する
+        delete_existing_reviews(writer, product_ids, journal)
+    documents = (
+        review.to_document(annotation_schema)
+        for product_id in product_ids
+        for review in product_reviews[product_id]
+    )
+    batches = review_insert_batches(documents, writer.batch_size, journal)
+    return writer.write_batches(COLLECTION_REVIEWS, batches, label="reviews", journal=journal)
+
+
+def delete_existing_reviews(
+    writer: BulkWriter,
+    product_ids: Iterable[str],
+    journal: CheckpointJournal | None = None
+) -> None:
+    """商品の既存レビューを削除する。再開時は、ジャーナルで削除済みの商品は書き込み済みのレビューを消さないよう飛ばす
+
+    インデックスを遅延して外した後に呼ばれると削除のたびに全件を走査するため、商品IDは
+    batch_size件ずつ1つの$inにまとめ、商品数が多くても走査は数回で済むようにする。
+    """
+    product_ids = [product_id for product_id in product_ids if journal is None or not journal.is_deleted(product_id)]
+    if not product_ids:
+        return
+    operations = [
+        DeleteMany({"productId": {"$in": product_ids[start:start + writer.batch_size]}})
+        for start in range(0, len(product_ids), writer.batch_size)
+    ]
+    stats = writer.write(COLLECTION_REVIEWS, operations, label="reviews (delete)")
+    if journal is not None and not stats.failures:
+        journal.mark_deleted(product_ids)
+
+
+# 内容ハッシュから除外するフィールド（実行ごとに変わる時刻やDB側で付与される値）
+CONTENT_HASH_EXCLUDED_FIELDS = ("_id", "contentHash", "createdAt", "updatedAt")
+
+
+def content_hash(document: Dict[str, object]) -> str:
+    payload = {key: value for key, value in document.items() if key not in CONTENT_HASH_EXCLUDED_FIELDS}
+    encoded = json.dumps(payload, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def report_write_stats(write_stats: List[WriteStats]) -> None:
+    print("\n📝 書き込み統計:")
+    for stats in write_stats:
+        print(f"  - {stats.summary()}")
+    failures = [failure for stats in write_stats for failure in stats.failures]
+    if failures:
+        raise RuntimeError(f"{len(failures)}件の書き込みに失敗しました: {failures[0]}")
@@ -0,0 +1,80 @@
+"""scripts/のCLIモジュールとreview_importパッケージをテストから読み込めるようにする"""
+
+from __future__ import annotations
+
+import os
+import sys
+from pathlib import Path
+from typing import Dict
+
+import pytest
+
+SCRIPTS_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(SCRIPTS_DIR))
+
+import import_reviews as importer  # noqa: E402
+from review_import import async_pipeline  # noqa: E402
+from review_import.dataset import find_dataset_paths  # noqa: E402
+from benchmark_import import InMemoryDatabase, generate_corpus  # noqa: E402
+
+
+class InMemoryClient:
+    """MongoClientの代わりに、どのデータベース名にも同じInMemoryDatabaseを返す"""
+
+    def __init__(self, db: InMemoryDatabase) -> None:
+        self.db = db
+        self.admin = self
+
+    def __getitem__(self, name: str) -> InMemoryDatabase:
+        return self.db
+
+    def command(self, *args, **kwargs) -> Dict[str, object]:
+        return {"ok": 1}
+
+    def close(self) -> None:
+        pass
+
+    def __enter__(self) -> "InMemoryClient":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        pass
+
+
+@pytest.fixture(scope="session")
+def dataset_paths() -> Dict[str, Path]:
+    """ダウンロード済みのデータセット（環境変数REVIEW_DATA_DIR、既定: data/amazon_reviews）
+
+    データセット全体との突き合わせに使う。ダウンロードしていなければスキップする。
+    """
+    data_dir = Path(os.environ.get("REVIEW_DATA_DIR", SCRIPTS_DIR.parent / "data" / "amazon_reviews"))
+    paths = find_dataset_paths(data_dir)
+    if not all(path.exists() for path in paths.values()):
+        pytest.skip(f"{data_dir}にデータセットがありません（import_reviews.pyで先にダウンロードしてください）")
+    return paths
+
+
+@pytest.fixture
+def memory_db(monkeypatch: pytest.MonkeyPatch) -> InMemoryDatabase:
+    """書き込んだ文書を保持するInMemoryDatabase。インポーターのMongoClientもこれを返すようにする"""
+    db = InMemoryDatabase(keep_documents=True)
+
+    def connect(*args, **kwargs) -> InMemoryClient:
+        return InMemoryClient(db)
+
+    monkeypatch.setattr(importer, "MongoClient", connect)
+    monkeypatch.setattr(async_pipeline, "MongoClient", connect)
+    monkeypatch.setattr(async_pipeline, "AsyncMongoClient", None)
+    return db
+
+
+@pytest.fixture
+def synthetic_paths(tmp_path: Path) -> Dict[str, Path]:
+    """benchmark_importと同じ形の小さな合成データセット（train 2000件）"""
+    return generate_corpus(tmp_path / "corpus", 2000, seed=7)
+
+
+def parse_import_args(monkeypatch: pytest.MonkeyPatch, *argv: str):
+    """import_reviews.pyのコマンドライン引数を解析する（未指定の項目は既定値）"""
+    monkeypatch.setattr(sys, "argv", ["import_reviews.py", "--mongodb-uri", "mongodb://memory", *argv])
+    return importer.parse_args()
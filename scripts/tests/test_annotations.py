@@ -0,0 +1,165 @@
+"""文ごとのアノテーション件数の形式（embedded/array/counts）の変換と、件数更新の形を確かめる"""
+
+from __future__ import annotations
+
+import copy
+from typing import Dict, List
+
+import pytest
+
+from review_import.documents import (
+    ANNOTATION_SCHEMAS,
+    ANNOTATION_TYPES,
+    annotation_fields,
+    annotation_increment,
+    convert_sentence_annotations,
+    sentence_annotation_counts,
+    sentence_annotation_schema,
+)
+from review_import.mongo import COLLECTION_REVIEWS
+import migrate_annotations
+
+SCHEMAS = ANNOTATION_SCHEMAS
+COUNTS = {ann_type: index * 3 + 1 for index, ann_type in enumerate(ANNOTATION_TYPES)}
+
+
+def make_sentence(schema: str, counts: Dict[str, int] = COUNTS) -> Dict[str, object]:
+    return {"id": "train_0000001-sentence-01", "text": "とても良い。", **annotation_fields(dict(counts), schema)}
+
+
+def apply_increment(document: Dict[str, object], update: Dict[str, object], array_filters: List[Dict[str, object]]) -> None:
+    """$incと$[識別子]のarrayFiltersを、この形式の更新に必要な分だけ解釈して文書に適用する"""
+    filters = {key.split(".", 1)[0]: (key.split(".", 1)[1], value) for array_filter in array_filters for key, value in array_filter.items()}
+    for path, amount in update["$inc"].items():
+        targets = [document]
+        parts = path.split(".")
+        for part in parts[:-1]:
+            if part.startswith("$["):
+                field, value = filters[part[2:-1]]
+                targets = [item for target in targets for item in target if item[field] == value]
+            else:
+                key = int(part) if isinstance(targets[0], list) else part
+                targets = [target[key] for target in targets]
+        last = parts[-1]
+        for target in targets:
+            key = int(last) if isinstance(target, list) else last
+            target[key] += amount
+
+
+@pytest.mark.parametrize("source", SCHEMAS)
+@pytest.mark.parametrize("target", SCHEMAS)
+def test_conversion_keeps_counts(source: str, target: str) -> None:
+    sentence = make_sentence(source)
+    converted = convert_sentence_annotations(sentence, target)
+    assert sentence_annotation_schema(converted) == target
+    assert sentence_annotation_counts(converted) == COUNTS
+    assert converted == make_sentence(target)
+    # 元の文は書き換えない
+    assert sentence == make_sentence(source)
+
+
+def test_conversion_reads_each_schema_layout() -> None:
+    types = ANNOTATION_TYPES
+    assert make_sentence("embedded")["annotations"] == [{"type": ann_type, "count": COUNTS[ann_type]} for ann_type in types]
+    assert make_sentence("array")["annotationCounts"] == [COUNTS[ann_type] for ann_type in types]
+    assert make_sentence("counts")["annotationCounts"] == COUNTS
+
+
+def test_unknown_types_survive_except_in_array_schema() -> None:
+    counts = {**COUNTS, "custom": 2}
+    embedded = make_sentence("embedded", counts)
+    assert sentence_annotation_counts(convert_sentence_annotations(embedded, "counts")) == counts
+    with pytest.raises(ValueError, match="配列形式"):
+        convert_sentence_annotations(embedded, "array")
+    # 件数が0なら配列形式でも失うものがない
+    assert convert_sentence_annotations(make_sentence("counts", {**COUNTS, "custom": 0}), "array") == make_sentence("array")
+
+
+@pytest.mark.parametrize("schema", SCHEMAS)
+@pytest.mark.parametrize("ann_type", ANNOTATION_TYPES)
+def test_increment_changes_only_its_counter(schema: str, ann_type: str) -> None:
+    other = {"id": "train_0000001-sentence-02", "text": "別の文。", **annotation_fields(dict(COUNTS), schema)}
+    document = {"sentences": [make_sentence(schema), other]}
+    sentence_id = document["sentences"][0]["id"]
+
+    query, update, array_filters = annotation_increment(sentence_id, ann_type, schema)
+    assert query == {"sentences.id": sentence_id}
+    apply_increment(document, update, array_filters)
+    assert sentence_annotation_counts(document["sentences"][0]) == {**COUNTS, ann_type: COUNTS[ann_type] + 1}
+    assert sentence_annotation_counts(document["sentences"][1]) == COUNTS
+
+    apply_increment(document, *annotation_increment(sentence_id, ann_type, schema, amount=-1)[1:])
+    assert document == {"sentences": [make_sentence(schema), other]}
+
+
+def test_increment_paths_per_schema() -> None:
+    sentence_id = "train_0000001-sentence-01"
+    ann_type = ANNOTATION_TYPES[1]
+    assert annotation_increment(sentence_id, ann_type, "embedded")[1:] == (
+        {"$inc": {"sentences.$[s].annotations.$[a].count": 1}},
+        [{"s.id": sentence_id}, {"a.type": ann_type}],
+    )
+    assert annotation_increment(sentence_id, ann_type, "array")[1:] == (
+        {"$inc": {"sentences.$[s].annotationCounts.1": 1}},
+        [{"s.id": sentence_id}],
+    )
+    assert annotation_increment(sentence_id, ann_type, "counts", amount=-1)[1:] == (
+        {"$inc": {f"sentences.$[s].annotationCounts.{ann_type}": -1}},
+        [{"s.id": sentence_id}],
+    )
+
+
+class RecordingCollection:
+    def __init__(self, documents: List[Dict[str, object]]) -> None:
+        self.documents = documents
+        self.calls: List[str] = []
+
+    def find(self, query, projection=None, limit=0):
+        self.calls.append("find")
+        return copy.deepcopy(self.documents[:limit] if limit else self.documents)
+
+    def __getattr__(self, name: str):
+        def record(*args, **kwargs):
+            self.calls.append(name)
+            if name == "insert_many":
+                self.documents.extend(copy.deepcopy(args[0]))
+            elif name == "update_one":
+                query, update = args
+                for document in self.documents:
+                    if any(sentence["id"] == query["sentences.id"] for sentence in document["sentences"]):
+                        apply_increment(document, update, kwargs["array_filters"])
+                        break
+            elif name == "drop":
+                self.documents.clear()
+        return record
+
+
+class RecordingDatabase(dict):
+    def __missing__(self, name: str) -> RecordingCollection:
+        self[name] = RecordingCollection([])
+        return self[name]
+
+
+@pytest.mark.parametrize("target", SCHEMAS)
+def test_latency_is_measured_on_a_scratch_copy(target: str) -> None:
+    documents = [{"_id": index, "sentences": [{**make_sentence("embedded"), "id": f"r{index}-sentence-01"}]} for index in range(8)]
+    db = RecordingDatabase()
+    db[COLLECTION_REVIEWS] = RecordingCollection(copy.deepcopy(documents))
+
+    samples = migrate_annotations.sample_documents(db, 5)
+    assert len(samples) == 5
+    assert len(migrate_annotations.measure_update_latency(db, samples)) == 5
+    assert len(migrate_annotations.measure_update_latency(db, samples, target)) == 5
+
+    # reviewsは読むだけで、件数は変わらない
+    assert db[COLLECTION_REVIEWS].calls == ["find"]
+    assert db[COLLECTION_REVIEWS].documents == documents
+    scratch = db[migrate_annotations.SCRATCH_COLLECTION]
+    assert "update_one" in scratch.calls
+    assert scratch.calls[-1] == "drop"
+    assert scratch.documents == []
+
+
+def test_latency_measurement_is_opt_in(monkeypatch) -> None:
+    monkeypatch.setattr("sys.argv", ["migrate_annotations.py", "--to", "array"])
+    assert migrate_annotations.parse_args().measure_updates == 0
@@ -0,0 +1,53 @@
+"""非同期パイプライン（--pipeline async）が、件数の不足を書き込みより前に検出することを確かめる"""
+
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+
+from review_import import catalog
+from review_import.async_pipeline import run_async_pipeline
+from review_import.mongo import COLLECTION_PRODUCTS, COLLECTION_REVIEWS
+from conftest import parse_import_args
+
+DB_NAME = "review-system"
+
+
+def existing_review(product_id: str) -> dict:
+    return {"_id": f"old-{product_id}", "productId": product_id, "reviewId": f"old-{product_id}"}
+
+
+def run_pipeline(args, paths):
+    return asyncio.run(run_async_pipeline(args, paths, "mongodb://memory", DB_NAME))
+
+
+def test_shortfall_leaves_existing_data_untouched(memory_db, synthetic_paths, monkeypatch) -> None:
+    product_ids = [product["id"] for product in catalog.PRODUCT_CONFIGS]
+    memory_db[COLLECTION_REVIEWS].insert_many([existing_review(product_id) for product_id in product_ids])
+    args = parse_import_args(monkeypatch, "--pipeline", "async", "--per-sentiment", "100000", "--batch-size", "10")
+
+    with pytest.raises(RuntimeError, match="十分な件数"):
+        run_pipeline(args, synthetic_paths)
+
+    reviews = memory_db[COLLECTION_REVIEWS].find()
+    assert sorted(review["_id"] for review in reviews) == sorted(f"old-{product_id}" for product_id in product_ids)
+    assert memory_db[COLLECTION_PRODUCTS].find() == []
+
+
+def test_pipeline_replaces_reviews_once_selection_is_sufficient(memory_db, synthetic_paths, monkeypatch) -> None:
+    product_ids = [product["id"] for product in catalog.PRODUCT_CONFIGS]
+    memory_db[COLLECTION_REVIEWS].insert_many([existing_review(product_ids[0])])
+    args = parse_import_args(
+        monkeypatch, "--pipeline", "async", "--per-sentiment", "5", "--batch-size", "7", "--writers", "3"
+    )
+
+    product_reviews, product_documents, _ = run_pipeline(args, synthetic_paths)
+
+    reviews = memory_db[COLLECTION_REVIEWS].find()
+    assert len(reviews) == len(product_ids) * 2 * 5
+    assert not any(str(review["_id"]).startswith("old-") for review in reviews)
+    assert {review["reviewId"] for review in reviews} == {
+        review.review_id for reviews_of_product in product_reviews.values() for review in reviews_of_product
+    }
+    assert len(memory_db[COLLECTION_PRODUCTS].find()) == len(product_documents) == len(product_ids)
@@ -0,0 +1,59 @@
+"""JSONLデコーダ（json/orjson/msgspec）が、同じ行から同じ結果を返すことを確かめる"""
+
+from __future__ import annotations
+
+import json
+from pathlib import Path
+
+import pytest
+
+from review_import.dataset import dataset_file_paths
+from review_import.decoders import REVIEW_FIELDS, available_decoders, get_decoder, iter_records
+
+DECODERS = available_decoders()
+
+VALID_LINES = [
+    b'{"id": "train_0000001", "text": "\xe3\x81\xa8\xe3\x81\xa6\xe3\x82\x82\xe8\x89\xaf\xe3\x81\x84", "label": 4, "label_text": "4"}',
+    b'{"label": 0, "text": "\\u58ca\\u308c\\u305f", "id": "test_0000002"}',
+    b'{"id": "validation_0000003", "text": "", "label": 2, "extra": {"nested": [1, 2, 3]}}',
+    b'  {"id": "train_0000004", "text": "a\\"b\\\\c\\n", "label": 1}  ',
+]
+INVALID_LINES = [
+    pytest.param(b'{"id": "train_0000005", "text": "\xe5\xa3\x8a\xe3\x82\x8c", "label": 4', id="truncated"),
+    pytest.param(b'not json', id="garbage"),
+    pytest.param(b'{"id": "train_0000006", "text": "label\xe3\x81\x8c\xe3\x81\xaa\xe3\x81\x84"}', id="missing-label"),
+    pytest.param(b'{"id": "train_0000007", "label": 3}', id="missing-text"),
+    pytest.param(b'{"text": "id\xe3\x81\x8c\xe3\x81\xaa\xe3\x81\x84", "label": 3}', id="missing-id"),
+]
+
+
+@pytest.mark.parametrize("line", VALID_LINES)
+def test_decoders_agree_on_valid_lines(line: bytes) -> None:
+    expected = {field: json.loads(line)[field] for field in REVIEW_FIELDS}
+    for name in DECODERS:
+        assert get_decoder(name).decode(line) == expected, name
+        assert get_decoder(name, fields=None).decode(line) == json.loads(line), name
+
+
+@pytest.mark.parametrize("line", INVALID_LINES)
+def test_decoders_reject_invalid_lines_alike(line: bytes) -> None:
+    for name in DECODERS:
+        with pytest.raises(ValueError):
+            get_decoder(name).decode(line)
+
+
+@pytest.mark.parametrize("fields", [("id",), ("id", "label")])
+def test_partial_fields_do_not_require_the_rest(fields) -> None:
+    line = b'{"id": "train_0000008", "label": 3}'
+    for name in DECODERS:
+        assert get_decoder(name, fields).decode(line) == {field: json.loads(line)[field] for field in fields}, name
+
+
+def test_decoders_read_the_same_records(tmp_path: Path) -> None:
+    paths = dataset_file_paths(tmp_path)
+    for path in paths.values():
+        path.write_bytes(b"\n".join(line.strip() for line in VALID_LINES) + b"\n\n")
+    results = {name: list(iter_records(paths, get_decoder(name))) for name in DECODERS}
+    assert len(results["json"]) == len(VALID_LINES) * len(paths)
+    for name, records in results.items():
+        assert records == results["json"], name
@@ -0,0 +1,284 @@
+"""download_file・download_datasetsを、ローカルのhttp.serverを相手に確かめる"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, Iterator, List
+
+import pytest
+
+from review_import import dataset
+from review_import.dataset import (
+    DownloadError,
+    available_compressions,
+    dataset_file_paths,
+    download_datasets,
+    download_file,
+    load_download_manifest,
+    open_dataset,
+)
+
+PAYLOAD = b"".join(f'{{"id": "train_{index:07d}", "text": "レビュー{index}", "label": 3}}\n'.encode() for index in range(2000))
+SHA256 = hashlib.sha256(PAYLOAD).hexdigest()
+
+
+class FakeDatasetServer(ThreadingHTTPServer):
+    """PAYLOADを返すサーバー。Rangeへの対応や接続の切断を動作ごとに切り替えられる"""
+
+    daemon_threads = True
+
+    def __init__(self) -> None:
+        super().__init__(("127.0.0.1", 0), FakeDatasetHandler)
+        self.honor_range = True
+        # 先頭のレスポンスから順に、この長さだけ送ったところで接続を切る
+        self.drops: List[int] = []
+        self.etag: str | None = SHA256
+        self.requests: List[Dict[str, str]] = []
+
+    def url(self, name: str = "train.jsonl") -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/{name}"
+
+
+class FakeDatasetHandler(BaseHTTPRequestHandler):
+    server: FakeDatasetServer
+
+    def log_message(self, format: str, *args: object) -> None:
+        pass
+
+    def do_HEAD(self) -> None:
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(PAYLOAD)))
+        self.end_headers()
+
+    def do_GET(self) -> None:
+        self.server.requests.append(dict(self.headers))
+        offset = 0
+        range_header = self.headers.get("Range")
+        if range_header and self.server.honor_range:
+            offset = int(range_header.removeprefix("bytes=").rstrip("-"))
+            if offset >= len(PAYLOAD):
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{len(PAYLOAD)}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {offset}-{len(PAYLOAD) - 1}/{len(PAYLOAD)}")
+        else:
+            self.send_response(200)
+        body = PAYLOAD[offset:]
+        self.send_header("Content-Length", str(len(body)))
+        if self.server.etag is not None:
+            self.send_header("X-Linked-Etag", f'"{self.server.etag}"')
+        self.end_headers()
+        if self.server.drops:
+            # Content-Lengthより手前で接続を切る
+            self.wfile.write(body[:self.server.drops.pop(0)])
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def server() -> Iterator[FakeDatasetServer]:
+    server = FakeDatasetServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(dataset.time, "sleep", lambda seconds: None)
+
+
+def part_path(dest: Path) -> Path:
+    return dest.with_name(dest.name + ".part")
+
+
+def test_download_renames_part_to_destination(server: FakeDatasetServer, tmp_path: Path) -> None:
+    dest = tmp_path / "amazon_reviews_train.jsonl"
+    result = download_file(server.url(), dest)
+    assert dest.read_bytes() == PAYLOAD
+    assert not part_path(dest).exists()
+    assert result["entry"]["sha256"] == SHA256
+    assert result["entry"]["size"] == len(PAYLOAD)
+    assert result["bytes"] == len(PAYLOAD)
+
+
+def test_dropped_connection_resumes_with_range(server: FakeDatasetServer, tmp_path: Path) -> None:
+    server.drops = [1000, 5000]
+    dest = tmp_path / "amazon_reviews_train.jsonl"
+    result = download_file(server.url(), dest)
+    assert dest.read_bytes() == PAYLOAD
+    assert [request.get("Range") for request in server.requests] == [None, "bytes=1000-", "bytes=6000-"]
+    assert result["bytes"] == len(PAYLOAD)
+
+
+def test_existing_part_resumes_from_its_size(server: FakeDatasetServer, tmp_path: Path) -> None:
+    dest = tmp_path / "amazon_reviews_train.jsonl"
+    part_path(dest).write_bytes(PAYLOAD[:4096])
+    result = download_file(server.url(), dest)
+    assert dest.read_bytes() == PAYLOAD
+    assert server.requests[0]["Range"] == "bytes=4096-"
+    assert result["resumed_from"] == 4096
+    assert result["bytes"] == len(PAYLOAD) - 4096
+
+
+def test_server_ignoring_range_restarts_from_scratch(server: FakeDatasetServer, tmp_path: Path) -> None:
+    server.honor_range = False
+    dest = tmp_path / "amazon_reviews_train.jsonl"
+    # 続きをつなげると壊れるよう、中身の違う途中のファイルを置いておく
+    part_path(dest).write_bytes(b"x" * 4096)
+    result = download_file(server.url(), dest)
+    assert server.requests[0]["Range"] == "bytes=4096-"
+    assert dest.read_bytes() == PAYLOAD
+    assert result["resumed_from"] == 0
+
+
+def test_complete_part_is_finished_after_416(server: FakeDatasetServer, tmp_path: Path) -> None:
+    dest = tmp_path / "amazon_reviews_train.jsonl"
+    part_path(dest).write_bytes(PAYLOAD)
+    result = download_file(server.url(), dest)
+    assert server.requests[0]["Range"] == f"bytes={len(PAYLOAD)}-"
+    assert dest.read_bytes() == PAYLOAD
+    assert not part_path(dest).exists()
+    assert result["bytes"] == 0
+
+
+def test_checksum_mismatch_discards_part(server: FakeDatasetServer, tmp_path: Path) -> None:
+    server.etag = "0" * 64
+    dest = tmp_path / "amazon_reviews_train.jsonl"
+    with pytest.raises(DownloadError, match="チェックサム"):
+        download_file(server.url(), dest)
+    assert not dest.exists()
+    assert not part_path(dest).exists()
+
+
+def test_part_not_matching_manifest_checksum_is_rejected(server: FakeDatasetServer, tmp_path: Path) -> None:
+    server.etag = None
+    dest = tmp_path / "amazon_reviews_train.jsonl"
+    # 同じURL・同じサイズで以前検証したときのハッシュと、416で完了扱いになった途中のファイルが食い違う
+    part_path(dest).write_bytes(b"x" * len(PAYLOAD))
+    entry = {"url": server.url(), "size": len(PAYLOAD), "sha256": SHA256}
+    with pytest.raises(DownloadError, match="チェックサム"):
+        download_file(server.url(), dest, entry=entry)
+    assert not part_path(dest).exists()
+
+
+def test_connection_dropped_on_every_attempt_fails(server: FakeDatasetServer, tmp_path: Path) -> None:
+    server.honor_range = False
+    server.drops = [100] * 10
+    dest = tmp_path / "amazon_reviews_train.jsonl"
+    with pytest.raises(DownloadError):
+        download_file(server.url(), dest, retries=2)
+    assert not dest.exists()
+    assert len(server.requests) == 3
+
+
+def test_download_datasets_verifies_files_against_manifest(server: FakeDatasetServer, tmp_path: Path) -> None:
+    urls = {"train": server.url()}
+    paths = {"train": tmp_path / "amazon_reviews_train.jsonl"}
+    first = download_datasets(urls, paths, tmp_path, workers=1)
+    assert not first["train"]["skipped"]
+    manifest = load_download_manifest(tmp_path)
+    assert manifest["train"]["sha256"] == SHA256
+    assert manifest["train"]["size"] == len(PAYLOAD)
+
+    # マニフェストと一致していればダウンロードしない
+    assert download_datasets(urls, paths, tmp_path, workers=1)["train"]["skipped"]
+
+    # サイズが違えば取り直す
+    with paths["train"].open("ab") as f:
+        f.write(b"garbage")
+    assert not download_datasets(urls, paths, tmp_path, workers=1)["train"]["skipped"]
+    assert paths["train"].read_bytes() == PAYLOAD
+
+    # サイズが同じでも、更新時刻が変わって内容のハッシュが違えば取り直す
+    paths["train"].write_bytes(b"y" * len(PAYLOAD))
+    stat = paths["train"].stat()
+    os.utime(paths["train"], ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert not download_datasets(urls, paths, tmp_path, workers=1)["train"]["skipped"]
+    assert paths["train"].read_bytes() == PAYLOAD
+    assert load_download_manifest(tmp_path)["train"]["sha256"] == SHA256
+
+
+def read_dataset(path: Path) -> bytes:
+    with open_dataset(path) as f:
+        return f.read()
+
+
+@pytest.mark.parametrize("compression", [name for name in available_compressions() if name != "none"])
+def test_compress_converts_existing_download_in_place(server: FakeDatasetServer, tmp_path: Path, compression: str) -> None:
+    urls = {"train": server.url()}
+    plain = {"train": tmp_path / "amazon_reviews_train.jsonl"}
+    download_datasets(urls, plain, tmp_path, workers=1)
+    (tmp_path / "amazon_reviews_train.jsonl.idx").write_bytes(b"stale index")
+    requests = len(server.requests)
+
+    compressed = {"train": dataset_file_paths(tmp_path, compression)["train"]}
+    result = download_datasets(urls, compressed, tmp_path, workers=1)["train"]
+    # 手元の検証済みファイルを圧縮するので、ダウンロードしない
+    assert len(server.requests) == requests
+    assert result["bytes"] == 0
+    assert result["converted_from"] == plain["train"]
+    assert read_dataset(compressed["train"]) == PAYLOAD
+    assert not plain["train"].exists()
+    assert not (tmp_path / "amazon_reviews_train.jsonl.idx").exists()
+    entry = load_download_manifest(tmp_path)["train"]
+    assert entry["compression"] == compression
+    assert entry["source_sha256"] == SHA256
+    assert entry["source_size"] == len(PAYLOAD)
+    assert entry["size"] == compressed["train"].stat().st_size
+
+    # 変換後のファイルはマニフェストと一致するので、次回はそのまま使う
+    again = download_datasets(urls, compressed, tmp_path, workers=1)["train"]
+    assert again["skipped"] and "converted_from" not in again
+    assert len(server.requests) == requests
+
+    # 圧縮をやめる場合も、手元のファイルを展開する
+    result = download_datasets(urls, plain, tmp_path, workers=1)["train"]
+    assert result["converted_from"] == compressed["train"]
+    assert len(server.requests) == requests
+    assert plain["train"].read_bytes() == PAYLOAD
+    assert not compressed["train"].exists()
+    assert load_download_manifest(tmp_path)["train"]["sha256"] == SHA256
+
+
+def test_compress_downloads_when_local_copy_is_not_verified(server: FakeDatasetServer, tmp_path: Path) -> None:
+    urls = {"train": server.url()}
+    plain = {"train": tmp_path / "amazon_reviews_train.jsonl"}
+    download_datasets(urls, plain, tmp_path, workers=1)
+    # 同じサイズで内容の違うファイルに置き換わっている
+    plain["train"].write_bytes(b"y" * len(PAYLOAD))
+    stat = plain["train"].stat()
+    os.utime(plain["train"], ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    requests = len(server.requests)
+
+    compressed = {"train": dataset_file_paths(tmp_path, "gzip")["train"]}
+    result = download_datasets(urls, compressed, tmp_path, workers=1)["train"]
+    assert "converted_from" not in result
+    assert len(server.requests) == requests + 1
+    assert read_dataset(compressed["train"]) == PAYLOAD
+    # 検証できなかった手元のファイルには触れない
+    assert plain["train"].read_bytes() == b"y" * len(PAYLOAD)
+
+
+def test_force_download_skips_local_conversion(server: FakeDatasetServer, tmp_path: Path) -> None:
+    urls = {"train": server.url()}
+    download_datasets(urls, {"train": tmp_path / "amazon_reviews_train.jsonl"}, tmp_path, workers=1)
+    requests = len(server.requests)
+    compressed = {"train": dataset_file_paths(tmp_path, "gzip")["train"]}
+    result = download_datasets(urls, compressed, tmp_path, overwrite=True, workers=1)["train"]
+    assert "converted_from" not in result
+    assert len(server.requests) == requests + 1
+    assert read_dataset(compressed["train"]) == PAYLOAD
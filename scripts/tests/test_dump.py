@@ -0,0 +1,102 @@
+"""--output-dumpで書き出したダンプを--load-dumpで読み込み、直接投入したのと同じ文書になることを確かめる"""
+
+from __future__ import annotations
+
+import json
+import sys
+from pathlib import Path
+from typing import Dict
+
+import pytest
+
+import import_reviews as importer
+from review_import import catalog
+from review_import.dump import (
+    DUMP_COLLECTIONS,
+    DUMP_FORMATS,
+    DumpWriter,
+    dump_index_metadata,
+    find_dump_files,
+    iter_dump_documents,
+    print_dump_instructions,
+)
+from review_import.mongo import COLLECTION_PRODUCTS, COLLECTION_REVIEWS
+
+PER_SENTIMENT = 5
+# 実行時刻から決まるフィールドと、投入方法によって付くかどうかが変わるフィールド
+VOLATILE_FIELDS = ("_id", "createdAt", "updatedAt", "contentHash")
+
+
+def run_import(monkeypatch: pytest.MonkeyPatch, data_dir: Path, *extra: str) -> None:
+    monkeypatch.setattr(sys, "argv", [
+        "import_reviews.py", "--mongodb-uri", "mongodb://memory", "--data-dir", str(data_dir), "--no-cache",
+        "--per-sentiment", str(PER_SENTIMENT), "--writers", "1", *extra,
+    ])
+    importer.main()
+
+
+def stable(document: Dict[str, object]) -> Dict[str, object]:
+    return {key: value for key, value in document.items() if key not in VOLATILE_FIELDS}
+
+
+def snapshot(db) -> Dict[str, Dict[str, Dict[str, object]]]:
+    return {
+        "products": {str(document["productId"]): document for document in db[COLLECTION_PRODUCTS].find()},
+        "reviews": {str(document["reviewId"]): document for document in db[COLLECTION_REVIEWS].find()},
+    }
+
+
+@pytest.mark.parametrize("dump_format", list(DUMP_FORMATS))
+def test_dump_round_trip(memory_db, synthetic_paths, tmp_path: Path, monkeypatch, dump_format: str) -> None:
+    data_dir = synthetic_paths["train"].parent
+    run_import(monkeypatch, data_dir)
+    direct = snapshot(memory_db)
+
+    dump_dir = tmp_path / "dump"
+    run_import(monkeypatch, data_dir, "--output-dump", str(dump_dir), "--dump-format", dump_format)
+    dump_files = find_dump_files(dump_dir)
+    dumped_reviews = list(iter_dump_documents(dump_files[COLLECTION_REVIEWS]))
+    assert len(dumped_reviews) == len(direct["reviews"])
+
+    # 置き換え対象の商品の古いレビューと、カタログ外の商品のレビュー
+    reviews = memory_db[COLLECTION_REVIEWS]
+    reviews.insert_many([
+        {"_id": "old", "productId": catalog.PRODUCT_CONFIGS[0]["id"], "reviewId": "old"},
+        {"_id": "other", "productId": "prod-other", "reviewId": "other"},
+    ])
+    run_import(monkeypatch, data_dir, "--load-dump", str(dump_dir))
+    loaded = snapshot(memory_db)
+
+    assert set(loaded["reviews"]) == set(direct["reviews"]) | {"other"}
+    for review_id, review in direct["reviews"].items():
+        assert stable(loaded["reviews"][review_id]) == stable(review)
+    assert {product_id: stable(product) for product_id, product in loaded["products"].items()} == {
+        product_id: stable(product) for product_id, product in direct["products"].items()
+    }
+
+    # 日時はダンプに書いた値（BSONの精度のミリ秒）のまま、UTCのaware datetimeで読み込まれる
+    for dumped in dumped_reviews:
+        created_at = loaded["reviews"][dumped["reviewId"]]["createdAt"]
+        assert created_at == dumped["createdAt"]
+        assert created_at.tzinfo is not None
+        assert created_at.microsecond % 1000 == 0
+
+
+def test_ndjson_instructions_do_not_drop_collections(tmp_path: Path, capsys) -> None:
+    writer = DumpWriter(tmp_path / "dump", "review-system", "ndjson")
+    writer.directory.mkdir(parents=True)
+    product_ids = [str(product["id"]) for product in catalog.PRODUCT_CONFIGS]
+    print_dump_instructions(writer, product_ids)
+    output = capsys.readouterr().out
+    assert "mongoimport" in output
+    assert "--drop" not in output
+
+    # mongoimportの前に実行するスクリプトで、インデックスの作成とダンプの商品の既存レビューの削除を行う
+    script = (writer.directory / "prepare.js").read_text(encoding="utf-8")
+    assert f"--file {writer.directory / 'prepare.js'}" in output
+    assert output.index("mongosh") < output.index("mongoimport")
+    assert 'db.getSiblingDB("review-system")' in script
+    for collection_name in DUMP_COLLECTIONS:
+        command = json.dumps({"createIndexes": collection_name, "indexes": dump_index_metadata(collection_name)["indexes"][1:]}, ensure_ascii=False)
+        assert f"db.runCommand({command});" in script
+    assert json.dumps({"productId": {"$in": product_ids}}) in script
@@ -0,0 +1,136 @@
+"""KeywordMatcher（Aho-Corasick）が、キーワードごとに`in`で探していた従来の実装と同じ結果になることを確かめる"""
+
+from __future__ import annotations
+
+import random
+from typing import Dict, List
+
+import pytest
+
+from review_import import catalog
+from review_import.catalog import (
+    CATEGORY_KEYWORDS,
+    KeywordMatcher,
+    build_keyword_matcher,
+    get_keyword_matcher,
+    match_review_to_product,
+)
+from review_import.decoders import ReviewRecord, iter_records
+
+
+# 置き換え前のmatch_review_to_product・infer_category_from_reviewsの照合をそのまま写したもの
+def reference_product_scores(text: str, product_configs: List[Dict[str, object]]) -> Dict[str, int]:
+    text = text.lower()
+    scores: Dict[str, int] = {}
+    for product in product_configs:
+        score = sum(1 for keyword in product["keywords"] if keyword.lower() in text)
+        if score > 0:
+            scores[product["id"]] = score
+    return scores
+
+
+def reference_category_scores(text: str, category_keywords: Dict[str, List[str]]) -> Dict[str, int]:
+    scores: Dict[str, int] = {}
+    for category, keywords in category_keywords.items():
+        score = sum(1 for keyword in keywords if keyword in text)
+        if score > 0:
+            scores[category] = score
+    return scores
+
+
+def reference_best(scores: Dict[str, int]) -> str | None:
+    return max(scores.items(), key=lambda x: x[1])[0] if scores else None
+
+
+# 互いに重なる・入れ子になる・大文字小文字だけが違うキーワード
+OVERLAPPING_PRODUCTS = [
+    {"id": "earphones", "keywords": ["イヤホン", "ワイヤレスイヤホン", "ホン", "ヤホ", "ワイヤレス"]},
+    {"id": "cable", "keywords": ["USB", "usb-c", "ケーブル", "USBケーブル", "ル"]},
+    {"id": "classic", "keywords": ["he", "she", "his", "hers", "s", "HE"]},
+    {"id": "duplicate", "keywords": ["ホン", "ホン", "ンホ"]},
+]
+OVERLAPPING_CATEGORIES = {
+    "cased": ["USB", "usb", "Usb", "ｕｓｂ"],
+    "nested": ["イヤホン", "イヤ", "ヤホン", "ン"],
+    "classic": ["he", "she", "his", "hers"],
+}
+TEXTS = [
+    "",
+    "ワイヤレスイヤホンを買いました",
+    "イヤホンホンホン",
+    "USB-Cのusbケーブル",
+    "ushers",
+    "SHE said HIS and HERS",
+    "İstanbulでUSBを使う",
+    "ẞのusbとİのUSB",
+    "ンホンホ",
+]
+
+
+@pytest.fixture
+def overlapping_matcher() -> KeywordMatcher:
+    return build_keyword_matcher(OVERLAPPING_PRODUCTS, OVERLAPPING_CATEGORIES)
+
+
+@pytest.mark.parametrize("text", TEXTS)
+def test_overlapping_keywords_match_reference(overlapping_matcher: KeywordMatcher, text: str) -> None:
+    hits = overlapping_matcher.count(text)
+    assert hits["product"] == reference_product_scores(text, OVERLAPPING_PRODUCTS)
+    assert hits["category"] == reference_category_scores(text, OVERLAPPING_CATEGORIES)
+
+
+def test_random_overlapping_keywords_match_reference() -> None:
+    # 少ない文字種で作ると、キーワード同士の重なりや入れ子が頻繁に起きる
+    rng = random.Random(0)
+    alphabet = "abAB" + "イヤホン"
+    for _ in range(200):
+        products = [
+            {"id": f"p{index}", "keywords": ["".join(rng.choices(alphabet, k=rng.randint(1, 4))) for _ in range(4)]}
+            for index in range(5)
+        ]
+        categories = {f"c{index}": ["".join(rng.choices(alphabet, k=rng.randint(1, 4))) for _ in range(3)] for index in range(3)}
+        matcher = build_keyword_matcher(products, categories)
+        for _ in range(10):
+            text = "".join(rng.choices(alphabet, k=rng.randint(0, 30)))
+            hits = matcher.count(text)
+            assert hits["product"] == reference_product_scores(text, products), (products, text)
+            assert hits["category"] == reference_category_scores(text, categories), (categories, text)
+
+
+def test_count_keeps_registration_order(overlapping_matcher: KeywordMatcher) -> None:
+    # 同点のときmaxは先に現れたキーを返すので、並び順も従来と同じである必要がある
+    text = "hers USBケーブル ワイヤレスイヤホン"
+    hits = overlapping_matcher.count(text)
+    assert list(hits["product"]) == list(reference_product_scores(text, OVERLAPPING_PRODUCTS))
+    assert reference_best(hits["product"]) == reference_best(reference_product_scores(text, OVERLAPPING_PRODUCTS))
+
+
+def test_catalog_matching_matches_reference() -> None:
+    texts = TEXTS + [str(product["keywords"][0]) + "が良い" for product in catalog.PRODUCT_CONFIGS]
+    for text in texts:
+        record = ReviewRecord("train_0000001", text, 4, "train")
+        assert match_review_to_product(record) == reference_best(
+            reference_product_scores(text, catalog.PRODUCT_CONFIGS)
+        )
+        assert get_keyword_matcher().count(text)["category"] == reference_category_scores(
+            text, CATEGORY_KEYWORDS
+        )
+
+
+def test_catalog_matching_matches_reference_on_dataset(dataset_paths) -> None:
+    matcher = get_keyword_matcher()
+    mismatches: List[str] = []
+    checked = 0
+    for record in iter_records(dataset_paths):
+        text = str(record.text)
+        hits = matcher.count(text)
+        product_scores = reference_product_scores(text, catalog.PRODUCT_CONFIGS)
+        if (
+            hits["product"] != product_scores
+            or hits["category"] != reference_category_scores(text, CATEGORY_KEYWORDS)
+            or match_review_to_product(record) != reference_best(product_scores)
+        ):
+            mismatches.append(str(record.id))
+        checked += 1
+    assert checked > 0
+    assert mismatches == [], f"{len(mismatches)}/{checked}件で従来の結果と異なります: {mismatches[:10]}"
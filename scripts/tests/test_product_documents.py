@@ -0,0 +1,92 @@
+"""商品文書の合成フィールド（価格）が、シードと商品だけで決まることを確かめる"""
+
+from __future__ import annotations
+
+import random
+from datetime import datetime, timezone
+
+import pytest
+
+from review_import import catalog, documents
+from review_import.documents import (
+    ProductAccumulator,
+    accumulated_product_documents,
+    assemble_product_documents,
+    build_catalog_documents,
+    product_prices,
+)
+from review_import.selection import collect_records
+from review_import.streaming import stream_review_documents
+
+NOW = datetime(2026, 1, 1, tzinfo=timezone.utc)
+GENERATORS = ["python", pytest.param("numpy", marks=pytest.mark.skipif(documents.np is None, reason="numpyがありません"))]
+
+
+def strip_timestamps(products):
+    return {
+        product_id: {key: value for key, value in document.items() if key not in ("createdAt", "updatedAt")}
+        for product_id, document in products.items()
+    }
+
+
+@pytest.mark.parametrize("generator", GENERATORS)
+def test_prices_are_reproducible_and_within_range(generator: str) -> None:
+    product_ids = [f"prod-{index:04d}" for index in range(500)]
+    ratings = [1.0 + (index % 41) / 10 for index in range(500)]
+    prices = product_prices(product_ids, ratings, seed=42, generator=generator)
+    assert prices == product_prices(product_ids, ratings, seed=42, generator=generator)
+    assert prices != product_prices(product_ids, ratings, seed=43, generator=generator)
+    for rating, price in zip(ratings, prices):
+        base = 3000 if rating >= 4.0 else 2000 if rating >= 3.0 else 1500
+        assert isinstance(price, int)
+        assert base - 500 <= price <= base + 2000
+        assert 500 <= price <= 50000
+
+
+@pytest.mark.parametrize("generator", GENERATORS)
+def test_catalog_documents_ignore_global_random_state(synthetic_paths, generator: str) -> None:
+    records = collect_records(synthetic_paths, 5, seed=42)
+    random.seed(1)
+    _, first = build_catalog_documents(records, seed=42, now=NOW, generator=generator)
+    random.seed(2)
+    random.random()
+    _, second = build_catalog_documents(records, seed=42, now=NOW, generator=generator)
+    assert strip_timestamps(first) == strip_timestamps(second)
+    _, other_seed = build_catalog_documents(records, seed=7, now=NOW, generator=generator)
+    assert [document["price"] for document in other_seed.values()] != [document["price"] for document in first.values()]
+
+
+@pytest.mark.parametrize("generator", GENERATORS)
+def test_streamed_and_selected_products_are_priced_alike(synthetic_paths, generator: str) -> None:
+    # 全件を流す取り込みも、選択した分から作る取り込みも、同じ平均評価なら同じ価格になる
+    accumulators = {str(product["id"]): ProductAccumulator(product) for product in catalog.PRODUCT_CONFIGS}
+    for _ in stream_review_documents(synthetic_paths, accumulators, seed=42, generator=generator):
+        pass
+    streamed = accumulated_product_documents(accumulators, seed=42, generator=generator)
+    analyses = {product_id: (accumulator.config, accumulator.analysis()) for product_id, accumulator in accumulators.items()}
+    assert strip_timestamps(streamed) == strip_timestamps(assemble_product_documents(analyses, 42, generator))
+    assert list(streamed) == [product["id"] for product in catalog.PRODUCT_CONFIGS]
+
+
+def review_documents(product_reviews):
+    return {
+        product_id: [review.to_document() for review in reviews]
+        for product_id, reviews in product_reviews.items()
+    }
+
+
+@pytest.mark.parametrize("generator", GENERATORS)
+def test_parallel_build_matches_serial_build(synthetic_paths, generator: str) -> None:
+    # 1商品ずつのチャンクに分けてプロセスプールに渡しても、価格を含めて逐次構築と同じになる
+    records = collect_records(synthetic_paths, 5, seed=42)
+    random.seed(1)
+    serial_reviews, serial_products = build_catalog_documents(
+        records, seed=42, now=NOW, workers=1, chunk_size=1, generator=generator
+    )
+    random.seed(2)
+    parallel_reviews, parallel_products = build_catalog_documents(
+        records, seed=42, now=NOW, workers=3, chunk_size=1, generator=generator
+    )
+    assert review_documents(parallel_reviews) == review_documents(serial_reviews)
+    assert strip_timestamps(parallel_products) == strip_timestamps(serial_products)
+    assert list(parallel_products) == list(serial_products)
@@ -0,0 +1,58 @@
+"""商品名候補の抽出が、パターンごとに走査していた従来の実装と同じ結果になることを確かめる"""
+
+from __future__ import annotations
+
+import re
+from typing import Iterable, List
+
+from review_import import catalog
+from review_import.decoders import ReviewRecord, iter_records
+from review_import.documents import ReviewDocument, build_review_document, extract_product_name_from_reviews
+from review_import.text import product_name_candidates
+
+# 変更前のproduct_name_candidatesをそのまま写したもの
+_REFERENCE_PATTERNS = [
+    re.compile(r"([^。、\s]{2,15}?)(を|が|の)(購入|届いた|使った|使用|試した)"),
+    re.compile(r"([^。、\s]{2,15}?)(の)(レビュー|感想|評価)"),
+]
+
+
+def reference_product_name_candidates(text: str) -> Iterable[str]:
+    for pattern in _REFERENCE_PATTERNS:
+        for match in pattern.findall(text):
+            keyword = match[0] if match[0] else ""
+            if len(keyword) >= 2 and len(keyword) <= 15:
+                yield keyword
+
+
+def review(index: int, content: str) -> ReviewDocument:
+    record = ReviewRecord(f"train_{index:07d}", content, 4, "train")
+    return build_review_document(record, catalog.PRODUCT_CONFIGS[0], index, "positive")
+
+
+def test_overlapping_candidates_are_kept() -> None:
+    text = "イヤホンの評価を購入しました"
+    assert product_name_candidates(text) == ["イヤホンの評価", "イヤホン"]
+    assert product_name_candidates(text) == list(reference_product_name_candidates(text))
+
+
+def test_candidates_follow_pattern_order() -> None:
+    text = "キーボードのレビューです。マウスを購入しました。ケーブルが届いた"
+    assert product_name_candidates(text) == ["マウス", "ケーブル", "キーボード"]
+
+
+def test_extracted_name_uses_overlapping_candidates() -> None:
+    reviews = [review(1, "イヤホンの評価を購入しました"), review(2, "イヤホンの評価を購入しました")]
+    assert extract_product_name_from_reviews(reviews) == "イヤホンの評価"
+
+
+def test_candidates_match_reference_on_dataset(dataset_paths) -> None:
+    mismatches: List[str] = []
+    checked = 0
+    for record in iter_records(dataset_paths):
+        text = str(record.text)
+        if product_name_candidates(text) != list(reference_product_name_candidates(text)):
+            mismatches.append(str(record.id))
+        checked += 1
+    assert checked > 0
+    assert mismatches == [], f"{len(mismatches)}/{checked}件で従来の結果と異なります: {mismatches[:10]}"
@@ -0,0 +1,147 @@
+"""--resume: ジャーナルに記録したバッチを飛ばし、中断した取り込みを重複も欠けもなく再開できることを確かめる"""
+
+from __future__ import annotations
+
+import sys
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List
+
+import pytest
+from pymongo import InsertOne
+
+import import_reviews as importer
+from review_import import catalog
+from review_import.journal import CheckpointJournal, journal_fingerprint, review_insert_batches
+from review_import.mongo import COLLECTION_PRODUCTS, COLLECTION_REVIEWS
+from conftest import parse_import_args
+
+PER_SENTIMENT = 5
+BATCH_SIZE = 4
+TOTAL_REVIEWS = len(catalog.PRODUCT_CONFIGS) * 2 * PER_SENTIMENT
+TOTAL_BATCHES = -(-TOTAL_REVIEWS // BATCH_SIZE)
+INTERRUPT_AFTER = 3
+
+
+def import_argv(data_dir: Path, journal: Path, *extra: str) -> List[str]:
+    return [
+        "--data-dir", str(data_dir), "--journal", str(journal), "--no-cache",
+        "--per-sentiment", str(PER_SENTIMENT), "--batch-size", str(BATCH_SIZE), "--writers", "1",
+        "--max-retries", "0", *extra,
+    ]
+
+
+def run_import(monkeypatch: pytest.MonkeyPatch, argv: List[str]) -> None:
+    monkeypatch.setattr(sys, "argv", ["import_reviews.py", "--mongodb-uri", "mongodb://memory", *argv])
+    importer.main()
+
+
+def watch_insert_batches(collection, interrupt_after: int | None = None, applied: bool = False) -> Dict[str, int]:
+    """挿入バッチのbulk_writeを数え、interrupt_after件を超えたところでKeyboardInterruptを送出する
+
+    appliedなら中断するバッチ自体は書き込まれ、ジャーナルに記録される前に中断したことになる。
+    """
+    original = collection.bulk_write
+    calls = {"inserts": 0}
+
+    def bulk_write(operations, ordered: bool = True):
+        if operations and isinstance(operations[0], InsertOne):
+            calls["inserts"] += 1
+            if interrupt_after is not None and calls["inserts"] > interrupt_after:
+                if applied:
+                    original(operations, ordered=ordered)
+                raise KeyboardInterrupt
+        return original(operations, ordered=ordered)
+
+    collection.bulk_write = bulk_write
+    return calls
+
+
+def review_ids(db) -> Counter:
+    return Counter(str(review["reviewId"]) for review in db[COLLECTION_REVIEWS].find())
+
+
+@pytest.mark.parametrize("applied", [False, True])
+def test_interrupted_import_resumes_without_duplicates_or_gaps(
+    memory_db, synthetic_paths, tmp_path: Path, monkeypatch, applied: bool
+) -> None:
+    data_dir = synthetic_paths["train"].parent
+    journal_path = tmp_path / "journal.json"
+    reviews = memory_db[COLLECTION_REVIEWS]
+    # 置き換え対象の商品の古いレビューと、カタログ外の商品のレビュー
+    reviews.insert_many([
+        {"_id": "old", "productId": catalog.PRODUCT_CONFIGS[0]["id"], "reviewId": "old"},
+        {"_id": "other", "productId": "prod-other", "reviewId": "other"},
+    ])
+
+    watch_insert_batches(reviews, interrupt_after=INTERRUPT_AFTER, applied=applied)
+    with pytest.raises(KeyboardInterrupt):
+        run_import(monkeypatch, import_argv(data_dir, journal_path))
+    assert journal_path.exists()
+    written = review_ids(memory_db)
+    assert sum(written.values()) == 1 + INTERRUPT_AFTER * BATCH_SIZE + (BATCH_SIZE if applied else 0)
+
+    # 再開では削除をやり直さず、ジャーナルに記録されていないバッチだけを送る
+    del reviews.bulk_write
+    resumed = watch_insert_batches(reviews)
+    run_import(monkeypatch, import_argv(data_dir, journal_path, "--resume"))
+    assert resumed["inserts"] == TOTAL_BATCHES - INTERRUPT_AFTER
+    assert not journal_path.exists()
+
+    # 中断せずに取り込んだ場合と同じレビューが1件ずつある
+    resumed_ids = review_ids(memory_db)
+    assert max(resumed_ids.values()) == 1
+    memory_db.clear()
+    run_import(monkeypatch, import_argv(data_dir, tmp_path / "clean.json"))
+    assert set(resumed_ids) == set(review_ids(memory_db)) | {"other"}
+    assert len(memory_db[COLLECTION_PRODUCTS].find()) == len(catalog.PRODUCT_CONFIGS)
+
+
+def test_resume_rejects_journal_from_different_arguments(memory_db, synthetic_paths, tmp_path: Path, monkeypatch) -> None:
+    data_dir = synthetic_paths["train"].parent
+    journal_path = tmp_path / "journal.json"
+    watch_insert_batches(memory_db[COLLECTION_REVIEWS], interrupt_after=2)
+    with pytest.raises(KeyboardInterrupt):
+        run_import(monkeypatch, import_argv(data_dir, journal_path))
+
+    # バッチの区切りが変わると同じ番号のバッチに別のレビューが入るので再開できない
+    argv = import_argv(data_dir, journal_path, "--resume")
+    argv[argv.index("--batch-size") + 1] = str(BATCH_SIZE * 2)
+    with pytest.raises(SystemExit, match="別の条件"):
+        run_import(monkeypatch, argv)
+
+
+def test_fingerprint_depends_on_batching_and_sources(synthetic_paths, monkeypatch) -> None:
+    sources = list(synthetic_paths.values())
+
+    def fingerprint(*argv: str) -> str:
+        args = parse_import_args(monkeypatch, *argv)
+        return journal_fingerprint("insert", args, "mongodb://memory", "review-system", sources)
+
+    assert fingerprint("--batch-size", "4") == fingerprint("--batch-size", "4")
+    assert fingerprint("--batch-size", "4") != fingerprint("--batch-size", "8")
+    assert fingerprint("--seed", "1") != fingerprint("--seed", "2")
+    before = fingerprint()
+    with synthetic_paths["train"].open("a", encoding="utf-8") as f:
+        f.write('{"id": "train_9999999", "text": "追加", "label": 4}\n')
+    assert fingerprint() != before
+
+
+def test_reopened_journal_reproduces_object_ids_and_skips_committed(tmp_path: Path) -> None:
+    path = tmp_path / "journal.json"
+    journal = CheckpointJournal.open(path, "fingerprint", resume=False)
+    documents = [{"reviewId": f"review-{index}"} for index in range(10)]
+    first = list(review_insert_batches([dict(document) for document in documents], 3, journal))
+    journal.commit(0)
+    journal.commit(2)
+
+    reopened = CheckpointJournal.open(path, "fingerprint", resume=True)
+    second = list(review_insert_batches([dict(document) for document in documents], 3, reopened))
+    assert [[operation._doc["_id"] for operation in batch] for _, batch in first] == [
+        [operation._doc["_id"] for operation in batch] for _, batch in second
+    ]
+    assert [reopened.is_committed(sequence) for sequence, _ in second] == [True, False, True, False]
+    assert reopened.state["batchesThrough"] == 1 and reopened.state["batches"] == [2]
+
+    with pytest.raises(SystemExit):
+        CheckpointJournal.open(path, "other", resume=True)
@@ -0,0 +1,133 @@
+"""ReviewCacheが、元データやカタログ・キーワードが変わったときだけ作り直されることを確かめる"""
+
+from __future__ import annotations
+
+import copy
+import json
+import os
+from pathlib import Path
+from typing import Dict, Iterator, List
+
+import pytest
+
+from review_import import catalog
+from review_import.cache import ReviewCache
+
+
+@pytest.fixture
+def cache_dir(synthetic_paths, tmp_path: Path) -> Path:
+    directory = tmp_path / "cache"
+    ReviewCache.build(directory, synthetic_paths).close()
+    return directory
+
+
+@pytest.fixture
+def product_catalog(monkeypatch: pytest.MonkeyPatch) -> Iterator[List[Dict[str, object]]]:
+    """書き換えてよいPRODUCT_CONFIGSの複製。キーワードの照合器もテストの前後で作り直す"""
+    products = copy.deepcopy(catalog.PRODUCT_CONFIGS)
+    monkeypatch.setattr(catalog, "PRODUCT_CONFIGS", products)
+    catalog.reset_keyword_matcher()
+    yield products
+    catalog.reset_keyword_matcher()
+
+
+def reopens(cache_dir: Path, paths: Dict[str, Path]) -> bool:
+    cache = ReviewCache.open(cache_dir, paths)
+    if cache is None:
+        return False
+    cache.close()
+    return True
+
+
+def touch(path: Path, delta_ns: int = 1_000_000_000) -> None:
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + delta_ns))
+
+
+def test_unchanged_sources_reuse_the_cache(cache_dir: Path, synthetic_paths) -> None:
+    cache, rebuilt = ReviewCache.open_or_build(cache_dir, synthetic_paths)
+    try:
+        assert not rebuilt
+        assert len(cache) == sum(len(path.read_text(encoding="utf-8").splitlines()) for path in synthetic_paths.values())
+    finally:
+        cache.close()
+
+
+def test_keyword_change_rebuilds(cache_dir: Path, synthetic_paths, product_catalog) -> None:
+    keyword = "まったく新しいキーワード"
+    product_catalog[0]["keywords"] = [*product_catalog[0]["keywords"], keyword]
+    catalog.reset_keyword_matcher()
+    assert not reopens(cache_dir, synthetic_paths)
+
+    with synthetic_paths["train"].open("a", encoding="utf-8") as f:
+        f.write(json.dumps({"id": "train_9999999", "text": f"{keyword}が良い", "label": 4}, ensure_ascii=False) + "\n")
+    cache, rebuilt = ReviewCache.open_or_build(cache_dir, synthetic_paths)
+    try:
+        assert rebuilt
+        index = next(index for index in range(len(cache)) if cache.dataset_id(index) == "train_9999999")
+        assert cache.matched_product(index) == product_catalog[0]["id"]
+    finally:
+        cache.close()
+    assert reopens(cache_dir, synthetic_paths)
+
+
+def test_catalog_change_rebuilds(cache_dir: Path, synthetic_paths, product_catalog) -> None:
+    product_catalog.append({**copy.deepcopy(product_catalog[0]), "id": "prod-extra", "keywords": ["追加の商品"]})
+    catalog.reset_keyword_matcher()
+    assert not reopens(cache_dir, synthetic_paths)
+    cache, rebuilt = ReviewCache.open_or_build(cache_dir, synthetic_paths)
+    try:
+        assert rebuilt
+        assert cache.product_ids == [product["id"] for product in product_catalog]
+    finally:
+        cache.close()
+
+
+def test_renamed_product_rebuilds(cache_dir: Path, synthetic_paths, product_catalog) -> None:
+    product_catalog[0]["id"] = "prod-renamed"
+    catalog.reset_keyword_matcher()
+    assert not reopens(cache_dir, synthetic_paths)
+
+
+def test_source_size_change_rebuilds(cache_dir: Path, synthetic_paths) -> None:
+    with synthetic_paths["validation"].open("a", encoding="utf-8") as f:
+        f.write(json.dumps({"id": "validation_9999999", "text": "追加", "label": 2}, ensure_ascii=False) + "\n")
+    assert not reopens(cache_dir, synthetic_paths)
+    cache, rebuilt = ReviewCache.open_or_build(cache_dir, synthetic_paths)
+    cache.close()
+    assert rebuilt
+
+
+def test_source_mtime_change_with_new_content_rebuilds(cache_dir: Path, synthetic_paths) -> None:
+    path = synthetic_paths["train"]
+    data = path.read_bytes()
+    # サイズを変えずに内容だけを変える
+    path.write_bytes(data.replace(b'"label": 4', b'"label": 0', 1))
+    assert path.read_bytes() != data
+    touch(path)
+    assert not reopens(cache_dir, synthetic_paths)
+
+
+def test_source_mtime_change_with_same_content_is_refreshed(cache_dir: Path, synthetic_paths) -> None:
+    # 再ダウンロードなどで更新時刻だけが変わった場合は、内容のハッシュが同じなら作り直さない
+    path = synthetic_paths["train"]
+    touch(path)
+    assert reopens(cache_dir, synthetic_paths)
+    manifest = json.loads((cache_dir / ReviewCache.MANIFEST).read_text(encoding="utf-8"))
+    assert manifest["sources"]["train"]["mtime_ns"] == path.stat().st_mtime_ns
+
+
+def test_missing_source_or_manifest_rebuilds(cache_dir: Path, synthetic_paths) -> None:
+    manifest_path = cache_dir / ReviewCache.MANIFEST
+    manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+
+    manifest_path.write_text(json.dumps({**manifest, "version": -1}), encoding="utf-8")
+    assert not reopens(cache_dir, synthetic_paths)
+    manifest_path.write_text("{", encoding="utf-8")
+    assert not reopens(cache_dir, synthetic_paths)
+    manifest_path.write_text(json.dumps(manifest), encoding="utf-8")
+    assert reopens(cache_dir, synthetic_paths)
+
+    assert not reopens(cache_dir, {split: path for split, path in synthetic_paths.items() if split != "test"})
+    synthetic_paths["test"].unlink()
+    assert not reopens(cache_dir, synthetic_paths)
@@ -0,0 +1,166 @@
+"""ReservoirSamplerと、1回の走査で商品ごとの枠と補完用サンプルを確保するcollect_recordsを確かめる"""
+
+from __future__ import annotations
+
+import json
+import random
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List
+
+import pytest
+
+from review_import import catalog, selection
+from review_import.cache import ReviewCache
+from review_import.dataset import dataset_file_paths
+from review_import.selection import ReservoirSampler, collect_records, ensure_records_sufficient
+
+PER_SENTIMENT = 2
+
+
+def test_sampler_keeps_everything_below_capacity() -> None:
+    sampler = ReservoirSampler(5, random.Random(0))
+    for item in range(3):
+        sampler.offer(item)
+    assert sampler.items == [0, 1, 2]
+    assert sampler.seen == 3
+
+
+def test_sampler_memory_is_bounded_by_capacity() -> None:
+    sampler = ReservoirSampler(10, random.Random(0))
+    for item in range(100000):
+        sampler.offer(item)
+        assert len(sampler.items) <= 10
+    assert sampler.seen == 100000
+    assert len(set(sampler.items)) == 10
+
+
+def test_sampler_is_deterministic_for_a_seed() -> None:
+    def sample(seed: str) -> List[int]:
+        sampler = ReservoirSampler(8, random.Random(seed))
+        for item in range(1000):
+            sampler.offer(item)
+        return sampler.drain()
+
+    assert sample("42:positive") == sample("42:positive")
+    assert sample("42:positive") != sample("43:positive")
+
+
+def test_sampler_drain_empties_the_reservoir() -> None:
+    sampler = ReservoirSampler(4, random.Random(0))
+    for item in range(10):
+        sampler.offer(item)
+    drained = sampler.drain()
+    assert len(drained) == 4
+    assert sampler.items == []
+
+
+def test_sampler_is_roughly_uniform() -> None:
+    # 100件から10件を選ぶと、各要素が選ばれる確率は0.1になるはず
+    trials = 4000
+    counts: Counter = Counter()
+    for seed in range(trials):
+        sampler = ReservoirSampler(10, random.Random(seed))
+        for item in range(100):
+            sampler.offer(item)
+        counts.update(sampler.items)
+    frequencies = [counts[item] / trials for item in range(100)]
+    assert all(0.07 < frequency < 0.13 for frequency in frequencies), frequencies
+    # 前半と後半で偏らない
+    assert abs(sum(frequencies[:50]) - sum(frequencies[50:])) < 0.3
+
+
+def write_dataset(data_dir: Path, records: List[Dict[str, object]]) -> Dict[str, Path]:
+    paths = dataset_file_paths(data_dir)
+    data_dir.mkdir(parents=True, exist_ok=True)
+    for split, path in paths.items():
+        rows = records if split == "train" else []
+        path.write_text("".join(json.dumps(row, ensure_ascii=False) + "\n" for row in rows), encoding="utf-8")
+    return paths
+
+
+@pytest.fixture
+def small_dataset(tmp_path: Path) -> Dict[str, object]:
+    """各商品に肯定3件・否定1件がマッチし、否定の不足分は未マッチのレビューで補うデータセット"""
+    records: List[Dict[str, object]] = []
+    matched: Dict[str, Dict[str, List[str]]] = {}
+
+    def add(text: str, label: int) -> str:
+        record_id = f"train_{len(records):07d}"
+        records.append({"id": record_id, "text": text, "label": label, "label_text": str(label)})
+        return record_id
+
+    for product in catalog.PRODUCT_CONFIGS:
+        keyword = product["keywords"][0]
+        matched[product["id"]] = {
+            "positive": [add(f"{keyword}がとても良い。", 4) for _ in range(3)],
+            "negative": [add(f"{keyword}はすぐ壊れた。", 0)],
+        }
+        add(f"{keyword}は普通です。", 2)
+    unmatched = {
+        "positive": [add(f"満足しています{index}。", 3) for index in range(5)],
+        "negative": [add(f"二度と買いません{index}。", 1) for index in range(20)],
+    }
+    return {"paths": write_dataset(tmp_path / "data", records), "matched": matched, "unmatched": unmatched}
+
+
+def expected_backfill(unmatched_ids: List[str], seed: int, sentiment: str) -> List[str]:
+    """補完の順序: 感情ごとのリザーバーをシャッフルし、カタログ順の商品に末尾から割り当てる"""
+    sampler = ReservoirSampler(PER_SENTIMENT * len(catalog.PRODUCT_CONFIGS), random.Random(f"{seed}:{sentiment}"))
+    for record_id in unmatched_ids:
+        sampler.offer(record_id)
+    return sampler.drain()
+
+
+def selected_ids(selected) -> Dict[str, Dict[str, List[str]]]:
+    return {
+        product_id: {sentiment: [str(record.id) for record in records] for sentiment, records in by_sentiment.items()}
+        for product_id, by_sentiment in selected.items()
+    }
+
+
+def test_collect_records_fills_quotas_in_order_and_backfills(small_dataset) -> None:
+    stats: Dict[str, int] = {}
+    selected = selected_ids(collect_records(small_dataset["paths"], PER_SENTIMENT, seed=42, stats=stats))
+
+    pool = expected_backfill(small_dataset["unmatched"]["negative"], 42, "negative")
+    for product in catalog.PRODUCT_CONFIGS:
+        product_id = product["id"]
+        # マッチしたレビューは出現順に先頭から枠を埋める
+        assert selected[product_id]["positive"] == small_dataset["matched"][product_id]["positive"][:PER_SENTIMENT]
+        # 否定は1件しかマッチしないので、残りは補完用のサンプルの末尾から取る
+        assert selected[product_id]["negative"] == small_dataset["matched"][product_id]["negative"] + [pool.pop()]
+    assert stats == {"matched": len(catalog.PRODUCT_CONFIGS) * 3, "backfilled": len(catalog.PRODUCT_CONFIGS)}
+    ensure_records_sufficient(collect_records(small_dataset["paths"], PER_SENTIMENT), PER_SENTIMENT)
+
+
+def test_collect_records_is_deterministic_for_a_seed(small_dataset) -> None:
+    first = selected_ids(collect_records(small_dataset["paths"], PER_SENTIMENT, seed=42))
+    assert selected_ids(collect_records(small_dataset["paths"], PER_SENTIMENT, seed=42)) == first
+    other = selected_ids(collect_records(small_dataset["paths"], PER_SENTIMENT, seed=7))
+    # シードで変わるのは補完分だけ
+    assert other != first
+    for product_id, by_sentiment in first.items():
+        assert other[product_id]["positive"] == by_sentiment["positive"]
+        assert other[product_id]["negative"][0] == by_sentiment["negative"][0]
+
+
+def test_collect_records_reports_shortage(small_dataset) -> None:
+    selected = collect_records(small_dataset["paths"], 10, seed=42)
+    with pytest.raises(RuntimeError, match="十分な件数"):
+        ensure_records_sufficient(selected, 10)
+
+
+@pytest.mark.parametrize("vectorized", [True, False])
+def test_cached_selection_matches_single_pass(small_dataset, tmp_path: Path, monkeypatch, vectorized: bool) -> None:
+    if vectorized and selection.np is None:
+        pytest.skip("numpyがありません")
+    if not vectorized:
+        monkeypatch.setattr(selection, "np", None)
+    paths = small_dataset["paths"]
+    cache = ReviewCache.build(tmp_path / "cache", paths)
+    try:
+        cached = selected_ids(collect_records(paths, PER_SENTIMENT, seed=42, cache=cache))
+    finally:
+        cache.close()
+    assert cached == selected_ids(collect_records(paths, PER_SENTIMENT, seed=42))
@@ -0,0 +1,127 @@
+"""--sync: 内容ハッシュで既存レビューと照合し、変わったものだけを書き込むことを確かめる"""
+
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+from typing import Dict, List
+
+import pytest
+from pymongo import DeleteMany, InsertOne, ReplaceOne, UpdateOne
+
+import import_reviews as importer
+from review_import import catalog
+from review_import.mongo import COLLECTION_REVIEWS
+from review_import.writer import content_hash
+
+PER_SENTIMENT = 5
+
+
+def run_import(monkeypatch: pytest.MonkeyPatch, data_dir: Path, *extra: str) -> None:
+    monkeypatch.setattr(sys, "argv", [
+        "import_reviews.py", "--mongodb-uri", "mongodb://memory", "--data-dir", str(data_dir), "--no-cache",
+        "--per-sentiment", str(PER_SENTIMENT), "--writers", "1", *extra,
+    ])
+    importer.main()
+
+
+def record_operations(collection) -> List[object]:
+    """bulk_writeに渡された操作を記録する"""
+    original = collection.bulk_write
+    operations: List[object] = []
+
+    def bulk_write(batch, ordered: bool = True):
+        batch = list(batch)
+        operations.extend(batch)
+        return original(batch, ordered=ordered)
+
+    collection.bulk_write = bulk_write
+    return operations
+
+
+def reviews_by_dataset_id(db) -> Dict[str, Dict[str, object]]:
+    return {str(review["datasetId"]): review for review in db[COLLECTION_REVIEWS].find()}
+
+
+def without(document: Dict[str, object], *fields: str) -> Dict[str, object]:
+    """実行時刻から決まる作成・更新日時と、指定したフィールドを除く"""
+    return {key: value for key, value in document.items() if key not in ("createdAt", "updatedAt", *fields)}
+
+
+def test_sync_writes_only_changed_and_stale_reviews(memory_db, synthetic_paths, monkeypatch) -> None:
+    data_dir = synthetic_paths["train"].parent
+    run_import(monkeypatch, data_dir, "--sync")
+    imported = reviews_by_dataset_id(memory_db)
+    assert len(imported) == len(catalog.PRODUCT_CONFIGS) * 2 * PER_SENTIMENT
+    assert all(review["contentHash"] == content_hash(review) for review in imported.values())
+
+    reviews = memory_db[COLLECTION_REVIEWS]
+    unchanged_id, changed_id = sorted(imported)[:2]
+    changed = reviews.documents[imported[changed_id]["_id"]]
+    changed["content"] = "手で書き換えた本文"
+    changed["contentHash"] = "0" * 64
+    reviews.insert_many([{
+        "_id": "stale",
+        "productId": catalog.PRODUCT_CONFIGS[0]["id"],
+        "datasetId": "train_9999999",
+        "reviewId": "stale",
+        "contentHash": "stale",
+    }])
+
+    operations = record_operations(reviews)
+    run_import(monkeypatch, data_dir, "--sync")
+
+    # 変わらないレビューには書き込まず、ハッシュの変わったレビューだけを置き換え、選択から外れたレビューを削除する
+    assert [type(operation) for operation in operations] == [ReplaceOne, DeleteMany]
+    assert operations[0]._filter == {"_id": imported[changed_id]["_id"]}
+    assert operations[1]._filter == {"_id": {"$in": ["stale"]}}
+
+    synced = reviews_by_dataset_id(memory_db)
+    assert set(synced) == set(imported)
+    assert synced[unchanged_id] == imported[unchanged_id]
+    # 置き換えたレビューは_idを保ったまま、今回構築した内容になる
+    assert without(synced[changed_id]) == without(imported[changed_id])
+
+    # もう一度同期しても何も書き込まない
+    operations.clear()
+    run_import(monkeypatch, data_dir, "--sync")
+    assert operations == []
+    assert reviews_by_dataset_id(memory_db) == synced
+
+
+def test_sync_inserts_missing_reviews(memory_db, synthetic_paths, monkeypatch) -> None:
+    data_dir = synthetic_paths["train"].parent
+    run_import(monkeypatch, data_dir, "--sync")
+    imported = reviews_by_dataset_id(memory_db)
+    reviews = memory_db[COLLECTION_REVIEWS]
+    missing_id = sorted(imported)[-1]
+    del reviews.documents[imported[missing_id]["_id"]]
+
+    operations = record_operations(reviews)
+    run_import(monkeypatch, data_dir, "--sync")
+    assert [type(operation) for operation in operations] == [InsertOne]
+    synced = reviews_by_dataset_id(memory_db)
+    assert set(synced) == set(imported)
+    assert without(synced[missing_id], "_id") == without(imported[missing_id], "_id")
+
+
+def test_sync_after_plain_import_only_backfills_hashes(memory_db, synthetic_paths, monkeypatch) -> None:
+    # --syncでない投入のレビューは内容ハッシュを持たないが、内容が同じなら置き換えない
+    data_dir = synthetic_paths["train"].parent
+    run_import(monkeypatch, data_dir)
+    imported = reviews_by_dataset_id(memory_db)
+    assert not any("contentHash" in review for review in imported.values())
+
+    operations = record_operations(memory_db[COLLECTION_REVIEWS])
+    run_import(monkeypatch, data_dir, "--sync")
+    assert {type(operation) for operation in operations} == {UpdateOne}
+    assert len(operations) == len(imported)
+    assert all(list(operation._doc["$set"]) == ["contentHash"] for operation in operations)
+    synced = reviews_by_dataset_id(memory_db)
+    for dataset_id, review in synced.items():
+        assert {key: value for key, value in review.items() if key != "contentHash"} == imported[dataset_id]
+        assert review["contentHash"] == content_hash(review)
+
+    operations.clear()
+    run_import(monkeypatch, data_dir, "--sync")
+    assert operations == []
@@ -0,0 +1,94 @@
+"""文分割・タイトル・要約（segment_text）が、置き換え前の実装と同じ結果になることを確かめる"""
+
+from __future__ import annotations
+
+import re
+from typing import List
+
+import pytest
+
+from review_import.decoders import iter_records
+from review_import.text import create_title, segment_text, summarize_text
+
+
+# 置き換え前のcreate_title・split_into_sentences・summarize_textをそのまま写したもの
+def reference_create_title(text: str) -> str:
+    cleaned = text.strip().splitlines()[0] if text.strip() else ""
+    if not cleaned:
+        return "レビュー"
+    first_sentence = re.split(r"[。！？!?\n]", cleaned, maxsplit=1)[0]
+    first_sentence = first_sentence.strip()
+    if not first_sentence:
+        first_sentence = cleaned.strip()
+    return first_sentence[:30] + ("…" if len(first_sentence) > 30 else "")
+
+
+def reference_split_into_sentences(text: str) -> List[str]:
+    sentences: List[str] = []
+    buffer: List[str] = []
+    for char in text:
+        buffer.append(char)
+        if char in ("。", "！", "?", "？", "\n"):
+            sentence = "".join(buffer).strip()
+            buffer.clear()
+            if sentence:
+                sentences.append(sentence)
+    if buffer:
+        tail = "".join(buffer).strip()
+        if tail:
+            sentences.append(tail)
+    return sentences
+
+
+def reference_summarize_text(text: str, max_length: int = 220) -> str:
+    collapsed = re.sub(r"\s+", " ", text).strip()
+    if len(collapsed) <= max_length:
+        return collapsed
+    return collapsed[:max_length].rstrip() + "…"
+
+
+def mismatch(text: str) -> str | None:
+    """置き換え前の実装と異なる項目名を返す（一致すればNone）"""
+    segments = segment_text(text, with_spans=True)
+    if segments.sentences != reference_split_into_sentences(text):
+        return "sentences"
+    if segments.title != reference_create_title(text):
+        return "title"
+    if segments.summary != reference_summarize_text(text):
+        return "summary"
+    if any(text[start:end] != sentence for sentence, (start, end) in zip(segments.sentences, segments.spans)):
+        return "spans"
+    if create_title(text) != segments.title or summarize_text(text) != segments.summary:
+        return "wrappers"
+    return None
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "",
+        "   ",
+        "とても良い。また買いたい！",
+        "!!!。最初が記号\n次の行",
+        "。\n二行目のタイトル",
+        "半角!は文を区切らない?でも全角！は区切る",
+        "改行\r\nCRLF\rCRだけ 行区切り\x85NEL",
+        "　全角スペースで始まる　本文　",
+        "タイトルがとても長いレビューで三十文字を超えると省略記号が付くはずですがどうでしょうか。",
+        "要約 " * 100,
+    ],
+)
+def test_segment_text_matches_reference(text: str) -> None:
+    assert mismatch(text) is None
+
+
+def test_segment_text_matches_reference_on_dataset(dataset_paths) -> None:
+    mismatches: List[str] = []
+    checked = 0
+    for record in iter_records(dataset_paths):
+        field = mismatch(str(record.text))
+        if field is not None:
+            mismatches.append(f"{record.id}({field})")
+        checked += 1
+    assert checked > 0
+    assert mismatches == [], f"{len(mismatches)}/{checked}件で置き換え前の実装と異なります: {mismatches[:10]}"